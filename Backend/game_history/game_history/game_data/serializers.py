@@ -14,3 +14,16 @@ class GameStatSerializer(serializers.ModelSerializer):
     class Meta:
         model = GameStat
         fields = '__all__'
+
+class GameResultSerializer(serializers.Serializer):
+    """
+    Result of a finished game, as sent by the game server.
+    """
+    game_id = serializers.IntegerField()
+    winner_id = serializers.IntegerField()
+    player1_score = serializers.IntegerField(min_value=0)
+    player1_hits = serializers.IntegerField(min_value=0)
+    player2_score = serializers.IntegerField(min_value=0)
+    player2_hits = serializers.IntegerField(min_value=0)
+    longest_rally = serializers.IntegerField(min_value=0)
+    end_time = serializers.DateTimeField()
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import GameHistoryViewSet, GameStatViewSet
+from .views import GameHistoryViewSet, GameStatViewSet, GameResultViewSet
 
 urlpatterns = [
     path(
@@ -44,4 +44,13 @@ urlpatterns = [
         ),
         name="gamestat-detail",
     ),
+    path(
+        "game-results/",
+        GameResultViewSet.as_view(
+            {
+                "post": "create"
+            }
+        ),
+        name="game-results",
+    ),
 ]
@@ -1,8 +1,9 @@
 from rest_framework import viewsets, status
 from .models import GameHistory, GameStat
-from .serializers import GameHistorySerializer, GameStatSerializer
+from .serializers import GameHistorySerializer, GameStatSerializer, GameResultSerializer
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
@@ -113,4 +114,42 @@ class GameStatViewSet(viewsets.ModelViewSet):
         """
         instance = get_object_or_404(self.get_queryset(), pk=pk)
         self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class GameResultViewSet(viewsets.ViewSet):
+    """
+    A viewset the game server saves the results of finished games with.
+    """
+
+    def create(self, request, *args, **kwargs):
+        """
+        Save a batch of game results: {"results": [...]}.
+        Sets the winner and end time of each game and creates or updates its stats, all in one transaction.
+        Saving the same result again changes nothing, so the game server can safely retry a batch.
+        Results of unknown games are skipped and reported in "missing".
+        """
+        results = request.data.get('results') if isinstance(request.data, dict) else None
+        if not isinstance(results, list):
+            return Response({'error': 'results must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = GameResultSerializer(data=results, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        saved, missing = 0, []
+        with transaction.atomic():
+            games = GameHistory.objects.select_for_update().in_bulk([result['game_id'] for result in serializer.validated_data])
+            for result in serializer.validated_data:
+                game = games.get(result['game_id'])
+                if game is None:
+                    missing.append(result['game_id'])
+                    continue
+                game.winner_id = result['winner_id']
+                game.end_time = result['end_time']
+                game.save(update_fields=['winner_id', 'end_time'])
+                GameStat.objects.update_or_create(
+                    game_id=game,
+                    defaults={field: result[field] for field in ('player1_score', 'player1_hits', 'player2_score', 'player2_hits', 'longest_rally')},
+                )
+                saved += 1
+        if missing:
+            logger.warning(f"Results of unknown games {missing} were not saved")
+        return Response({'saved': saved, 'missing': missing}, status=status.HTTP_200_OK)
@@ -225,3 +225,50 @@ def test_delete_game_stat(api_client):
     response = api_client.delete(url)
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert GameStat.objects.count() == 0
+
+@pytest.mark.django_db
+def test_save_game_results(api_client):
+    game = GameHistory.objects.create(player1_id=1, player2_id=2, start_time=now())
+    url = reverse('game-results')
+    data = {'results': [
+        {
+            'game_id': game.game_id,
+            'winner_id': 2,
+            'player1_score': 3,
+            'player2_score': 5,
+            'player1_hits': 9,
+            'player2_hits': 11,
+            'longest_rally': 6,
+            'end_time': '2024-07-03T12:05:00Z'
+        },
+        {
+            'game_id': game.game_id + 1,
+            'winner_id': 1,
+            'player1_score': 5,
+            'player2_score': 0,
+            'player1_hits': 5,
+            'player2_hits': 0,
+            'longest_rally': 1,
+            'end_time': '2024-07-03T12:05:00Z'
+        }
+    ]}
+    response = api_client.post(url, data, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {'saved': 1, 'missing': [game.game_id + 1]}
+    response = api_client.post(url, data, format='json') # saving the same results again must not fail nor duplicate the stats
+    assert response.status_code == status.HTTP_200_OK
+    assert GameStat.objects.count() == 1
+    game.refresh_from_db()
+    assert game.winner_id == 2
+    assert game.end_time.isoformat() == '2024-07-03T12:05:00+00:00'
+    game_stat = GameStat.objects.get(game_id=game)
+    assert game_stat.player2_score == 5
+    assert game_stat.longest_rally == 6
+
+@pytest.mark.django_db
+def test_save_invalid_game_results(api_client):
+    url = reverse('game-results')
+    response = api_client.post(url, {'results': [{'game_id': 1}]}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = api_client.post(url, {'result': []}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -171,57 +171,5 @@ function handleGameEnd(data) {
             <p class="font">${gameHistoryRecord.player1_username}: ${data.player1_hits}</p>
             <p class="font">${gameHistoryRecord.player2_username}: ${data.player2_hits}</p>
             <p class="font">Longest rally: ${data.longest_rally * 0.016}</p>`;
-            if (Number(userData.id) === data.winner){
-                updateGameHistory(data, gameHistoryRecord);
-            }
         });
     }
-
-function updateGameHistory(data, gameHistoryRecord) {
-    fetch(`/game-history/${data.game_id}/`)
-        .then(response => response.json())
-        .then(gameHistoryRecord => {
-            if (gameHistoryRecord.winner_id === data.winner) {
-                console.log(gameHistoryRecord);
-                return;
-            } else {
-                gameHistoryRecord.winner_id = data.winner;
-                return fetch(`/game-history/${data.game_id}/`, {
-                    method: 'PUT',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(gameHistoryRecord)
-                });
-            }
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            const gameStatData = {
-                game_id: data.game_id,
-                player1_score: data.player1_score,
-                player2_score: data.player2_score,
-                player1_hits: data.player1_hits,
-                player2_hits: data.player2_hits,
-                longest_rally: data.longest_rally
-            };
-            return fetch('/game-stat/', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(gameStatData)
-            });
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .catch(error => {
-            console.error('Error:', error);
-        });
-}
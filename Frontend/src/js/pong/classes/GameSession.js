@@ -1,5 +1,5 @@
 // GameSession.js
-import socket from '../socket.js';
+import socket, { STATE_PROTOCOL, CLIENT_FEATURES, ClockSync } from '../socket.js';
 import { initializeEventHandlers, cleanupEventHandlers } from '../eventhandlers.js';
 import { translateCoordinates } from '../utils.js';
 import { clearControls } from '../controls.js';
@@ -7,12 +7,26 @@ import Paddle from './Paddle.js';
 import Ball from './Ball.js';
 import PlayingField from './PlayingField.js';
 import ScoreBoard from './ScoreBoard.js';
-import { LEFT_PADDLE_START, RIGHT_PADDLE_START } from '../constants.js';
+import { LEFT_PADDLE_START, RIGHT_PADDLE_START, WIDTH, HEIGHT, PHYSICS_RATE } from '../constants.js';
 import { endGame } from '../pong.js';
 import { globalState } from '../globalState.js';
 import { sendQuit } from '../eventhandlers.js';
 import { handleTokenVerification } from '../../tokenHandler.js';
 
+// Predicted paddle inputs kept until the server acknowledges them,
+// older ones are forgotten if the server never does (servers without input acknowledgements)
+const MAX_PENDING_INPUTS = 64;
+
+// The ball is rendered this many ms behind the server clock, interpolated between the two
+// buffered states around that time, so frames arriving late or in bursts do not make it stutter
+const INTERPOLATION_DELAY = 100;
+const MAX_BUFFERED_STATES = 32;
+
+// Between two states the ball flies in a straight line from the older one at its velocity
+// (dead reckoning), servers with adaptive broadcast only send a state when that line changes
+// Past the newest state the ball keeps flying for at most this many ms, then waits for the next one
+const MAX_EXTRAPOLATION = 500;
+
 class GameSession {
     constructor() {
         this.gameId = null;
@@ -37,6 +51,11 @@ class GameSession {
         this.inProgress = false;
         this.quit = false;
         this.lastUpdateTime = null;
+        this.inputSeq = 0;
+        this.pendingInputs = [];
+        this.clock = new ClockSync(socket);
+        this.stateBuffer = [];
+        this.goalAnimation = null;
     }
 
     initialize(gameId, localPlayerId, player1Id, player2Id, player1Alias, player2Alias, isRemote, isLocalTournament, scene, onGameEnd) {
@@ -65,6 +84,7 @@ class GameSession {
         if (!this.socket.connected) {
             this.socket.connect();
         }
+        this.clock.start();
         let gameInitData = { 
             'type': null,
             'game_id': gameId,
@@ -74,6 +94,8 @@ class GameSession {
             'is_remote': isRemote,
             'is_local_tournament': isLocalTournament,
             'token': null,
+            'protocol': STATE_PROTOCOL,
+            'features': CLIENT_FEATURES,
         }
 
         if (isRemote === true) {
@@ -105,6 +127,40 @@ class GameSession {
         this.socket.emit('move_paddle', data);
     }
 
+    /**
+     * recordInput - Number a paddle input of the local player that was already applied locally
+     * The input stays pending until a state frame acknowledges its sequence number
+     * @param {number} deltaZ - The paddle delta sent to the server
+     * @returns {number} - The sequence number to send with the input
+     */
+    recordInput(deltaZ) {
+        this.inputSeq += 1;
+        this.pendingInputs.push({ seq: this.inputSeq, deltaZ: deltaZ });
+        if (this.pendingInputs.length > MAX_PENDING_INPUTS) {
+            this.pendingInputs.shift();
+        }
+        return this.inputSeq;
+    }
+
+    /**
+     * reconcileInputs - Re-apply the inputs the server has not processed yet
+     * The local paddle was just moved to the server position, which includes every input
+     * up to the acknowledged sequence number, the newer inputs are predicted on top of it
+     * @param {object} data - The game state from the server
+     */
+    reconcileInputs(data) {
+        const localIsPlayer2 = this.localPlayerId === this.player2Id;
+        const ack = localIsPlayer2 ? data.player2Seq : data.player1Seq;
+        if (ack === undefined) {
+            return;
+        }
+        this.pendingInputs = this.pendingInputs.filter(input => input.seq > ack);
+        const paddle = localIsPlayer2 ? this.rightPaddle : this.leftPaddle;
+        for (const input of this.pendingInputs) {
+            paddle.move(input.deltaZ);
+        }
+    }
+
     handleError(errorMessage) {
         this.leftPaddle.removeFromScene();
         this.rightPaddle.removeFromScene();
@@ -133,7 +189,19 @@ class GameSession {
         const translatedData = translateCoordinates(data);
         this.leftPaddle.updatePosition(translatedData.player1Pos);
         this.rightPaddle.updatePosition(translatedData.player2Pos);
-        this.ball.updatePosition(translatedData.ball);
+        if (this.isRemote) {
+            this.reconcileInputs(data);
+        }
+        if (typeof data.serverTime === 'number') {
+            this.bufferState(data.serverTime, translatedData.ball, data.ballDelta, data.paused);
+        }
+        if (this.goalAnimation !== null && !this.isInterpolating()
+            && data.serverTime >= this.goalAnimation.serverTime + this.goalAnimation.duration) {
+            this.goalAnimation = null; // first frame of the next rally
+        }
+        if (!this.isInterpolating() && this.goalAnimation === null) {
+            this.ball.updatePosition(translatedData.ball);
+        }
         this.ball.dx = data.ballDelta.dx;
         this.ball.dy = data.ballDelta.dy;
         if (data.ballDelta.dx > 0  && globalState.playingFieldMaterial !==  null) {
@@ -199,7 +267,111 @@ class GameSession {
         this.scoreBoard.showCancelText();
     }
 
+    /**
+     * handleGoalAnimation - Start animating the ball through the goal
+     * The server sends no state frames during the animation, the ball moves in a straight line
+     * from ballPosition at ballVelocity (units per second) for duration ms after serverTime
+     * @param {object} data - The goal_animation message
+     */
+    handleGoalAnimation(data) {
+        this.goalAnimation = {
+            serverTime: data.serverTime,
+            receivedAt: performance.now(),
+            x: data.ballPosition.x - WIDTH / 2,
+            y: data.ballPosition.y,
+            z: data.ballPosition.z - HEIGHT / 2,
+            dx: data.ballVelocity.dx,
+            dz: data.ballVelocity.dz,
+            duration: data.duration,
+        };
+    }
+
+    /**
+     * animateGoal - Move the ball along the goal animation
+     * The animation runs on the server clock like the interpolated ball, so it starts when the
+     * rendered ball reaches the goal, or when the message arrived without clock sync
+     * @returns {boolean} - Whether the ball was animated, false before the start and after the end
+     */
+    animateGoal() {
+        const animation = this.goalAnimation;
+        const elapsed = this.clock.offset !== null
+            ? this.clock.serverNow() - INTERPOLATION_DELAY - animation.serverTime
+            : performance.now() - animation.receivedAt;
+        if (elapsed >= animation.duration) {
+            this.goalAnimation = null;
+            return false;
+        }
+        if (elapsed < 0) {
+            return false;
+        }
+        this.ball.updatePosition({
+            x: animation.x + animation.dx * elapsed / 1000,
+            y: animation.y,
+            z: animation.z + animation.dz * elapsed / 1000,
+        });
+        return true;
+    }
+
+    /**
+     * bufferState - Keep a timestamped ball position for interpolation
+     * @param {number} serverTime - Server time of the tick the state was produced on
+     * @param {object} ball - The translated ball position
+     * @param {object} ballDelta - The ball delta of the state, in units per physics frame
+     * @param {boolean} paused - Whether the ball was paused (goal, serve)
+     */
+    bufferState(serverTime, ball, ballDelta, paused) {
+        const last = this.stateBuffer[this.stateBuffer.length - 1];
+        if (last !== undefined && serverTime <= last.serverTime) {
+            return;
+        }
+        const velocity = { dx: ballDelta.dx * PHYSICS_RATE, dz: ballDelta.dz * PHYSICS_RATE };
+        this.stateBuffer.push({ serverTime: serverTime, ball: ball, velocity: velocity, paused: paused });
+        if (this.stateBuffer.length > MAX_BUFFERED_STATES) {
+            this.stateBuffer.shift();
+        }
+    }
+
+    isInterpolating() {
+        return this.clock.offset !== null && this.stateBuffer.length > 0;
+    }
+
+    /**
+     * interpolateBall - Render the ball INTERPOLATION_DELAY ms behind the server clock
+     * The ball moves from the buffered state before the render time at that state's velocity,
+     * until the next state or for MAX_EXTRAPOLATION ms past the newest one
+     * A straight line between the two states would cut the corner of a bounce between them,
+     * which servers with adaptive broadcast leave up to a heartbeat apart
+     * Paused states (goals, ball resets) are shown as they are
+     */
+    interpolateBall() {
+        const renderTime = this.clock.serverNow() - INTERPOLATION_DELAY;
+        const buffer = this.stateBuffer;
+        while (buffer.length >= 2 && buffer[1].serverTime <= renderTime) {
+            buffer.shift();
+        }
+        const from = buffer[0];
+        const to = buffer[1];
+        if (renderTime <= from.serverTime || from.paused || (to !== undefined && to.paused)) {
+            this.ball.updatePosition(from.ball);
+            return;
+        }
+        const until = to !== undefined ? to.serverTime : from.serverTime + MAX_EXTRAPOLATION;
+        const elapsed = (Math.min(renderTime, until) - from.serverTime) / 1000;
+        this.ball.updatePosition({
+            x: from.ball.x + from.velocity.dx * elapsed,
+            y: from.ball.y,
+            z: from.ball.z + from.velocity.dz * elapsed,
+        });
+    }
+
     predictMovement() {
+        if (this.goalAnimation !== null && this.animateGoal()) {
+            return;
+        }
+        if (this.isInterpolating()) {
+            this.interpolateBall();
+            return;
+        }
         if (this.paused === false && this.lastUpdateTime !== null) {
             const predictedBallPosition = this.ball.predictBallPosition(this.lastUpdateTime);
             this.ball.updatePosition(predictedBallPosition);
@@ -218,6 +390,8 @@ class GameSession {
         this.playingField.removeFromScene();
         this.ball.removeFromScene();
         this.scoreBoard.removeFromScene();
+        this.clock.stop();
+        this.goalAnimation = null;
         this.disconnect();
         this.gameId = null
         cleanupEventHandlers();
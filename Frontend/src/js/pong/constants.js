@@ -10,6 +10,7 @@ export const BALL_SIZE_RATIO = 0.01;
 export const BALL_SIZE = 8.0 //Math.min(WIDTH, HEIGHT) * BALL_SIZE_RATIO;
 export const PADDLE_SPEED = 9.0;
 export const BALL_SPEED = 8.0;
+export const PHYSICS_RATE = 60; // physics frames per second of the server, ballDelta is in units per physics frame
 export const PADDLE_THICKNESS = 16;
 export const PADDLE_WIDTH = 100;
 export const LEFT_PADDLE_START = new THREE.Vector3(-(WIDTH / 2) - 8, 0, 0);
@@ -109,7 +109,8 @@ export function remoteGameControls(gameSession) {
             'type': 'move_paddle',
             'game_id': gameSession.gameId,
             'player_id': gameSession.localPlayerId,
-            'delta_z': deltaZ
+            'delta_z': deltaZ,
+            'seq': gameSession.recordInput(deltaZ)
         };
         gameSession.sendMovement(emitData);
     }
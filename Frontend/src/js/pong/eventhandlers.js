@@ -1,4 +1,4 @@
-import socket from './socket';
+import socket, { decodeGameState, DeltaStateDecoder } from './socket';
 import GameSession from './classes/GameSession';
 import ScoreBoard from './classes/ScoreBoard.js';
 import { cleanUpGame, endGame } from './pong.js';
@@ -52,6 +52,42 @@ export const initializeEventHandlers = (gameSession) => {
         }
     });
 
+    // Event handler for the binary game state message (protocol v2)
+    socket.on('send_game_state_v2', (frame) => {
+        try {
+            const data = decodeGameState(frame);
+            if (data && data.gameId === gameSession.gameId) {
+                gameSession.handleGameStateUpdate(data);
+            }
+        } catch (error) {
+            console.error('Error handling send_game_state_v2:', error);
+        }
+    });
+
+    // Event handler for the delta game state message (protocol v3)
+    // A missed frame makes the decoder wait for a keyframe, which is requested once
+    const deltaDecoder = new DeltaStateDecoder();
+    let keyframeRequested = false;
+    socket.on('state_delta', (frame) => {
+        try {
+            if (!frame || frame.g !== gameSession.gameId) {
+                return;
+            }
+            const data = deltaDecoder.apply(frame);
+            if (data === null) {
+                if (!keyframeRequested) {
+                    keyframeRequested = true;
+                    socket.emit('request_keyframe', { 'game_id': gameSession.gameId });
+                }
+                return;
+            }
+            keyframeRequested = false;
+            gameSession.handleGameStateUpdate(data);
+        } catch (error) {
+            console.error('Error handling state_delta:', error);
+        }
+    });
+
     // Event handler for the score message
     socket.on('score', (data) => {
         try {
@@ -65,6 +101,17 @@ export const initializeEventHandlers = (gameSession) => {
         }
     });
 
+    // Event handler for the goal animation message (sent to clients with the goal_animation feature)
+    socket.on('goal_animation', (data) => {
+        try {
+            if (data && data.gameId === gameSession.gameId) {
+                gameSession.handleGoalAnimation(data);
+            }
+        } catch (error) {
+            console.error('Error handling goal_animation:', error);
+        }
+    });
+
     // Event handler for the quit game message
     socket.on('quit_game', (data) => {
         try {
@@ -147,7 +194,10 @@ export const cleanupEventHandlers = () => {
     socket.off('disconnect');
     socket.off('game_start');
     socket.off('send_game_state');
+    socket.off('send_game_state_v2');
+    socket.off('state_delta');
     socket.off('score');
+    socket.off('goal_animation');
     socket.off('game_over');
     socket.off('quit_game');
     socket.off('cancel_game');
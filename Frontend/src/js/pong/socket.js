@@ -1,9 +1,205 @@
 import { io } from 'socket.io-client';
+import { LEFT_PADDLE_START, RIGHT_PADDLE_START, WIDTH } from './constants.js';
 
 // Use the proxy path for local development
 const socket = io('/', {path: '/game-server/socket.io',
+    transports: ['websocket'],  // no long-polling handshake, the production game server only accepts WebSockets
     pingInterval: 10000,  // 10 seconds between pings
     pingTimeout: 5000     // 5 seconds to wait for pong before disconnecting
 });
 
+// State frame protocol requested in the start_game/join_game handshake
+// 1: JSON 'send_game_state' objects, 2: binary 'send_game_state_v2' frames,
+// 3: JSON 'state_delta' frames (keyframes with only the changed fields in between)
+export const PROTOCOL_JSON = 1;
+export const PROTOCOL_BINARY = 2;
+export const PROTOCOL_DELTA = 3;
+export const STATE_PROTOCOL = PROTOCOL_BINARY;
+
+// Optional features requested in the start_game/join_game handshake, see SUPPORTED_FEATURES in Game_server/protocol.py
+// goal_animation: one 'goal_animation' event per goal instead of state frames while the ball flies through the goal
+export const CLIENT_FEATURES = ['goal_animation'];
+
+// Binary state frame layout, must match STATE_FRAME in Game_server/protocol.py
+const STATE_FRAME_SIZE = 24;
+const SERVER_TIME_SIZE = 8; // optional f64 server time of the tick after the frame
+const INPUT_ACK_SIZE = 8;   // optional player1/player2 input sequence numbers after the server time
+const POSITION_SCALE = 8;
+const DELTA_SCALE = 256;
+const HITPOS_SCALE = 10000;
+const FLAG_BOUNCE = 0x01;
+const FLAG_PAUSED = 0x02;
+const FLAG_SERVER_TIME = 0x04;
+const FLAG_INPUT_ACK = 0x08;
+
+// Clock synchronization with the game server (clock_ping in Game_server/server.py)
+const CLOCK_SYNC_INTERVAL = 2000;   // ms between two clock pings
+const CLOCK_SYNC_SAMPLES = 8;       // round trips the offset is estimated from
+
+/**
+ * decodeGameState - Decode a binary 'send_game_state_v2' frame
+ * The result has the same shape as the JSON 'send_game_state' object,
+ * so it can be passed to GameSession.handleGameStateUpdate as is
+ * @param {ArrayBuffer|Uint8Array} frame - The binary frame from the server
+ * @returns {object|null} - The decoded game state, or null if the frame is invalid
+ */
+export function decodeGameState(frame) {
+    const bytes = frame instanceof ArrayBuffer ? new Uint8Array(frame) : frame;
+    if (!bytes || bytes.byteLength < STATE_FRAME_SIZE || bytes[0] !== PROTOCOL_BINARY) {
+        return null;
+    }
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const flags = view.getUint8(1);
+    const state = {
+        type: 'send_game_state',
+        gameId: view.getUint32(2, true),
+        tick: view.getUint32(6, true),
+        ballPosition: {
+            x: view.getInt16(10, true) / POSITION_SCALE,
+            y: 0,
+            z: view.getInt16(12, true) / POSITION_SCALE,
+        },
+        ballDelta: {
+            dx: view.getInt16(14, true) / DELTA_SCALE,
+            dz: view.getInt16(16, true) / DELTA_SCALE,
+        },
+        player1Pos: {
+            x: LEFT_PADDLE_START.x + WIDTH / 2,
+            z: view.getInt16(18, true) / POSITION_SCALE,
+        },
+        player2Pos: {
+            x: RIGHT_PADDLE_START.x + WIDTH / 2,
+            z: view.getInt16(20, true) / POSITION_SCALE,
+        },
+        bounce: (flags & FLAG_BOUNCE) !== 0,
+        hitpos: view.getUint16(22, true) / HITPOS_SCALE,
+        paused: (flags & FLAG_PAUSED) !== 0,
+    };
+    let offset = STATE_FRAME_SIZE;
+    if ((flags & FLAG_SERVER_TIME) !== 0 && bytes.byteLength >= offset + SERVER_TIME_SIZE) {
+        state.serverTime = view.getFloat64(offset, true);
+        offset += SERVER_TIME_SIZE;
+    }
+    if ((flags & FLAG_INPUT_ACK) !== 0 && bytes.byteLength >= offset + INPUT_ACK_SIZE) {
+        state.player1Seq = view.getUint32(offset, true);
+        state.player2Seq = view.getUint32(offset + 4, true);
+    }
+    return state;
+}
+
+/**
+ * DeltaStateDecoder - Rebuilds game states from 'state_delta' frames
+ * Keyframes ('k') carry every field, delta frames only the fields that changed,
+ * field names must match delta_fields in Game_server/protocol.py
+ * A frame that does not follow the previous sequence number means a frame was missed,
+ * the decoder then waits for a keyframe and apply() returns null
+ */
+export class DeltaStateDecoder {
+    constructor() {
+        this.reset();
+    }
+
+    reset() {
+        this.fields = null;
+        this.seq = null;
+    }
+
+    /**
+     * apply - Apply a frame to the decoded state
+     * @param {object} frame - The 'state_delta' frame from the server
+     * @returns {object|null} - The full game state in the 'send_game_state' shape,
+     * or null if the frame could not be applied and a keyframe is needed
+     */
+    apply(frame) {
+        if (frame.k === true) {
+            this.fields = { ...frame };
+        } else if (this.fields !== null && frame.s === this.seq + 1) {
+            Object.assign(this.fields, frame);
+        } else {
+            this.fields = null;
+            return null;
+        }
+        this.seq = frame.s;
+        return this.toGameState();
+    }
+
+    toGameState() {
+        const f = this.fields;
+        const state = {
+            type: 'send_game_state',
+            gameId: f.g,
+            tick: f.t,
+            serverTime: f.ts,
+            ballPosition: { x: f.bx, y: 0, z: f.bz },
+            ballDelta: { dx: f.dx, dz: f.dz },
+            player1Pos: { x: LEFT_PADDLE_START.x + WIDTH / 2, z: f.p1 },
+            player2Pos: { x: RIGHT_PADDLE_START.x + WIDTH / 2, z: f.p2 },
+            bounce: f.b,
+            hitpos: f.h,
+            paused: f.p,
+        };
+        if (f.a1 !== undefined) {
+            state.player1Seq = f.a1;
+            state.player2Seq = f.a2;
+        }
+        return state;
+    }
+}
+
+/**
+ * ClockSync - Estimates the offset between the local clock and the game server clock
+ * Sends 'clock_ping' with the local time every CLOCK_SYNC_INTERVAL ms, the server answers
+ * with 'clock_pong' and its own time. The server time was read about half a round trip
+ * before the pong arrived, the sample with the shortest round trip has the smallest error
+ */
+export class ClockSync {
+    constructor(socket) {
+        this.socket = socket;
+        this.samples = [];
+        this.offset = null;
+        this.timer = null;
+        this.pongHandler = (data) => this.handlePong(data);
+    }
+
+    start() {
+        this.socket.on('clock_pong', this.pongHandler);
+        this.ping();
+        this.timer = setInterval(() => this.ping(), CLOCK_SYNC_INTERVAL);
+    }
+
+    stop() {
+        clearInterval(this.timer);
+        this.timer = null;
+        this.socket.off('clock_pong', this.pongHandler);
+    }
+
+    ping() {
+        if (this.socket.connected) {
+            this.socket.emit('clock_ping', { 'clientTime': performance.now() });
+        }
+    }
+
+    handlePong(data) {
+        if (!data || typeof data.clientTime !== 'number' || typeof data.serverTime !== 'number') {
+            return;
+        }
+        const now = performance.now();
+        const roundTrip = now - data.clientTime;
+        this.samples.push({ roundTrip: roundTrip, offset: data.serverTime + roundTrip / 2 - now });
+        if (this.samples.length > CLOCK_SYNC_SAMPLES) {
+            this.samples.shift();
+        }
+        const best = this.samples.reduce((a, b) => (b.roundTrip < a.roundTrip ? b : a));
+        this.offset = best.offset;
+    }
+
+    /**
+     * serverNow - The current time on the server clock
+     * @returns {number|null} - Server time in ms, or null before the first pong
+     */
+    serverNow() {
+        return this.offset === null ? null : performance.now() + this.offset;
+    }
+}
+
 export default socket;
@@ -0,0 +1,98 @@
+# bench_batch_physics.py
+# Compares stepping rallies with the entity classes (one game at a time) against
+# BatchPhysics (every game in one vectorized step) for 1, 100 and 10,000 games
+# 'batch' is the vectorized step alone, 'batch+store' also copies the results back into
+# the entities like PongGame.finish_rally_tick does before sending the state
+# Usage: python benchmarks/bench_batch_physics.py [--ticks N] [--games 1,100,10000]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from game_logic.batch_physics import BatchPhysics
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+
+
+def make_games(count):
+    rng = random.Random(count)
+    games = []
+    for game_id in range(count):
+        ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, rng.uniform(-40, 40))
+        game_state = GameState(game_id, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X),
+                               ball)
+        game_state.ball.position = rng.uniform(100, 700), 0, rng.uniform(50, 550)
+        games.append(game_state)
+    return games
+
+
+# serve_if_scored function
+# Keeps every game in a rally: a ball that left the field is put back in the middle
+def serve_if_scored(game_state):
+    if game_state.paused:
+        game_state.paused = False
+        game_state.ball.position = BALL_DEFAULT_X, 0, BALL_DEFAULT_Z
+        return True
+    return False
+
+
+def run_scalar(games, ticks):
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for game_state in games:
+            game_state.current_rally += 1
+            game_state.ball.update_position()
+            game_state.handle_collisions()
+            game_state.current_rally += 1
+            if game_state.check_goal():
+                game_state.paused = True
+            serve_if_scored(game_state)
+    return time.perf_counter() - start
+
+
+def run_batch(games, ticks, store):
+    engine = BatchPhysics()
+    slots = [engine.add(game_state) for game_state in games]
+    for slot, game_state in zip(slots, games):
+        engine.load(slot, game_state)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for slot, game_state in zip(slots, games):
+            engine.queue(slot, game_state.player1.paddle.z, game_state.player2.paddle.z)
+        engine.step()
+        if store:
+            for slot, game_state in zip(slots, games):
+                engine.store(slot, game_state)
+                if serve_if_scored(game_state):
+                    engine.load(slot, game_state)
+        else:
+            scored = engine.goal != 0
+            engine.x[scored] = BALL_DEFAULT_X
+            engine.z[scored] = BALL_DEFAULT_Z
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--games', default='1,100,10000')
+    args = parser.parse_args()
+
+    print(f"{'games':>7} {'entities':>14} {'batch':>14} {'batch+store':>14} {'speedup':>9}")
+    for count in (int(value) for value in args.games.split(',')):
+        ticks = max(5, args.ticks if count <= 100 else args.ticks // 10)
+        scalar = run_scalar(make_games(count), ticks) / ticks
+        batch = run_batch(make_games(count), ticks, store=False) / ticks
+        stored = run_batch(make_games(count), ticks, store=True) / ticks
+        print(f"{count:>7} {scalar * 1e6:>11.1f} us {batch * 1e6:>11.1f} us "
+              f"{stored * 1e6:>11.1f} us {scalar / batch:>8.1f}x")
+    print("times are per tick for all games together")
+
+
+if __name__ == '__main__':
+    main()
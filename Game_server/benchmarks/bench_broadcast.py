@@ -0,0 +1,95 @@
+# bench_broadcast.py
+# Compares sending one game state frame to every recipient with one emit per sid
+# (the old PongGame behaviour) against a single emit to the game's room
+# A real socketio.AsyncServer is used, only the Engine.IO transport is replaced by
+# a fake that counts packets and optionally simulates a slow write per recipient
+# Usage: python benchmarks/bench_broadcast.py [--frames N] [--send-delay-ms MS]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import socketio
+from server_utils import game_room
+
+RECIPIENT_COUNTS = (2, 10, 100)
+
+GAME_STATE = {
+    'type': 'send_game_state',
+    'gameId': 42,
+    'ballPosition': {'x': 412.3456789, 'y': 0, 'z': 287.123456789},
+    'ballDelta': {'dx': 7.98765432, 'dz': -0.55512345},
+    'player1Pos': {'x': -8.0, 'z': 300.0},
+    'player2Pos': {'x': 808.0, 'z': 312.0},
+    'bounce': False,
+    'hitpos': 0.0,
+    'paused': False,
+}
+
+
+# FakeTransport class
+# Replaces Engine.IO's send_packet, counts sent packets and bytes
+class FakeTransport:
+    def __init__(self, send_delay):
+        self.send_delay = send_delay
+        self.packets = 0
+        self.bytes = 0
+
+    async def send_packet(self, eio_sid, pkt):
+        self.packets += 1
+        self.bytes += len(pkt.encode())
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+
+
+async def make_server(recipients, send_delay):
+    sio = socketio.AsyncServer(async_mode='asgi')
+    transport = FakeTransport(send_delay)
+    sio.eio.send_packet = transport.send_packet
+    room = game_room(42)
+    sids = []
+    for i in range(recipients):
+        sid = await sio.manager.connect(f'eio{i}', '/')
+        await sio.enter_room(sid, room)
+        sids.append(sid)
+    return sio, transport, room, sids
+
+
+async def per_sid_emits(sio, room, sids):
+    for sid in sids:
+        await sio.emit('send_game_state', GAME_STATE, room=sid)
+
+
+async def room_emit(sio, room, sids):
+    await sio.emit('send_game_state', GAME_STATE, room=room)
+
+
+async def measure(strategy, recipients, frames, send_delay):
+    sio, transport, room, sids = await make_server(recipients, send_delay)
+    start = time.perf_counter()
+    for _ in range(frames):
+        await strategy(sio, room, sids)
+    elapsed = time.perf_counter() - start
+    assert transport.packets == recipients * frames
+    return elapsed / frames
+
+
+async def main(frames, send_delay):
+    print(f"{'recipients':>10} {'per-sid us/frame':>18} {'room us/frame':>15} {'speedup':>8}")
+    for recipients in RECIPIENT_COUNTS:
+        per_sid = await measure(per_sid_emits, recipients, frames, send_delay)
+        room = await measure(room_emit, recipients, frames, send_delay)
+        print(f"{recipients:>10} {per_sid * 1e6:>18.1f} {room * 1e6:>15.1f} "
+              f"{per_sid / room:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-sid vs room broadcast benchmark')
+    parser.add_argument('--frames', type=int, default=500, help='frames sent per measurement')
+    parser.add_argument('--send-delay-ms', type=float, default=0.0,
+                        help='simulated write time per recipient in milliseconds')
+    args = parser.parse_args()
+    asyncio.run(main(args.frames, args.send_delay_ms / 1000))
@@ -0,0 +1,82 @@
+# bench_entities.py
+# Measures the game_logic entities: memory per game and time per rally tick
+# Memory is the traced allocation of building one GameState (players, paddles, ball, positions)
+# A rally tick is what PongGame.update_game_state does: move the ball, handle collisions,
+# check goals
+# 'bounce tick' forces a paddle bounce every tick to time the bounce_from_paddle path
+# Usage: python benchmarks/bench_entities.py [--games N] [--ticks N]
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+
+
+def make_game(game_id):
+    ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, 30)
+    return GameState(game_id, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X), ball)
+
+
+def memory_per_game(games):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = [make_game(game_id) for game_id in range(games)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # the list holding the games is not part of a game
+    allocated -= sys.getsizeof(instances)
+    return allocated / games
+
+
+def rally_tick(game_state):
+    game_state.current_rally += 1
+    game_state.ball.update_position()
+    game_state.handle_collisions()
+    game_state.current_rally += 1
+    if game_state.check_goal():
+        game_state.ball.position = BALL_DEFAULT_X, 0, BALL_DEFAULT_Z
+
+
+def ns_per_tick(games, ticks):
+    instances = [make_game(game_id) for game_id in range(games)]
+    start = time.perf_counter_ns()
+    for _ in range(ticks):
+        for game_state in instances:
+            rally_tick(game_state)
+    return (time.perf_counter_ns() - start) / (games * ticks)
+
+
+def ns_per_bounce(bounces):
+    game_state = make_game(0)
+    ball = game_state.ball
+    paddle = game_state.player1.paddle
+    start = time.perf_counter_ns()
+    for bounce in range(bounces):
+        ball.direction = 150 + bounce % 60
+        ball.speed = BALL_SPEED
+        ball.position = PADDLE_DEPTH, 0, paddle.z + (bounce % 90) - 45
+        ball.bounce_from_paddle(paddle)
+    return (time.perf_counter_ns() - start) / bounces
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"memory per game: {memory_per_game(args.games):8.0f} bytes")
+    print(f"rally tick:      {ns_per_tick(args.games, args.ticks):8.0f} ns per game")
+    print(f"paddle bounce:   {ns_per_bounce(args.games * 10):8.0f} ns per bounce")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# bench_json_codec.py
+# Encode throughput of real send_game_state frames with the json module and with orjson
+# (json_codec.py), with every digit of the coordinates and rounded to --precision decimals
+# The frames are captured from a PongGame playing --frames ticks, then each setup encodes all of
+# them as Socket.IO event packets, the way the server does it before sending
+# Rounding is done where the server does it, while building the frame, its cost is printed on its
+# own
+# 'dumps' is the codec alone, 'Packet' the whole encode of socketio's default packet class (binary
+# check, header, dumps) and 'JsonPacket' the same with the server's packet class
+# Usage: python benchmarks/bench_json_codec.py [--frames N] [--repeat N] [--precision D]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# frames are captured with every digit, the setups round them themselves
+os.environ['JSON_FLOAT_PRECISION'] = '-1'
+
+from socketio import packet
+import server
+from json_codec import OrjsonCodec, JsonPacket, orjson, float_rounder
+
+
+# capture_frames function
+# Plays a game without clients and returns the send_game_state frames it emitted
+def capture_frames(count):
+    frames = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        if event == 'send_game_state':
+            frames.append(data)
+
+    async def no_room(*args, **kwargs):
+        pass
+
+    server.sio.emit = emit
+    server.sio.enter_room = server.sio.leave_room = server.sio.close_room = no_room
+
+    async def play():
+        game = server.PongGame(42, 1, 2, False)
+        await game.add_player('player', 1)
+        game.start_rally()
+        while len(frames) < count and game.game_state.in_progress:
+            await game.tick()
+
+    asyncio.run(play())
+    return frames[:count]
+
+
+# rounded function
+# Returns a copy of the frame with the coordinates send_game_state_to_client rounds
+def rounded(frame, json_float):
+    return {
+        **frame,
+        'ballPosition': {'x': json_float(frame['ballPosition']['x']),
+                         'y': frame['ballPosition']['y'],
+                         'z': json_float(frame['ballPosition']['z'])},
+        'ballDelta': {'dx': json_float(frame['ballDelta']['dx']),
+                      'dz': json_float(frame['ballDelta']['dz'])},
+        'player1Pos': {'x': frame['player1Pos']['x'], 'z': json_float(frame['player1Pos']['z'])},
+        'player2Pos': {'x': frame['player2Pos']['x'], 'z': json_float(frame['player2Pos']['z'])},
+        'hitpos': json_float(frame['hitpos']),
+    }
+
+
+# measure function
+# Encodes every frame 'repeat' times, returns the us per frame of the codec's dumps alone,
+# of the packet encode with each packet class, and the bytes per packet
+def measure(codec, frames, repeat):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            codec.dumps(['send_game_state', frame], separators=(',', ':'))
+    results.append(time.perf_counter() - start)
+    for packet_class in (packet.Packet, JsonPacket):
+        packet_class.json = codec
+        size = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                pkt = packet_class(packet.EVENT, namespace='/', data=['send_game_state', frame])
+                size += len(pkt.encode())
+        results.append(time.perf_counter() - start)
+    count = len(frames) * repeat
+    return [elapsed / count * 1e6 for elapsed in results] + [size / count]
+
+
+# rounding_cost function
+# Returns the us per frame spent rounding its coordinates while it is built
+def rounding_cost(frames, repeat, json_float):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            ball, delta = frame['ballPosition'], frame['ballDelta']
+            json_float(ball['x']), json_float(ball['z'])
+            json_float(delta['dx']), json_float(delta['dz'])
+            json_float(frame['player1Pos']['z']), json_float(frame['player2Pos']['z'])
+            json_float(frame['hitpos'])
+    return (time.perf_counter() - start) / (len(frames) * repeat) * 1e6
+
+
+def main(frame_count, repeat, precision):
+    frames = capture_frames(frame_count)
+    json_float = float_rounder(precision)
+    rounded_frames = [rounded(frame, json_float) for frame in frames]
+    codecs = [('json', json)]
+    if orjson is not None:
+        codecs.append(('orjson', OrjsonCodec))
+    else:
+        print("orjson is not installed, only the json module is measured")
+    cost = rounding_cost(frames, repeat, json_float)
+    print(f"{len(frames)} send_game_state frames, encoded {repeat} times, "
+          f"rounding {precision} decimals while building a frame takes {cost:.2f} us")
+    print(f"{'codec':>8} {'coordinates':>12} {'dumps us':>9} {'Packet us':>10} "
+          f"{'JsonPacket us':>14} {'JsonPackets/s':>14} {'bytes':>6}")
+    for name, codec in codecs:
+        for label, setup_frames in (('all digits', frames),
+                                    (f'{precision} decimals', rounded_frames)):
+            dumps_us, packet_us, json_packet_us, size = measure(codec, setup_frames, repeat)
+            print(f"{name:>8} {label:>12} {dumps_us:>9.2f} {packet_us:>10.2f} "
+                  f"{json_packet_us:>14.2f} {1e6 / json_packet_us:>14.0f} {size:>6.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='send_game_state encode throughput per JSON codec')
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--precision', type=int, default=3)
+    args = parser.parse_args()
+    main(args.frames, args.repeat, args.precision)
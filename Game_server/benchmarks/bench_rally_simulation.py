@@ -0,0 +1,95 @@
+# bench_rally_simulation.py
+# Per-game physics cost of a long rally with the three rally modes:
+#   - discrete: Ball.update_position + GameState.handle_collisions every tick (default at 60 Hz)
+#   - swept: GameState.advance every tick (SWEPT_COLLISIONS)
+#   - events: RallySimulation, work only at wall/paddle events and when the state is synced
+#     for a broadcast
+# Paddles cover the whole field side, so every ball is returned and the ball speeds up on every hit
+# like in a real rally; rallies are restarted every RALLY_TICKS ticks
+# Usage: python benchmarks/bench_rally_simulation.py [--rallies N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from game_logic.rally_simulation import RallySimulation
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+
+RALLY_TICKS = 1200      # 20 seconds at 60 Hz
+FULL_WIDTH = FIELD_WIDTH * 2
+
+
+def make_state():
+    ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, 20)
+    game_state = GameState(1, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X), ball)
+    game_state.player1.paddle._width = game_state.player2.paddle._width = FULL_WIDTH
+    return game_state
+
+
+def run_discrete(rallies):
+    elapsed = 0
+    for _ in range(rallies):
+        game_state = make_state()
+        start = time.perf_counter_ns()
+        for _ in range(RALLY_TICKS):
+            game_state.ball.update_position()
+            game_state.handle_collisions()
+            game_state.check_goal()
+        elapsed += time.perf_counter_ns() - start
+    return elapsed / (rallies * RALLY_TICKS)
+
+
+def run_swept(rallies):
+    elapsed = 0
+    for _ in range(rallies):
+        game_state = make_state()
+        start = time.perf_counter_ns()
+        for _ in range(RALLY_TICKS):
+            game_state.advance(1.0)
+            game_state.check_goal()
+        elapsed += time.perf_counter_ns() - start
+    return elapsed / (rallies * RALLY_TICKS)
+
+
+def run_events(rallies, sync_every):
+    elapsed = 0
+    for _ in range(rallies):
+        game_state = make_state()
+        simulation = RallySimulation(game_state)
+        start = time.perf_counter_ns()
+        for tick in range(1, RALLY_TICKS + 1):
+            if simulation.advance_to(tick) or tick % sync_every == 0:
+                simulation.sync(tick)
+        elapsed += time.perf_counter_ns() - start
+    return elapsed / (rallies * RALLY_TICKS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rallies', type=int, default=100)
+    args = parser.parse_args()
+
+    # the hit tests use PADDLE_WIDTH, widen it so the full width paddles return every ball
+    import game_logic.entities.ball as ball
+    import game_logic.entities.gamestate as gamestate
+    import game_logic.rally_simulation as rally_simulation
+    ball.PADDLE_WIDTH = gamestate.PADDLE_WIDTH = rally_simulation.PADDLE_WIDTH = FULL_WIDTH
+
+    print(f"{'mode':<28} {'ns per tick':>12}")
+    print(f"{'discrete':<28} {run_discrete(args.rallies):>12.0f}")
+    print(f"{'swept':<28} {run_swept(args.rallies):>12.0f}")
+    for sync_every in (1, 2, 6, 1000000):
+        if sync_every == 1000000:
+            label = 'events, no broadcast'
+        else:
+            label = f'events, sync every {sync_every} ticks'
+        print(f"{label:<28} {run_events(args.rallies, sync_every):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
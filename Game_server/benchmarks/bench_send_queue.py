@@ -0,0 +1,110 @@
+# bench_send_queue.py
+# Shows what a client on a bad network gets with and without the bounded send queues
+# (send_queue.py)
+# A real socketio.AsyncServer emits a state frame to a room at 60 Hz, plus a score every second
+# Engine.IO sockets are replaced by fakes with the same queue and a writer task that takes
+# --send-delay-ms per packet for the slow session (the first one) and no time for the others
+# Per setup it prints the time spent in emit per frame, and for the slow session how many frames
+# it got, how many ticks old its last frame was, the backlog left behind and how many scores it got
+# (scores are never dropped, the missing ones are still in the backlog)
+# Usage: python benchmarks/bench_send_queue.py [--seconds S] [--send-delay-ms MS] [--sessions N]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import socketio
+from send_queue import SEND_QUEUE_SIZE, install_send_queues
+
+TICK_RATE = 60
+
+
+# FakeSocket class
+# Engine.IO socket stand-in: an unbounded queue emptied by a writer task, like AsyncSocket's
+class FakeSocket:
+    def __init__(self, send_delay):
+        self.queue = asyncio.Queue()
+        self.closed = False
+        self.send_delay = send_delay
+        self.received = []
+        self.writer = asyncio.create_task(self.write())
+
+    async def write(self):
+        while True:
+            pkt = await self.queue.get()
+            self.queue.task_done()
+            if self.send_delay:
+                await asyncio.sleep(self.send_delay)
+            self.received.append(pkt.data)
+
+
+async def run_setup(sessions, send_delay, seconds, queue_size):
+    sio = socketio.AsyncServer(async_mode='asgi')
+    sockets = {}
+
+    async def send_packet(eio_sid, pkt):
+        await sockets[eio_sid].queue.put(pkt)
+    sio.eio.sockets = sockets
+    sio.eio.send_packet = send_packet
+    queues = install_send_queues(sio, queue_size) if queue_size else None
+    for index in range(sessions):
+        eio_sid = f'eio{index}'
+        sockets[eio_sid] = FakeSocket(send_delay if index == 0 else 0.0)
+        sid = await sio.manager.connect(eio_sid, '/')
+        await sio.enter_room(sid, 'game')
+
+    ticks = int(seconds * TICK_RATE)
+    emit_time = 0.0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    for tick in range(1, ticks + 1):
+        start = time.perf_counter()
+        await sio.emit('send_game_state', {'tick': tick}, room='game')
+        if tick % TICK_RATE == 0:
+            await sio.emit('score', {'tick': tick}, room='game')
+        emit_time += time.perf_counter() - start
+        deadline += 1.0 / TICK_RATE
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    slow = sockets['eio0']
+    frames = [data for data in slow.received if data.startswith('2["send_game_state"')]
+    last_tick = int(frames[-1].split('"tick":')[1].rstrip('}]')) if frames else 0
+    scores = sum(1 for data in slow.received if data.startswith('2["score"'))
+    backlog = slow.queue.qsize()
+    if queues is not None:
+        backlog += len(queues.queues.get('eio0', ()))
+    for socket in sockets.values():
+        socket.writer.cancel()
+    return {
+        'emit_us': emit_time / ticks * 1e6,
+        'frames': len(frames),
+        'behind': ticks - last_tick,
+        'backlog': backlog,
+        'scores': f"{scores}/{ticks // TICK_RATE}",
+    }
+
+
+async def main(seconds, send_delay, sessions, queue_size):
+    print(f"{sessions} sessions, one of them takes {send_delay * 1000:.0f} ms per packet, "
+          f"{seconds:.0f} s at {TICK_RATE} Hz")
+    print(f"{'setup':>16} {'emit us/frame':>14} {'slow frames':>12} {'ticks behind':>13} "
+          f"{'backlog':>8} {'scores got':>11}")
+    for name, size in (('unbounded', 0), (f'queue of {queue_size}', queue_size)):
+        result = await run_setup(sessions, send_delay, seconds, size)
+        print(f"{name:>16} {result['emit_us']:>14.1f} {result['frames']:>12} "
+              f"{result['behind']:>13} {result['backlog']:>8} {result['scores']:>11}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Bounded send queues vs unbounded Engine.IO queues')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--send-delay-ms', type=float, default=50.0,
+                        help='write time per packet of the slow session')
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--queue-size', type=int, default=SEND_QUEUE_SIZE or 8)
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.send_delay_ms / 1000, args.sessions, args.queue_size))
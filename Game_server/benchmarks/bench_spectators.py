@@ -0,0 +1,156 @@
+# bench_spectators.py
+# Measures what 1,000 spectators cost the players of the games they watch
+# Real PongGame instances tick at TICK_RATE on a real socketio.AsyncServer, only the Engine.IO
+# sockets are replaced by fakes with the same queue and a writer task that takes every packet
+# The spectators are spread evenly over the games and watch with the same protocol as the players
+# Every setup runs the same games, without spectators and with them, on socketio's stock
+# AsyncManager (a task per recipient) and on FanOutManager (see fan_out.py)
+# Per setup it prints the time of a game tick (what the players wait for), how late the ticks
+# started (the fan-out also keeps the event loop busy between ticks), the packets sent per second
+# to players and spectators, and how many times a frame was encoded per second
+# Usage: python benchmarks/bench_spectators.py [--games N] [--spectators N] [--seconds S]
+#                                              [--protocol 1|2]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import socketio
+from socketio import packet
+import server
+import server_utils
+from fan_out import FanOutManager
+from protocol import PROTOCOL_JSON
+from tick_scheduler import TICK_RATE
+
+
+# FakeSocket class
+# Engine.IO socket stand-in: an unbounded queue emptied by a writer task, like AsyncSocket's
+class FakeSocket:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.closed = False
+        self.packets = 0
+        self.writer = asyncio.create_task(self.write())
+
+    async def write(self):
+        while True:
+            await self.queue.get()
+            self.queue.task_done()
+            self.packets += 1
+
+
+# count_encodes function
+# Wraps the Socket.IO packet encoder, returns the list holding the number of encoded packets
+def count_encodes():
+    encodes = [0]
+    encode = packet.Packet.encode
+
+    def counted_encode(self):
+        encodes[0] += 1
+        return encode(self)
+    packet.Packet.encode = counted_encode
+    return encodes
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_setup(manager, games, spectators, seconds, protocol, encodes):
+    sio = socketio.AsyncServer(async_mode='asgi', client_manager=manager)
+    sockets = {}
+
+    async def send_packet(eio_sid, pkt):
+        await sockets[eio_sid].queue.put(pkt)
+    sio.eio.sockets = sockets
+    sio.eio.send_packet = send_packet
+    server.sio = server_utils.sio = sio
+
+    async def connect(name):
+        sockets[name] = FakeSocket()
+        sid = await sio.manager.connect(name, '/')
+        server.sid_to_protocol[sid] = protocol
+        return sid
+
+    pong_games = []
+    for index in range(games):
+        game = server.PongGame(index + 1, 1, 2, False)
+        await game.add_player(await connect(f'player{index}'), 1)
+        server.active_games[game.game_id] = game
+        pong_games.append(game)
+    for index in range(spectators):
+        await pong_games[index % games].add_spectator(await connect(f'spectator{index}'))
+    for game in pong_games:
+        game.start_rally()
+
+    ticks = int(seconds * TICK_RATE)
+    tick_times = []
+    lateness = []
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(0.1)
+    encodes[0] = 0
+    for socket in sockets.values():
+        socket.packets = 0
+    deadline = loop.time()
+    for _ in range(ticks):
+        lateness.append(max(0.0, loop.time() - deadline))
+        for game in pong_games:
+            start = time.perf_counter()
+            await game.tick()
+            tick_times.append(time.perf_counter() - start)
+        deadline += 1.0 / TICK_RATE
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+    await asyncio.sleep(0.1)
+
+    player_packets = sum(socket.packets for name, socket in sockets.items()
+                         if name.startswith('player'))
+    spectator_packets = sum(socket.packets for name, socket in sockets.items()
+                            if name.startswith('spectator'))
+    for socket in sockets.values():
+        socket.writer.cancel()
+    for game in pong_games:
+        await game.close_rooms()
+        del server.active_games[game.game_id]
+    server.sid_to_protocol.clear()
+    return {
+        'tick_p50_us': statistics.median(tick_times) * 1e6,
+        'tick_p99_us': percentile(tick_times, 0.99) * 1e6,
+        'late_p99_ms': percentile(lateness, 0.99) * 1e3,
+        'player_packets': player_packets / seconds,
+        'spectator_packets': spectator_packets / seconds,
+        'encodes': encodes[0] / seconds,
+    }
+
+
+async def main(games, spectators, seconds, protocol):
+    encodes = count_encodes()
+    print(f"{games} games at {TICK_RATE} Hz, {spectators} spectators at "
+          f"{server.SPECTATOR_FRAME_RATE} frames/s, protocol {protocol}, "
+          f"{seconds:.0f} s per setup")
+    print(f"{'setup':>30} {'tick p50 us':>12} {'tick p99 us':>12} {'late p99 ms':>12} "
+          f"{'player pkt/s':>13} {'spect. pkt/s':>13} {'encodes/s':>10}")
+    for name, manager_class in (('AsyncManager', socketio.AsyncManager),
+                                ('FanOutManager', FanOutManager)):
+        for count in (0, spectators):
+            result = await run_setup(manager_class(), games, count, seconds, protocol, encodes)
+            print(f"{f'{name}, {count} spectators':>30} {result['tick_p50_us']:>12.0f} "
+                  f"{result['tick_p99_us']:>12.0f} {result['late_p99_ms']:>12.1f} "
+                  f"{result['player_packets']:>13.0f} "
+                  f"{result['spectator_packets']:>13.0f} {result['encodes']:>10.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Player tick time with and without spectators')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--spectators', type=int, default=1000, help='spectators over all games')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--protocol', type=int, default=PROTOCOL_JSON,
+                        help='protocol of players and spectators')
+    args = parser.parse_args()
+    asyncio.run(main(args.games, args.spectators, args.seconds, args.protocol))
@@ -0,0 +1,118 @@
+# bench_state_protocol.py
+# Compares the JSON 'send_game_state' frame with the binary 'send_game_state_v2' frame
+# and the 'state_delta' keyframe/delta stream
+# Reports payload size, full Socket.IO wire size and encode time per frame
+# Usage: python benchmarks/bench_state_protocol.py [--frames N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from socketio import packet
+from server import PongGame
+from protocol import encode_state_v2, DeltaEncoder
+
+
+# json_frame function
+# Builds the JSON state dictionary the same way PongGame.send_game_state_to_client does
+def json_frame(game_state):
+    return {
+        'type': 'send_game_state',
+        'gameId': game_state.game_id,
+        'ballPosition': {'x': game_state.ball.x, 'y': game_state.ball.y, 'z': game_state.ball.z},
+        'ballDelta': {'dx': game_state.ball.delta_x, 'dz': game_state.ball.delta_z},
+        'player1Pos': {'x': game_state.player1.paddle.x, 'z': game_state.player1.paddle.z},
+        'player2Pos': {'x': game_state.player2.paddle.x, 'z': game_state.player2.paddle.z},
+        'bounce': game_state.bounce,
+        'hitpos': game_state.hitpos,
+        'paused': game_state.paused,
+    }
+
+
+# wire_size function
+# Returns the number of bytes Socket.IO puts on the wire for one event
+# Binary events are sent as a text placeholder packet plus one binary attachment
+def wire_size(event, data):
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return sum(len(part) if isinstance(part, bytes) else len(part.encode()) for part in encoded)
+
+
+# sample_states function
+# Plays a game for a few rallies and yields a realistic spread of game states
+def sample_states(frames):
+    game = PongGame(4242, 1001, 2002, False)
+    state = game.game_state
+    state.reset_ball()
+    for tick in range(frames):
+        state.ball.update_position()
+        state.handle_collisions()
+        state.move_player(state.player1.id, 4.5 if tick % 120 < 60 else -4.5)
+        if state.check_goal():
+            state.reset_ball()
+        yield state, tick
+
+
+def encode_json(state, tick):
+    return packet.Packet(packet.EVENT, data=['send_game_state', json_frame(state)]).encode()
+
+
+def encode_binary(state, tick):
+    frame = encode_state_v2(state, tick)
+    return packet.Packet(packet.EVENT, data=['send_game_state_v2', frame]).encode()
+
+
+def make_encode_delta():
+    encoder = DeltaEncoder(4242)
+
+    def encode_delta(state, tick):
+        frame = encoder.encode(state, tick)
+        return packet.Packet(packet.EVENT, data=['state_delta', frame]).encode()
+    return encode_delta
+
+
+def bench(encoder, frames):
+    state, _ = next(sample_states(1))
+    start = time.perf_counter()
+    for i in range(frames):
+        encoder(state, i)
+    return (time.perf_counter() - start) / frames
+
+
+def main(frames):
+    json_payload = json_sizes = binary_payload = binary_sizes = delta_payload = delta_sizes = 0
+    count = 0
+    delta_encoder = DeltaEncoder(4242)
+    for state, tick in sample_states(frames):
+        json_payload += len(packet.Packet.json.dumps(json_frame(state), separators=(',', ':')))
+        json_sizes += wire_size('send_game_state', json_frame(state))
+        binary_payload += len(encode_state_v2(state, tick))
+        binary_sizes += wire_size('send_game_state_v2', encode_state_v2(state, tick))
+        delta_frame = delta_encoder.encode(state, tick)
+        delta_payload += len(packet.Packet.json.dumps(delta_frame, separators=(',', ':')))
+        delta_sizes += wire_size('state_delta', delta_frame)
+        count += 1
+    json_time = bench(encode_json, frames)
+    binary_time = bench(encode_binary, frames)
+    delta_time = bench(make_encode_delta(), frames)
+    print(f"{'protocol':<10} {'payload B':>10} {'wire B':>8} {'encode us':>10}")
+    print(f"{'json v1':<10} {json_payload / count:>10.1f} {json_sizes / count:>8.1f} "
+          f"{json_time * 1e6:>10.2f}")
+    print(f"{'binary v2':<10} {binary_payload / count:>10.1f} {binary_sizes / count:>8.1f} "
+          f"{binary_time * 1e6:>10.2f}")
+    print(f"{'delta v3':<10} {delta_payload / count:>10.1f} {delta_sizes / count:>8.1f} "
+          f"{delta_time * 1e6:>10.2f}")
+    print(f"binary wire size reduction: {json_sizes / binary_sizes:.2f}x, "
+          f"encode speedup: {json_time / binary_time:.2f}x")
+    print(f"delta wire size reduction: {json_sizes / delta_sizes:.2f}x, "
+          f"encode speedup: {json_time / delta_time:.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='JSON vs binary state frame benchmark')
+    parser.add_argument('--frames', type=int, default=20000, help='frames encoded per measurement')
+    args = parser.parse_args()
+    main(args.frames)
@@ -0,0 +1,146 @@
+# bench_workers.py
+# Measures how many games the server holds with the games spread over 1, 2 and 4 worker processes
+# The whole GAME_WORKERS path is used: a WorkerPool forks the workers and is attached to a
+# real socketio.AsyncServer, start_game and move_paddle events go through WorkerPool.forward,
+# the workers run the games on their own scheduler at TICK_RATE, and every emit and room change
+# comes back over the pipes and is replayed by the front end's _pump onto its sockets
+# Only the Engine.IO sockets are fakes (like in bench_spectators.py), with a writer task each
+# Every game has one local client sending paddle inputs like a held key
+# Per setup it prints the state frames delivered per second (in total and per game), how late the
+# frames reach the sockets after their tick (p50/p99, the processes share the clock) and the CPU
+# used by the front end, which relays for every worker. Once the workers or the front end run out
+# of CPU, the frames per game go down and the lateness goes up
+# Usage: python benchmarks/bench_workers.py [--games N] [--duration S] [--workers 1,2,4]
+#                                          [--input-rate R]
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import socketio
+import server     # the workers fork with the game handlers loaded
+from fan_out import FanOutManager
+from game_workers import WorkerPool
+from json_codec import JsonPacket, json_codec
+from tick_scheduler import TICK_RATE, server_time
+
+SERVER_TIME = re.compile(r'"serverTime":([0-9.]+)')
+# seconds between start_game and the measurement (run_game waits 1 s, then the serve)
+WARMUP = 1.5
+
+
+# FakeSocket class
+# Engine.IO socket stand-in: a queue emptied by a writer task
+# The writer counts the state frames and notes how late they arrive
+class FakeSocket:
+    def __init__(self, latencies):
+        self.queue = asyncio.Queue()
+        self.closed = False
+        self.frames = 0
+        self.latencies = latencies
+        self.writer = asyncio.create_task(self.write())
+
+    async def write(self):
+        while True:
+            pkt = await self.queue.get()
+            self.queue.task_done()
+            data = pkt.data
+            if isinstance(data, str) and data.startswith('2["send_game_state"'):
+                self.frames += 1
+                match = SERVER_TIME.search(data)
+                if match is not None:
+                    self.latencies.append(server_time() - float(match.group(1)))
+
+
+# send_inputs function
+# Sends a move_paddle of every game's client about 'rate' times per second
+async def send_inputs(pool, sids, rate):
+    rng = random.Random(0)
+    while True:
+        await asyncio.sleep(1.0 / TICK_RATE)
+        for game_id, sid in sids.items():
+            if rng.random() < rate / TICK_RATE:
+                await pool.forward('move_paddle', sid, {
+                    'type': 'move_paddle', 'game_id': game_id, 'player1_id': game_id * 10 + 1,
+                    'player2_id': game_id * 10 + 2, 'p1_delta_z': rng.uniform(-9, 9),
+                })
+
+
+async def run_setup(pool, games, duration, input_rate):
+    sio = socketio.AsyncServer(async_mode='asgi', client_manager=FanOutManager(),
+                               serializer=JsonPacket, json=json_codec)
+    sockets = {}
+    latencies = []
+
+    async def send_packet(eio_sid, pkt):
+        await sockets[eio_sid].queue.put(pkt)
+    sio.eio.sockets = sockets
+    sio.eio.send_packet = send_packet
+    pool.attach(sio)
+    await pool.listen()
+
+    sids = {}
+    for game_id in range(1, games + 1):
+        sockets[f'client{game_id}'] = FakeSocket(latencies)
+        sid = await sio.manager.connect(f'client{game_id}', '/')
+        sids[game_id] = sid
+        await pool.forward('start_game', sid, {'game_id': game_id, 'player1_id': game_id * 10 + 1,
+                                               'player2_id': game_id * 10 + 2, 'is_remote': False})
+    inputs = asyncio.create_task(send_inputs(pool, sids, input_rate))
+    await asyncio.sleep(WARMUP)
+    for socket in sockets.values():
+        socket.frames = 0
+    latencies.clear()
+    cpu = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - cpu
+    frames = sum(socket.frames for socket in sockets.values())
+    measured = sorted(latencies) or [0.0]
+    inputs.cancel()
+    for socket in sockets.values():
+        socket.writer.cancel()
+    return {
+        'frames': frames / duration,
+        'latency_p50_ms': statistics.median(measured),
+        'latency_p99_ms': measured[min(len(measured) - 1, int(len(measured) * 0.99))],
+        'front_end_cpu': cpu / duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Games held on 1, 2 and 4 worker processes')
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--input-rate', type=float, default=10.0,
+                        help='move_paddle events per second per game')
+    args = parser.parse_args()
+    # late ticks show up in the table, not as warnings of every worker
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"CPU cores: {os.cpu_count()}, games: {args.games}, "
+          f"{args.input_rate:.0f} inputs/s per game, {args.duration:.0f} s per setup")
+    print(f"{'workers':>8} {'frames/s':>9} {'per game':>9} {'late p50 ms':>12} "
+          f"{'late p99 ms':>12} {'front-end CPU':>14}")
+    for workers in (int(value) for value in args.workers.split(',')):
+        # the workers are forked before the front end starts its event loop and threads
+        pool = WorkerPool(workers)
+        pool.start()
+        try:
+            result = asyncio.run(run_setup(pool, args.games, args.duration, args.input_rate))
+        finally:
+            pool.stop()
+        print(f"{workers:>8} {result['frames']:>9.0f} {result['frames'] / args.games:>9.1f} "
+              f"{result['latency_p50_ms']:>12.1f} {result['latency_p99_ms']:>12.1f} "
+              f"{result['front_end_cpu']:>13.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,484 @@
+# load_swarm.py
+# End-to-end load test of the game server with a swarm of python-socketio clients
+# Starts the game server (python server.py) with a local fake token service, then for every
+# concurrency level opens the clients, pairs them into games and lets them play:
+#   - join mode: two clients per game send join_game (remote game, tokens checked by the fake
+#     service)
+#   - start mode: one client per game sends start_game (local game, the client steers both paddles)
+# Clients use the delta protocol (3), whose frames carry a sequence number and the game tick,
+# and steer their paddle towards the ball with move_paddle at --input-rate inputs per second
+# Reports per level:
+#   - frame latency: arrival time minus the tick's due time, where the tick clock of every client
+#     is anchored on its fastest frame (so the figures are the delay on top of the best case,
+#     the server and the swarm share no clock)
+#   - late frames (latency over one tick interval) and dropped frames (sequence number gaps)
+#   - server CPU usage over the measuring window (read from /proc, Linux only)
+# Run the swarm on other cores than the server, it needs about as much CPU as the server itself
+# Needs the asyncio client of python-socketio: pip install "python-socketio[asyncio_client]"
+# Usage: python benchmarks/load_swarm.py [--levels 10,100,500] [--mode join|start]
+#                                        [--duration S] [--warmup S] [--url URL] [--json]
+#                                        [--server-env NAME=VALUE ...]
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+import socketio
+
+GAME_SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, GAME_SERVER_DIR)
+
+from game_logic.game_defaults import PADDLE_SPEED
+from protocol import PROTOCOL_DELTA
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)   # histogram bucket upper bounds
+DEFAULT_INPUT_RATE = 30         # move_paddle messages per second per client, like a held key
+CONNECT_BATCH_SIZE = 50         # clients connecting at the same time
+SERVER_START_TIMEOUT = 10.0     # seconds to wait for the server to accept connections
+FRAME_FIELDS = ('bx', 'bz', 'dx', 'dz', 'p1', 'p2', 'b', 'h', 'p')
+
+
+# FakeTokenService class
+# Minimal HTTP server answering every token validation with a valid response
+# Keeps connections alive like the real service behind the token validator's pooled client
+# Properties:
+#   - delay: seconds to wait before answering, to simulate a slow token service
+#   - requests: number of validations answered
+class FakeTokenService:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = 0
+        self.server = None
+        self.connections = set()
+
+    # start method
+    # Listens on a free local port, returns the service URL
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            for task in self.connections:
+                task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+
+    # handle method
+    # Answers the requests of one connection until the client closes it
+    async def handle(self, reader, writer) -> None:
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self.requests += 1
+                body = b'{"valid": true}'
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+
+# LevelStats class
+# Frame counters and latency samples of one concurrency level
+class LevelStats:
+    def __init__(self):
+        self.recording = False
+        self.frames = 0
+        self.dropped = 0
+        self.inputs = 0
+        self.games_finished = 0
+        self.errors = 0
+        self.latencies = []
+
+    # add_latencies method
+    # Adds the latencies of a client's frames received while recording
+    def add_latencies(self, latencies) -> None:
+        self.latencies.extend(latencies)
+
+    # report method
+    # Returns the level's figures as a dictionary
+    def report(self, tick_interval: float, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        histogram = {}
+        index = 0
+        for bound in LATENCY_BUCKETS_MS:
+            count = 0
+            while index < len(latencies) and latencies[index] * 1000 <= bound:
+                count += 1
+                index += 1
+            histogram[f"<={bound}ms"] = count
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] = len(latencies) - index
+        return {
+            'frames': self.frames,
+            'frames_per_second': self.frames / elapsed if elapsed else 0.0,
+            'inputs': self.inputs,
+            'latency_p50_ms': percentile(latencies, 0.50) * 1000,
+            'latency_p95_ms': percentile(latencies, 0.95) * 1000,
+            'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+            'latency_max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+            'late_frames': sum(1 for latency in latencies if latency > tick_interval),
+            'dropped_frames': self.dropped,
+            'games_finished': self.games_finished,
+            'errors': self.errors,
+            'histogram': histogram,
+        }
+
+
+# percentile function
+# Returns the given percentile of the sorted samples (nearest rank)
+def percentile(sorted_samples, fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+# SwarmClient class
+# One Socket.IO client playing a game
+# Rebuilds the game state from the delta frames, requests a keyframe after a gap like the
+# frontend does, and steers its paddle(s) towards the ball
+# Properties:
+#   - paddles: the (player_id, frame field) pairs this client steers
+#   - fields: the game state rebuilt from the frames
+#   - arrivals: (tick, arrival time) of the frames received while recording
+class SwarmClient:
+    def __init__(self, stats: LevelStats, game_id: int, input_rate: float):
+        self.stats = stats
+        self.game_id = game_id
+        self.input_interval = 1.0 / input_rate if input_rate > 0 else None
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on('game_defaults', self.on_game_defaults)
+        self.sio.on('state_delta', self.on_state_delta)
+        self.sio.on('game_over', self.on_game_over)
+        self.tick_interval = None
+        self.paddles = ()
+        self.remote = True
+        self.fields = {}
+        self.last_seq = 0
+        self.arrivals = []
+        self.playing = False
+        self.input_task = None
+
+    async def connect(self, url: str) -> None:
+        await self.sio.connect(url, transports=['websocket'])
+
+    async def on_game_defaults(self, data) -> None:
+        self.tick_interval = 1.0 / data.get('TICK_RATE', 60)
+
+    # on_state_delta method
+    # Applies a delta frame and records its arrival time
+    async def on_state_delta(self, frame) -> None:
+        arrival = time.perf_counter()
+        seq = frame.get('s', 0)
+        keyframe = frame.get('k', False)
+        if seq < self.last_seq or (seq == self.last_seq and not keyframe):
+            return
+        new_frame = seq > self.last_seq
+        if self.last_seq and seq > self.last_seq + 1 and not keyframe:
+            # missed frames, the fields may be stale until the keyframe arrives
+            self.stats.dropped += seq - self.last_seq - 1
+            await self.sio.emit('request_keyframe', {'game_id': self.game_id})
+        self.last_seq = seq
+        for key in FRAME_FIELDS:
+            if key in frame:
+                self.fields[key] = frame[key]
+        self.playing = True
+        if new_frame and self.stats.recording:
+            self.stats.frames += 1
+            self.arrivals.append((frame['t'], arrival))
+
+    async def on_game_over(self, data) -> None:
+        self.playing = False
+        self.stats.games_finished += 1
+
+    # join method
+    # Sends join_game for one side of a remote game and starts sending inputs
+    async def join(self, player_id: int, player1_id: int, player2_id: int) -> None:
+        self.paddles = ((player_id, 'p1' if player_id == player1_id else 'p2'),)
+        await self.sio.emit('join_game', {
+            'game_id': self.game_id, 'local_player_id': player_id, 'player1_id': player1_id,
+            'player2_id': player2_id, 'is_remote': True, 'token': f"token-{player_id}",
+            'protocol': PROTOCOL_DELTA,
+        })
+        self.start_inputs()
+
+    # start method
+    # Sends start_game for a local game and starts sending inputs for both paddles
+    async def start(self, player1_id: int, player2_id: int) -> None:
+        self.remote = False
+        self.paddles = ((player1_id, 'p1'), (player2_id, 'p2'))
+        await self.sio.emit('start_game', {
+            'game_id': self.game_id, 'player1_id': player1_id, 'player2_id': player2_id,
+            'is_remote': False, 'protocol': PROTOCOL_DELTA,
+        })
+        self.start_inputs()
+
+    def start_inputs(self) -> None:
+        if self.input_interval is not None:
+            self.input_task = asyncio.create_task(self.send_inputs())
+
+    # send_inputs method
+    # Sends a move_paddle towards the ball every input interval while the game runs
+    async def send_inputs(self) -> None:
+        while True:
+            await asyncio.sleep(self.input_interval)
+            if not self.playing or 'bz' not in self.fields:
+                continue
+            deltas = {}
+            for player_id, field in self.paddles:
+                distance = self.fields['bz'] - self.fields[field]
+                if abs(distance) >= 1.0:
+                    deltas[player_id] = max(-PADDLE_SPEED, min(PADDLE_SPEED, distance))
+            if not deltas:
+                continue
+            data = {'type': 'move_paddle', 'game_id': self.game_id}
+            if self.remote:
+                (player_id, delta_z), = deltas.items()
+                data.update(player_id=player_id, delta_z=delta_z)
+            else:
+                (player1_id, _), (player2_id, _) = self.paddles
+                data.update(player1_id=player1_id, p1_delta_z=deltas.get(player1_id, 0),
+                            player2_id=player2_id, p2_delta_z=deltas.get(player2_id, 0))
+            try:
+                await self.sio.emit('move_paddle', data)
+                self.stats.inputs += 1
+            except socketio.exceptions.SocketIOError:
+                return
+
+    # latencies method
+    # Returns the latency of every recorded frame
+    # The client's tick clock is anchored on the frame that arrived earliest relative to its tick
+    def latencies(self) -> list:
+        if not self.arrivals or self.tick_interval is None:
+            return []
+        interval = self.tick_interval
+        anchor = min(arrival - tick * interval for tick, arrival in self.arrivals)
+        return [arrival - tick * interval - anchor for tick, arrival in self.arrivals]
+
+    async def close(self) -> None:
+        if self.input_task is not None:
+            self.input_task.cancel()
+        await self.sio.disconnect()
+
+
+# process_cpu_seconds function
+# Returns the user + system CPU time of a process, or None if it can't be read
+def process_cpu_seconds(pid):
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+# start_server function
+# Starts the game server with the fake token service, the way the Dockerfile does
+# server_env: settings of the server (see launcher.py), they override the swarm's environment
+# The server's output is discarded unless show_logs is set
+def start_server(port: int, token_service_url: str, show_logs: bool = False,
+                 server_env=None) -> subprocess.Popen:
+    env = dict(os.environ, TOKEN_SERVICE=token_service_url, SERVER_HOST='127.0.0.1',
+               SERVER_PORT=str(port), LOG_LEVEL='warning', SHUTDOWN_DRAIN_TIMEOUT='0')
+    env.update(server_env or {})
+    output = None if show_logs else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, 'server.py'], cwd=GAME_SERVER_DIR, env=env,
+                            stdout=output, stderr=output)
+
+
+# parse_server_env function
+# Returns the NAME=VALUE settings of --server-env as a dictionary
+def parse_server_env(settings) -> dict:
+    env = {}
+    for setting in settings or ():
+        name, separator, value = setting.partition('=')
+        if not separator:
+            raise SystemExit(f"--server-env expects NAME=VALUE, got {setting!r}")
+        env[name] = value
+    return env
+
+
+# wait_for_server function
+# Polls the server's port until it accepts connections
+async def wait_for_server(url: str) -> None:
+    address = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(address.hostname, address.port or 80)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+# connect_clients function
+# Connects the clients in batches of CONNECT_BATCH_SIZE, returns the ones that connected
+async def connect_clients(clients, url: str, stats: LevelStats) -> list:
+    connected = []
+    for start in range(0, len(clients), CONNECT_BATCH_SIZE):
+        batch = clients[start:start + CONNECT_BATCH_SIZE]
+        results = await asyncio.gather(*(client.connect(url) for client in batch),
+                                       return_exceptions=True)
+        for client, result in zip(batch, results):
+            if isinstance(result, Exception):
+                stats.errors += 1
+            else:
+                connected.append(client)
+    return connected
+
+
+# run_level function
+# Plays 'games' games at once, returns the level's report
+async def run_level(url: str, games: int, level: int, args, server_pid) -> dict:
+    stats = LevelStats()
+    clients_per_game = 2 if args.mode == 'join' else 1
+    first_game_id = (level + 1) * 100000
+    clients = [SwarmClient(stats, first_game_id + index // clients_per_game, args.input_rate)
+               for index in range(games * clients_per_game)]
+    clients = await connect_clients(clients, url, stats)
+    by_game = {}
+    for client in clients:
+        by_game.setdefault(client.game_id, []).append(client)
+    for game_id, game_clients in by_game.items():
+        player1_id, player2_id = game_id * 2, game_id * 2 + 1
+        if args.mode == 'join':
+            if len(game_clients) == 2:
+                await game_clients[0].join(player1_id, player1_id, player2_id)
+                await game_clients[1].join(player2_id, player1_id, player2_id)
+        else:
+            await game_clients[0].start(player1_id, player2_id)
+
+    await asyncio.sleep(args.warmup)
+    stats.recording = True
+    cpu_start = process_cpu_seconds(server_pid)
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - start
+    cpu_end = process_cpu_seconds(server_pid)
+    stats.recording = False
+
+    tick_interval = next((client.tick_interval for client in clients if client.tick_interval),
+                         1 / 60)
+    for client in clients:
+        stats.add_latencies(client.latencies())
+    for start in range(0, len(clients), CONNECT_BATCH_SIZE):
+        batch = clients[start:start + CONNECT_BATCH_SIZE]
+        await asyncio.gather(*(client.close() for client in batch), return_exceptions=True)
+    await asyncio.sleep(args.cooldown)
+
+    report = stats.report(tick_interval, elapsed)
+    report.update(games=games, clients=len(clients))
+    report['server_cpu_percent'] = None
+    if cpu_start is not None and cpu_end is not None:
+        report['server_cpu_percent'] = (cpu_end - cpu_start) / elapsed * 100
+    return report
+
+
+# format_level function
+# Returns one table row of a level's report
+def format_level(report: dict) -> str:
+    cpu = report['server_cpu_percent']
+    return (f"{report['games']:>6} {report['clients']:>7} {report['frames_per_second']:>9.0f} "
+            f"{report['latency_p50_ms']:>8.2f} {report['latency_p95_ms']:>8.2f} "
+            f"{report['latency_p99_ms']:>8.2f} {report['latency_max_ms']:>8.1f} "
+            f"{report['late_frames']:>6} {report['dropped_frames']:>7} "
+            f"{(f'{cpu:.0f}%' if cpu is not None else '-'):>6}")
+
+
+async def run(args) -> list:
+    token_service = FakeTokenService(args.token_delay_ms / 1000)
+    token_service_url = await token_service.start()
+    process = None
+    url = args.url
+    server_pid = args.server_pid
+    if url is None:
+        process = start_server(args.port, token_service_url, args.server_logs,
+                               parse_server_env(args.server_env))
+        server_pid = process.pid
+        url = f"http://127.0.0.1:{args.port}"
+    reports = []
+    try:
+        await wait_for_server(url)
+        if not args.json:
+            print(f"server: {url}, mode: {args.mode}, warmup: {args.warmup}s, "
+                  f"duration: {args.duration}s")
+            print(f"{'games':>6} {'clients':>7} {'frames/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                  f"{'p99 ms':>8} {'max ms':>8} {'late':>6} {'dropped':>7} {'cpu':>6}")
+        for level, games in enumerate(int(value) for value in args.levels.split(',')):
+            report = await run_level(url, games, level, args, server_pid)
+            reports.append(report)
+            if not args.json:
+                print(format_level(report))
+        if not args.json and reports:
+            print("latency histogram of the last level:")
+            for bucket, count in reports[-1]['histogram'].items():
+                print(f"  {bucket:>9} {count}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        await token_service.stop()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', default='10,50,100,250,500',
+                        help="games per concurrency level")
+    parser.add_argument('--mode', choices=('join', 'start'), default='join')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="measuring window per level (seconds)")
+    parser.add_argument('--warmup', type=float, default=3.0,
+                        help="seconds between pairing and measuring")
+    parser.add_argument('--cooldown', type=float, default=2.0, help="seconds between two levels")
+    parser.add_argument('--input-rate', type=float, default=DEFAULT_INPUT_RATE)
+    parser.add_argument('--token-delay-ms', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8011, help="port of the started server")
+    parser.add_argument('--url', help="use a running server instead "
+                                      "(its token service has to accept the fake tokens)")
+    parser.add_argument('--server-pid', type=int,
+                        help="pid of the running server, for the CPU figures")
+    parser.add_argument('--server-logs', action='store_true',
+                        help="show the output of the started server")
+    parser.add_argument('--server-env', action='append', metavar='NAME=VALUE',
+                        help="setting of the started server, e.g. PRODUCTION=1 (repeatable)")
+    parser.add_argument('--json', action='store_true', help="print the reports as JSON")
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# redis://host:6379/0 or memory:// enables cluster mode
+CLUSTER_URL = os.environ.get('CLUSTER_URL')
+NODE_ID = os.environ.get('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+SOCKETIO_CHANNEL = 'game-server'                # Socket.IO manager channel shared by every node
+NODE_CHANNEL_PREFIX = 'game-server:node:'       # per-node channel of forwarded player events
+OWNER_KEY_PREFIX = 'game-server:owner:'         # registry key of a game's owner node
+
+OWNERSHIP_TTL = 60          # seconds a claim outlives its node if the node stops refreshing it
+OWNERSHIP_REFRESH = 10      # seconds between two refreshes of the owned games
+OWNERSHIP_GRACE = 30        # seconds a claim is kept before its game starts (matchmaking)
+
+# Events routed to the node that owns the game
+# start_game and join_game claim the game on first sight, the others follow the sid
+# spectate_game goes to the current owner without claiming, stop_spectating follows the watched
+# game
+# request_keyframe of a spectator follows the watched game too
+GAME_ID_EVENTS = ('start_game', 'join_game')
+SID_EVENTS = ('move_paddle', 'quit_game', 'request_keyframe')
+SPECTATOR_EVENTS = ('spectate_game', 'stop_spectating')
+
+
+# MemoryBroker class
+# In-process stand-in for Redis: pub/sub channels and a key-value store
+# Messages are JSON round-tripped so anything that would not survive Redis fails here too
+class MemoryBroker:
+    def __init__(self):
+        self.subscribers = {}
+        self.store = {}
+
+    # publish method
+    # Delivers a message to every current subscriber of the channel
+    async def publish(self, channel, message) -> None:
+        encoded = json.dumps(message)
+        for queue in self.subscribers.get(channel, ()):
+            queue.put_nowait(json.loads(encoded))
+
+    # subscribe method
+    # Subscribes to the channel, returns an iterator over the messages published from now on
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(channel, []).append(queue)
+
+        async def messages():
+            try:
+                while True:
+                    yield await queue.get()
+            finally:
+                self.subscribers[channel].remove(queue)
+        return messages()
+
+    # set_if_absent method
+    # Stores the value unless the key exists, returns True if it was stored
+    async def set_if_absent(self, key, value, ttl: float) -> bool:
+        entry = self.store.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return False
+        self.store[key] = (value, time.monotonic() + ttl)
+        return True
+
+    # get method
+    # Returns the value of the key, or None
+    async def get(self, key):
+        entry = self.store.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    # refresh_if method
+    # Extends the TTL of the key if it still holds the value
+    async def refresh_if(self, key, value, ttl: float) -> bool:
+        if await self.get(key) != value:
+            return False
+        self.store[key] = (value, time.monotonic() + ttl)
+        return True
+
+    # delete_if method
+    # Deletes the key if it still holds the value
+    async def delete_if(self, key, value) -> bool:
+        if await self.get(key) != value:
+            return False
+        del self.store[key]
+        return True
+
+
+# RedisBroker class
+# Same interface as MemoryBroker, backed by Redis
+class RedisBroker:
+    # Compare-and-set scripts, so a node never touches a claim another node took over
+    REFRESH_IF = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                  "return redis.call('expire', KEYS[1], ARGV[2]) end return 0")
+    DELETE_IF = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                 "return redis.call('del', KEYS[1]) end return 0")
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("Cluster mode with a Redis URL needs the 'redis' package")
+        self.url = url
+        self.redis = aioredis.from_url(url, decode_responses=True)
+
+    async def publish(self, channel, message) -> None:
+        await self.redis.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+
+        async def messages():
+            try:
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        yield json.loads(message['data'])
+            finally:
+                await pubsub.unsubscribe(channel)
+                await pubsub.close()
+        return messages()
+
+    async def set_if_absent(self, key, value, ttl: float) -> bool:
+        return bool(await self.redis.set(key, value, nx=True, ex=int(ttl)))
+
+    async def get(self, key):
+        return await self.redis.get(key)
+
+    async def refresh_if(self, key, value, ttl: float) -> bool:
+        return bool(await self.redis.eval(self.REFRESH_IF, 1, key, value, int(ttl)))
+
+    async def delete_if(self, key, value) -> bool:
+        return bool(await self.redis.eval(self.DELETE_IF, 1, key, value))
+
+
+# create_broker function
+# Returns the broker for the cluster URL, or None when cluster mode is off
+def create_broker(url: str = CLUSTER_URL):
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryBroker()
+    return RedisBroker(url)
+
+
+# MemoryManager class
+# Socket.IO client manager sharing rooms and emits through a MemoryBroker
+# Plays the part of socketio.AsyncRedisManager when there is no Redis server
+class MemoryManager(AsyncPubSubManager):
+    name = 'memory'
+
+    def __init__(self, broker: MemoryBroker, channel: str = SOCKETIO_CHANNEL,
+                 write_only: bool = False):
+        super().__init__(channel=channel, write_only=write_only)
+        self.broker = broker
+
+    async def _publish(self, data):
+        await self.broker.publish(self.channel, data)
+
+    async def _listen(self):
+        async for message in await self.broker.subscribe(self.channel):
+            yield message
+
+
+# create_client_manager function
+# Returns the Socket.IO client manager matching the broker, or None when cluster mode is off
+def create_client_manager(broker):
+    if broker is None:
+        return None
+    if isinstance(broker, MemoryBroker):
+        return MemoryManager(broker)
+    return socketio.AsyncRedisManager(broker.url, channel=SOCKETIO_CHANNEL)
+
+
+# GameRegistry class
+# Maps game IDs to the node running the game
+# The first node that sees a game claims it, claims expire when their node stops refreshing them
+class GameRegistry:
+    def __init__(self, broker, ttl: float = OWNERSHIP_TTL):
+        self.broker = broker
+        self.ttl = ttl
+
+    # claim method
+    # Claims the game for the node unless another node owns it, returns the owner
+    async def claim(self, game_id, node_id: str) -> str:
+        key = OWNER_KEY_PREFIX + str(game_id)
+        if await self.broker.set_if_absent(key, node_id, self.ttl):
+            return node_id
+        owner = await self.broker.get(key)
+        if owner is None:
+            return await self.claim(game_id, node_id)
+        return owner
+
+    # owner method
+    # Returns the node owning the game, or None
+    async def owner(self, game_id):
+        return await self.broker.get(OWNER_KEY_PREFIX + str(game_id))
+
+    # refresh method
+    # Extends the claim of the node on the game
+    async def refresh(self, game_id, node_id: str) -> bool:
+        return await self.broker.refresh_if(OWNER_KEY_PREFIX + str(game_id), node_id, self.ttl)
+
+    # release method
+    # Drops the claim of the node on the game
+    async def release(self, game_id, node_id: str) -> bool:
+        return await self.broker.delete_if(OWNER_KEY_PREFIX + str(game_id), node_id)
+
+
+# ClusterNode class
+# Runs the player events of a session on the node that owns its game
+# Emits and room changes of the owner reach the session's node through the Socket.IO manager
+# Properties:
+#   - node_id: the ID of this node
+#   - registry: the game ownership registry
+#   - handlers: namespace holding the event handlers and active_games (the server module)
+#   - sid_to_owner: the node each local session's game runs on
+#   - spectator_to_owner: the node running the game each local spectator session watches
+#   - claimed: game_id -> claim time of the games this node owns
+#   - forwarded: sid -> the task running the last event forwarded for the session
+class ClusterNode:
+    def __init__(self, broker, node_id: str = NODE_ID, handlers=None):
+        self.node_id = node_id
+        self.broker = broker
+        self.registry = GameRegistry(broker)
+        self.handlers = handlers
+        self.sid_to_owner = {}
+        self.spectator_to_owner = {}
+        self.claimed = {}
+        self.forwarded = {}
+        self.sio = None
+        self.tasks = []
+
+    # channel property
+    # The channel forwarded events for this node arrive on
+    @property
+    def channel(self) -> str:
+        return NODE_CHANNEL_PREFIX + self.node_id
+
+    # attach method
+    # Replaces the game event handlers of the Socket.IO server with the cluster router
+    def attach(self, sio) -> None:
+        self.sio = sio
+        if self.handlers is None:
+            import server
+            self.handlers = server
+        for name in GAME_ID_EVENTS + SID_EVENTS + SPECTATOR_EVENTS:
+            sio.on(name, self._router(name))
+        sio.on('disconnect', self.route_disconnect)
+
+    # listen method
+    # Starts handling the events forwarded to this node and refreshing its claims
+    async def listen(self) -> None:
+        messages = await self.broker.subscribe(self.channel)
+        self.tasks.append(asyncio.create_task(self._receive(messages)))
+        self.tasks.append(asyncio.create_task(self._refresh_claims()))
+
+    # stop method
+    # Stops the node's background tasks and releases its games
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        for task in self.forwarded.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.forwarded.values(), return_exceptions=True)
+        self.tasks.clear()
+        self.forwarded.clear()
+        for game_id in list(self.claimed):
+            await self.registry.release(game_id, self.node_id)
+        self.claimed.clear()
+
+    # _router method
+    # Returns a Socket.IO event handler routing the event to the owning node
+    def _router(self, name):
+        async def route(sid, data=None):
+            await self.route(name, sid, data)
+        return route
+
+    # owner_for method
+    # Returns the node owning the event's game, claiming new games for this node
+    # A spectator moving to a game of another node is detached from its previous game first
+    async def owner_for(self, name, sid, data):
+        if name == 'spectate_game':
+            game_id = data.get('game_id') if isinstance(data, dict) else None
+            owner = await self.registry.owner(game_id) if game_id is not None else None
+            owner = owner or self.node_id
+            previous = self.spectator_to_owner.get(sid)
+            if previous is not None and previous != owner:
+                await self.send(previous, 'stop_spectating', sid, None)
+            self.spectator_to_owner[sid] = owner
+            return owner
+        if name in SPECTATOR_EVENTS:
+            return self.spectator_to_owner.get(sid, self.node_id)
+        if name in GAME_ID_EVENTS:
+            game_id = data.get('game_id') if isinstance(data, dict) else None
+            if game_id is None:
+                return self.node_id
+            owner = await self.registry.claim(game_id, self.node_id)
+            if owner == self.node_id:
+                self.claimed.setdefault(game_id, time.monotonic())
+            self.sid_to_owner[sid] = owner
+            return owner
+        if name == 'request_keyframe' and sid not in self.sid_to_owner:
+            return self.spectator_to_owner.get(sid, self.node_id)
+        return self.sid_to_owner.get(sid, self.node_id)
+
+    # route method
+    # Runs the event here if this node owns the game, forwards it otherwise
+    async def route(self, name, sid, data) -> None:
+        owner = await self.owner_for(name, sid, data)
+        await self.send(owner, name, sid, data)
+
+    # route_disconnect method
+    # Lets the owning node clean up after a disconnected session
+    async def route_disconnect(self, sid, *args) -> None:
+        owner = self.sid_to_owner.pop(sid, self.node_id)
+        await self.send(owner, 'disconnect', sid, None)
+        spectated = self.spectator_to_owner.pop(sid, None)
+        if spectated is not None and spectated != owner:
+            await self.send(spectated, 'disconnect', sid, None)
+
+    # send method
+    # Runs the event on the given node, locally or through the node's channel
+    async def send(self, node_id, name, sid, data) -> None:
+        if node_id == self.node_id:
+            await self.dispatch(name, sid, data)
+        else:
+            await self.broker.publish(NODE_CHANNEL_PREFIX + node_id,
+                                      {'event': name, 'sid': sid, 'data': data})
+
+    # dispatch method
+    # Runs the regular event handler of the server
+    async def dispatch(self, name, sid, data) -> None:
+        handler = getattr(self.handlers, name)
+        if name == 'disconnect':
+            await handler(sid)
+        else:
+            await handler(sid, data)
+
+    # _receive method
+    # Runs the events other nodes forwarded to this node
+    # Every event runs in its own task, so a slow handler (a join_game waiting for the token
+    # service) does not hold up the events of the other sessions
+    # The events of one session still run in the order they were sent
+    async def _receive(self, messages) -> None:
+        async for message in messages:
+            sid = message.get('sid')
+            task = asyncio.create_task(self._run_forwarded(message, self.forwarded.get(sid)))
+            self.forwarded[sid] = task
+            task.add_done_callback(lambda done, sid=sid: self._forwarded_done(sid, done))
+
+    # _run_forwarded method
+    # Runs a forwarded event once the previous event of its session is done
+    async def _run_forwarded(self, message, previous) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await self.dispatch(message['event'], message['sid'], message['data'])
+        except Exception as e:
+            logging.error(f"Error handling forwarded event {message.get('event')}: {e}")
+
+    # _forwarded_done method
+    # Forgets the session's task once its last forwarded event is done
+    def _forwarded_done(self, sid, task) -> None:
+        if self.forwarded.get(sid) is task:
+            del self.forwarded[sid]
+
+    # _refresh_claims method
+    # Keeps the claims of running games alive and releases the ones of finished games
+    async def _refresh_claims(self) -> None:
+        while True:
+            await asyncio.sleep(OWNERSHIP_REFRESH)
+            await self.refresh_claims(time.monotonic())
+
+    # refresh_claims method
+    # Refreshes or releases every claim of this node
+    async def refresh_claims(self, now: float) -> None:
+        active_games = self.handlers.active_games
+        for game_id, claimed_at in list(self.claimed.items()):
+            if game_id in active_games:
+                if not await self.registry.refresh(game_id, self.node_id):
+                    logging.error(f"Lost the ownership of game {game_id}")
+                    self.claimed.pop(game_id, None)
+            elif now - claimed_at > OWNERSHIP_GRACE:
+                await self.registry.release(game_id, self.node_id)
+                self.claimed.pop(game_id, None)
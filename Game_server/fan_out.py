@@ -0,0 +1,41 @@
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+
+# FanOutManager class
+# Socket.IO client manager that sends the one encoded packet of an emit to its recipients in turn
+# socketio's AsyncManager also encodes an emit once, but then starts a task per recipient and waits
+# for all of them. Engine.IO only queues the packet for the connection's writer task (and the send
+# queues only append to a deque), so a send never waits on the network and the tasks are pure
+# overhead: about 8 ms per emit to 1,000 sessions, against 1 ms when the packets are queued in a
+# loop
+# Emits with a callback need a packet per recipient and keep the original behaviour
+# Only used without cluster mode, the cluster managers deliver the emits published by the other
+# nodes
+class FanOutManager(socketio.AsyncManager):
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None,
+                   **kwargs):
+        if callback:
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        encoded = self.server.packet_class(packet.EVENT, namespace=namespace,
+                                           data=[event] + data).encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        eio_packets = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid not in skip_sid:
+                for pkt in eio_packets:
+                    await self.server._send_eio_packet(eio_sid, pkt)
@@ -0,0 +1,191 @@
+import os
+import numpy as np
+from game_logic.entities.ball import Ball
+from game_logic.entities.paddle import Paddle
+from game_logic.game_defaults import *
+
+# step every rally with one BatchPhysics call per tick
+BATCH_PHYSICS = os.environ.get('BATCH_PHYSICS', '0') == '1'
+BATCH_INITIAL_CAPACITY = 64
+
+# goal flags, who scored in the last step
+NO_GOAL = 0
+PLAYER1_GOAL = 1
+PLAYER2_GOAL = 2
+
+
+# BatchPhysics class
+# Advances the ball of many games at once
+# The ball and paddle state of every game lives in one row of a set of NumPy arrays
+# (struct of arrays), so the movement, wall, paddle and goal tests of all games run
+# as a handful of vectorized operations per tick
+# Paddle bounces are rare, they run through Ball.bounce_from_paddle one by one
+# so the results stay the same as the entity classes
+# Properties:
+#   - capacity: number of rows, grows when more games are added
+#   - x, z, dx, dz, speed, direction: the ball of each game
+#   - p1_z, p2_z: the paddles of each game
+#   - hit: 0 no paddle hit, 1 player1 hit, 2 player2 hit in the last step
+#   - goal: who scored in the last step (NO_GOAL, PLAYER1_GOAL, PLAYER2_GOAL)
+#   - hitpos: where the ball hit the paddle in the last paddle bounce
+#   - queued: rows stepped by the next step() call
+#   - owners: the object each row belongs to, returned by step()
+class BatchPhysics:
+    def __init__(self, capacity: int = BATCH_INITIAL_CAPACITY):
+        self.capacity = 0
+        self.x = self.z = self.dx = self.dz = self.speed = self.direction = np.zeros(0)
+        self.p1_z = self.p2_z = self.hitpos = np.zeros(0)
+        self.hit = self.goal = np.zeros(0, dtype=np.int8)
+        self.queued = np.zeros(0, dtype=bool)
+        self.owners = []
+        self.free = []
+        self._ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED,
+                          BALL_DEFAULT_DIRECTION)
+        self._paddles = (Paddle(PLAYER1_START_X), Paddle(PLAYER2_START_X))
+        self._grow(capacity)
+
+    # _grow method
+    # Resizes every array to the new capacity, keeping the existing rows
+    def _grow(self, capacity: int) -> None:
+        for name in ('x', 'z', 'dx', 'dz', 'speed', 'direction', 'p1_z', 'p2_z', 'hitpos', 'hit',
+                     'goal', 'queued'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.owners.extend([None] * (capacity - self.capacity))
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    # __len__ method
+    # returns the number of rows in use
+    def __len__(self) -> int:
+        return self.capacity - len(self.free)
+
+    # add method
+    # reserves a row for the given owner and returns its index
+    def add(self, owner) -> int:
+        if not self.free:
+            self._grow(max(BATCH_INITIAL_CAPACITY, self.capacity * 2))
+        slot = self.free.pop()
+        self.owners[slot] = owner
+        return slot
+
+    # remove method
+    # frees a row
+    def remove(self, slot: int) -> None:
+        self.owners[slot] = None
+        self.queued[slot] = False
+        self.free.append(slot)
+
+    # load method
+    # copies the ball and paddles of a game state into a row
+    def load(self, slot: int, game_state) -> None:
+        ball = game_state.ball
+        self.x[slot] = ball.x
+        self.z[slot] = ball.z
+        self.dx[slot] = ball.delta_x
+        self.dz[slot] = ball.delta_z
+        self.speed[slot] = ball.speed
+        self.direction[slot] = ball.direction
+        self.p1_z[slot] = game_state.player1.paddle.z
+        self.p2_z[slot] = game_state.player2.paddle.z
+
+    # queue method
+    # marks a row to be stepped by the next step() call, with the paddles where they are now
+    def queue(self, slot: int, p1_z: float, p2_z: float) -> None:
+        self.p1_z[slot] = p1_z
+        self.p2_z[slot] = p2_z
+        self.queued[slot] = True
+
+    # step method
+    # advances every queued row by dt physics frames (one tick), the same way as
+    # Ball.update_position, GameState.handle_collisions and GameState.check_goal
+    # returns the owners of the stepped rows
+    def step(self, dt: float = 1.0) -> list:
+        rows = np.flatnonzero(self.queued)
+        self.queued[rows] = False
+        if not len(rows):
+            return []
+        dx = self.dx[rows]
+        dz = self.dz[rows]
+        x = self.x[rows] + dx * dt
+        z = self.z[rows] + dz * dt
+
+        # handle_collisions: no collisions once the ball left the field
+        inside = (x >= 0) & (x <= FIELD_DEPTH)
+        wall = inside & ((z - BALL_RADIUS <= 0) | (z + BALL_RADIUS >= FIELD_WIDTH))
+        candidates = inside & ~wall
+
+        # check_collision: the ball's next position against the paddle plane and the paddle's
+        # z range
+        expected_x = x + dx
+        expected_z = z + dz
+        p1_z = self.p1_z[rows]
+        p2_z = self.p2_z[rows]
+        hit1 = (candidates & (expected_x - BALL_RADIUS <= 0)
+                & (p1_z - PADDLE_WIDTH / 2 <= expected_z)
+                & (expected_z <= p1_z + PADDLE_WIDTH / 2))
+        hit2 = (candidates & ~hit1 & (expected_x + BALL_RADIUS >= FIELD_DEPTH)
+                & (p2_z - PADDLE_WIDTH / 2 <= expected_z)
+                & (expected_z <= p2_z + PADDLE_WIDTH / 2))
+
+        self.x[rows] = x
+        self.z[rows] = z
+
+        # bounce_from_wall: mirror the direction, which flips the sign of the z delta
+        if wall.any():
+            wall_rows = rows[wall]
+            self.direction[wall_rows] = np.mod(360 - self.direction[wall_rows], 360)
+            self.dz[wall_rows] = -self.dz[wall_rows]
+
+        hit = np.where(hit1, 1, np.where(hit2, 2, 0)).astype(np.int8)
+        self.hit[rows] = hit
+        for index in np.flatnonzero(hit):
+            self._bounce_from_paddle(rows[index], hit[index])
+
+        self.goal[rows] = np.where(x < 0, PLAYER2_GOAL,
+                                   np.where(x > FIELD_DEPTH, PLAYER1_GOAL, NO_GOAL))
+        return [self.owners[slot] for slot in rows]
+
+    # _bounce_from_paddle method
+    # runs Ball.bounce_from_paddle for one row (the scalar fallback)
+    def _bounce_from_paddle(self, slot: int, player: int) -> None:
+        ball = self._ball
+        ball._position._x = float(self.x[slot])
+        ball._position._z = float(self.z[slot])
+        ball._delta_x = float(self.dx[slot])
+        ball._delta_z = float(self.dz[slot])
+        ball._speed = float(self.speed[slot])
+        ball._direction = float(self.direction[slot])
+        paddle = self._paddles[player - 1]
+        paddle._position._z = float(self.p1_z[slot] if player == 1 else self.p2_z[slot])
+        self.hitpos[slot] = ball.bounce_from_paddle(paddle)
+        self.dx[slot] = ball._delta_x
+        self.dz[slot] = ball._delta_z
+        self.speed[slot] = ball._speed
+        self.direction[slot] = ball._direction
+
+    # store method
+    # copies the result of the last step of a row back into the game state
+    # updates the ball, hits, scores, rally length, bounce and paused flags
+    # like GameState.handle_collisions and GameState.check_goal do
+    def store(self, slot: int, game_state) -> None:
+        ball = game_state.ball
+        ball._position._x = float(self.x[slot])
+        ball._position._z = float(self.z[slot])
+        ball._delta_x = float(self.dx[slot])
+        ball._delta_z = float(self.dz[slot])
+        ball._speed = float(self.speed[slot])
+        ball._direction = float(self.direction[slot])
+        hit = self.hit[slot]
+        game_state.bounce = bool(hit)
+        if hit:
+            (game_state.player1 if hit == 1 else game_state.player2).add_hit()
+            game_state.hitpos = float(self.hitpos[slot])
+        game_state.current_rally += 2
+        goal = self.goal[slot]
+        if goal:
+            scorer = game_state.player1 if goal == PLAYER1_GOAL else game_state.player2
+            game_state.update_player_score(scorer.id)
+            game_state.paused = True
@@ -13,6 +13,8 @@ import logging
 #   - speed: the speed of the ball
 #   - direction: the direction of the ball
 class Ball:
+    __slots__ = ('_position', '_delta_x', '_delta_z', '_radius', '_speed', '_direction')
+
     def __init__(self, x: float, z: float, radius: float, speed: float, direction: float):
         self._position: Position = Position(x, 0, z)
         self._delta_x: float = 0
@@ -99,9 +101,16 @@ class Ball:
     # set_deltas method
     # calculates the x and z deltas based on the speed and direction of the ball
     def set_deltas(self) -> None:
-        radians: float = math.radians(self.direction)
-        self._delta_x = math.cos(radians) * self.speed
-        self._delta_z = math.sin(radians) * self.speed
+        radians: float = math.radians(self._direction)
+        self._delta_x = math.cos(radians) * self._speed
+        self._delta_z = math.sin(radians) * self._speed
+
+    # set_motion method
+    # sets the speed and direction of the ball at once, computing the deltas only once
+    def set_motion(self, speed: float, direction: float) -> None:
+        self._speed = speed
+        self._direction = direction
+        self.set_deltas()
     
     @property
     def delta_x(self) -> float:
@@ -118,9 +127,39 @@ class Ball:
 
     # update_position method
     # updates the position of the ball based on its speed and direction
-    def update_position(self) -> None:
-        self._position.x += self.delta_x
-        self._position.z += self.delta_z
+    # dt is the number of physics frames to move, one by default
+    def update_position(self, dt: float = 1.0) -> None:
+        position = self._position
+        if dt == 1.0:
+            position._x += self._delta_x
+            position._z += self._delta_z
+        else:
+            position._x += self._delta_x * dt
+            position._z += self._delta_z * dt
+
+    # time_to_wall method
+    # returns the time in physics frames until the ball touches the wall it is heading to
+    # returns 0 if the ball already touches it, math.inf if it moves parallel to the walls
+    def time_to_wall(self) -> float:
+        delta_z = self._delta_z
+        if delta_z < 0:
+            return max(0.0, (self._position._z - BALL_RADIUS) / -delta_z)
+        if delta_z > 0:
+            return max(0.0, (FIELD_WIDTH - BALL_RADIUS - self._position._z) / delta_z)
+        return math.inf
+
+    # time_to_paddle_plane method
+    # returns the time in physics frames until the ball touches the plane of the paddle it is
+    # heading to (x = 0 for player 1, x = FIELD_DEPTH for player 2) and the number of that player
+    # returns (math.inf, None) if the ball is already behind the plane
+    def time_to_paddle_plane(self) -> tuple:
+        delta_x = self._delta_x
+        x = self._position._x
+        if delta_x < 0 and x - BALL_RADIUS >= 0:
+            return (x - BALL_RADIUS) / -delta_x, 1
+        if delta_x > 0 and x + BALL_RADIUS <= FIELD_DEPTH:
+            return (FIELD_DEPTH - BALL_RADIUS - x) / delta_x, 2
+        return math.inf, None
     
     # check_collision method
     # collision check algorithm with paddle
@@ -129,24 +168,26 @@ class Ball:
     # returns false immediately if ball is not in same x coordinates as paddles
     def check_collision(self, paddle):
         # Calculate the ball's next position
-        expected_x = self.position.x + self.delta_x
-        expected_z = self.position.z + self.delta_z
+        expected_x = self._position._x + self._delta_x
+        expected_z = self._position._z + self._delta_z
+        paddle_x = paddle._position._x
+        paddle_z = paddle._position._z
 
         # Check collision for the left paddle (positioned at x = 0)
-        if paddle.x == PLAYER1_START_X and expected_x - BALL_RADIUS <= 0:
+        if paddle_x == PLAYER1_START_X and expected_x - BALL_RADIUS <= 0:
             # Calculate the paddle's boundaries along the z-axis
-            paddle_z_bottom = paddle.z - PADDLE_WIDTH / 2
-            paddle_z_top = paddle.z + PADDLE_WIDTH / 2
+            paddle_z_bottom = paddle_z - PADDLE_WIDTH / 2
+            paddle_z_top = paddle_z + PADDLE_WIDTH / 2
 
             # Check if the ball's z position is within the paddle's z-axis range
             if paddle_z_bottom <= expected_z <= paddle_z_top:
                 return True  # Collision detected
 
         # Check collision for the right paddle (positioned at x = FIELD_DEPTH)
-        elif paddle.x == PLAYER2_START_X and expected_x + BALL_RADIUS >= FIELD_DEPTH:
+        elif paddle_x == PLAYER2_START_X and expected_x + BALL_RADIUS >= FIELD_DEPTH:
             # Calculate the paddle's boundaries along the z-axis
-            paddle_z_bottom = paddle.z - PADDLE_WIDTH / 2
-            paddle_z_top = paddle.z + PADDLE_WIDTH / 2
+            paddle_z_bottom = paddle_z - PADDLE_WIDTH / 2
+            paddle_z_top = paddle_z + PADDLE_WIDTH / 2
 
             # Check if the ball's z position is within the paddle's z-axis range
             if paddle_z_bottom <= expected_z <= paddle_z_top:
@@ -160,12 +201,20 @@ class Ball:
     # takes a paddle as argument
     # updates the direction of the ball based on where it hits the paddle
     # and the direction it was going before collision
+    # speed and direction are worked out in locals and written once at the end,
+    # so the deltas are only recomputed once per bounce
     def bounce_from_paddle(self, paddle) -> float:
-        self.direction = self.direction % 360 # make sure direction is between 0 and 360
-        hitpos = (self.z - paddle.position.z) / (paddle.width / 2) # hitpos: where the ball hits the paddle
+        speed = self._speed
+        direction = self._direction % 360 # make sure direction is between 0 and 360
+        radians = math.radians(direction)
+        delta_z = math.sin(radians) * speed
+        going_left = math.cos(radians) < 0.0 # sign of delta_x, the speed ups below keep it
+        going_down = delta_z < 0.0 # sign of delta_z
+        # hitpos: where the ball hits the paddle
+        hitpos = (self._position._z - paddle._position._z) / (paddle._width / 2)
         speedboost = abs(hitpos) * 1.2
-        dz_factor = (self.delta_z / self.speed) * 10 # dz_factor: how much the ball is going up or down
-        direction_mod = abs((self.direction % 180) - 90) 
+        dz_factor = (delta_z / speed) * 10 # dz_factor: how much the ball is going up or down
+        direction_mod = abs((direction % 180) - 90)
         if direction_mod > MAX_BOUNCE_ANGLE_ADJUSTMENT:
             direction_mod = (MAX_BOUNCE_ANGLE_ADJUSTMENT * 2) - direction_mod # make sure direction_mod does not go above 80
         # direction_mod: absolute difference from a right angle (90 degrees)
@@ -178,46 +227,48 @@ class Ball:
         # if ball hits the middle of the paddle, it bounces with wider angle
         if hitpos >= 0 and hitpos < 0.2 or hitpos < 0 and hitpos > -.2:
             if (abs(hitpos) < 0.1):
-                self.speed_up(1.3)
+                speed += 1.3
             else:
-                self.speed_up(speedboost)
+                speed += speedboost
             logging.info(hitpos)
-            if self.delta_z < 0.0:
-                self.direction = 357 - (hitpos * adjustment) if self.delta_x < 0.0 else 177 - (hitpos * adjustment)
+            if going_down:
+                direction = (357 if going_left else 177) - (hitpos * adjustment)
             else:
-                self.direction = 3 + (hitpos * adjustment) if self.delta_x < 0.0 else 183 + (hitpos * adjustment)
+                direction = (3 if going_left else 183) + (hitpos * adjustment)
         else:
             speedboost = abs(hitpos) * 1.2
-            self.speed_up(speedboost)
-            if self.delta_z < 0.0: # if ball is going down
-                if self.direction > 270: # if ball is going right
+            speed += speedboost
+            if going_down: # if ball is going down
+                if direction > 270: # if ball is going right
                     if hitpos > 0.0: # if ball hits the top area of the paddle
-                        self.direction = 170 - adjustment * 0.5 # bounce to top left
+                        direction = 170 - adjustment * 0.5 # bounce to top left
                     else: # if ball hits the bottom area of the paddle
-                        self.direction = 190 + adjustment # bounce to bottom left
+                        direction = 190 + adjustment # bounce to bottom left
                 else: # if ball is going left
                     if hitpos > 0.0: # if ball hits the top of the paddle
-                        self.direction = 10 + adjustment * 0.5  # bounce to top right
+                        direction = 10 + adjustment * 0.5  # bounce to top right
                     else:
-                        self.direction = 350 - adjustment # bounce to bottom right
+                        direction = 350 - adjustment # bounce to bottom right
             else: # if ball is going up
-                if self.direction > 90: # if ball is going left
+                if direction > 90: # if ball is going left
                     if hitpos > 0.0: # if ball hits the top area of the paddle
-                        self.direction = 10 + adjustment # bounce to top right
+                        direction = 10 + adjustment # bounce to top right
                     else:
-                        self.direction = 350 - adjustment * 0.5 # bounce to bottom right
+                        direction = 350 - adjustment * 0.5 # bounce to bottom right
                 else: # if ball is going right
                     if hitpos > 0.0: # if ball hits the top area of the paddle
-                        self.direction = 170 - adjustment # bounce to top left
+                        direction = 170 - adjustment # bounce to top left
                     else: # if ball hits the bottom area of the paddle
-                        self.direction = 190 + adjustment * 0.5 # bounce to bottom left
-        self.direction = self.direction % 360 # make sure direction is between 0 and 360
+                        direction = 190 + adjustment * 0.5 # bounce to bottom left
+        self.set_motion(speed, direction % 360) # make sure direction is between 0 and 360
 
         return (abs(hitpos))
 
     # bounce_from_wall method
     # reflects the direction of the ball when it bounces from a wall
+    # mirroring the direction only flips the sign of delta_z, no need to recompute the deltas
     def bounce_from_wall(self) -> None:
-        self.direction = (360 - self.direction) % 360
+        self._direction = (360 - self._direction) % 360
+        self._delta_z = -self._delta_z
         # reflects the direction when ball bounces from wall
 
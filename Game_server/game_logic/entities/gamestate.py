@@ -1,6 +1,7 @@
 from game_logic.entities.player import Player
 from game_logic.entities.ball import Ball
 from game_logic.game_defaults import *
+import math
 import random
 import time
 import asyncio
@@ -17,8 +18,13 @@ import logging
 #   - current_rally: length of current rally so far
 #   - longest_rally: length of the longest rally in the game
 #   - paused: whether the game is paused or not
+#   - rng: the random generator of the serve directions, seeded to make a game reproducible
 class GameState:
-    def __init__(self, game_id: int, player1: Player, player2: Player, ball: Ball):
+    __slots__ = ('_game_id', '_player1', '_player2', '_ball', '_time_remaining', '_current_rally',
+                 '_longest_rally', '_paused', '_in_progress', '_bounce', '_hitpos', '_rng')
+
+    def __init__(self, game_id: int, player1: Player, player2: Player, ball: Ball,
+                 rng: random.Random = None):
         self._game_id: int = game_id
         self._player1: Player = player1
         self._player2: Player = player2
@@ -30,6 +36,7 @@ class GameState:
         self._in_progress: bool = True
         self._bounce: bool = False
         self._hitpos: float = 0.0
+        self._rng: random.Random = rng if rng is not None else random.Random()
     
     # getter for game_id
     @property
@@ -155,47 +162,87 @@ class GameState:
     # handles the collisions between the ball and the walls or paddles
     # and updates the ball's direction and player's hitcount accordingly
     def handle_collisions(self) -> None:
-        self.bounce = False
-        if self.ball.x < 0 or self.ball.x > FIELD_DEPTH:
+        self._bounce = False
+        ball = self._ball
+        x = ball._position._x
+        z = ball._position._z
+        if x < 0 or x > FIELD_DEPTH:
             return
-        if self.ball.z - BALL_RADIUS <= 0 or self.ball.z + BALL_RADIUS >= FIELD_WIDTH:
-            self.ball.bounce_from_wall()
-        elif self.ball.check_collision(self.player1.paddle):
-            self.player1.add_hit()
-            self.bounce = True
-            self.hitpos = self.ball.bounce_from_paddle(self.player1.paddle)
-        elif self.ball.check_collision(self.player2.paddle):
-            self.player2.add_hit()
-            self.bounce = True
-            self.hitpos = self.ball.bounce_from_paddle(self.player2.paddle)
+        if z - BALL_RADIUS <= 0 or z + BALL_RADIUS >= FIELD_WIDTH:
+            ball.bounce_from_wall()
+        elif ball.check_collision(self._player1._paddle):
+            self._player1.add_hit()
+            self._bounce = True
+            self._hitpos = ball.bounce_from_paddle(self._player1._paddle)
+        elif ball.check_collision(self._player2._paddle):
+            self._player2.add_hit()
+            self._bounce = True
+            self._hitpos = ball.bounce_from_paddle(self._player2._paddle)
             
+    # advance method
+    # moves the ball by dt physics frames with swept (continuous) collision detection
+    # instead of testing the next position only, the exact time of the next wall or paddle
+    # contact inside the step is computed, the ball is moved there, bounced, and the rest
+    # of the step continues with the new direction, so a fast ball can't tunnel through a paddle
+    # a ball that reaches the paddle plane outside of the paddle goes on towards the goal
+    def advance(self, dt: float) -> None:
+        self._bounce = False
+        ball = self._ball
+        remaining = dt
+        missed = False
+        for _ in range(MAX_COLLISIONS_PER_STEP):
+            time_to_wall = ball.time_to_wall()
+            if missed:
+                time_to_paddle, player_number = math.inf, None
+            else:
+                time_to_paddle, player_number = ball.time_to_paddle_plane()
+            contact = min(time_to_wall, time_to_paddle)
+            if contact > remaining:
+                break
+            ball.update_position(contact)
+            remaining -= contact
+            if time_to_wall <= time_to_paddle:
+                ball.bounce_from_wall()
+                continue
+            player = self._player1 if player_number == 1 else self._player2
+            paddle = player._paddle
+            if abs(ball._position._z - paddle._position._z) <= PADDLE_WIDTH / 2:
+                player.add_hit()
+                self._bounce = True
+                self._hitpos = ball.bounce_from_paddle(paddle)
+            else:
+                missed = True
+        ball.update_position(remaining)
+
     # check_goal method
     # checks if the ball has scored a goal
     # and updates the score of the appropriate player
     # returns True if a goal was scored, False otherwise
     def check_goal(self) -> None:
-        if self.ball.x < 0:
-            self.update_player_score(self.player2.id)
+        x = self._ball._position._x
+        if x < 0:
+            self.update_player_score(self._player2.id)
             return True
-        elif self.ball.x > FIELD_DEPTH:
-            self.update_player_score(self.player1.id)
+        elif x > FIELD_DEPTH:
+            self.update_player_score(self._player1.id)
             return True
         return False
 
     # reset_ball method
     # resets the ball to the center of the field
-    # and gives it a random direction
+    # and gives it a random direction, drawn from the game's own generator
     def reset_ball(self):
+        rng = self._rng
         if self.ball.x < 0:
-            self.ball.direction = random.randrange(-40, 40) #random direction towards player 2 
+            direction = rng.randrange(-40, 40) #random direction towards player 2
         elif self.ball.x > FIELD_DEPTH:
-            self.ball.direction = random.randrange(140, 220)  #random direction towards player 1
+            direction = rng.randrange(140, 220)  #random direction towards player 1
         else:
-            if random.random() >= .5:
-                self.ball.direction = random.randrange(-12, 12)
+            if rng.random() >= .5:
+                direction = rng.randrange(-12, 12)
             else:
-                self.ball.direction = random.randrange(168, 192)
-        self.ball.speed = BALL_SPEED
+                direction = rng.randrange(168, 192)
+        self.ball.set_motion(BALL_SPEED, direction)
         self.ball.position = BALL_DEFAULT_X, 0, BALL_DEFAULT_Z
 
     # is_game_over method
@@ -8,6 +8,8 @@ from game_logic.game_defaults import *
 #    - width: the width of the paddle (read only)
 #    - depth: the depth of the paddle (read only)
 class Paddle:
+    __slots__ = ('_position', '_width', '_depth')
+
     def __init__(self, x_position: float):
         self._position: Position = Position(x_position, 0, PLAYER_START_Z)
         self._width: float = PADDLE_WIDTH
@@ -49,10 +51,11 @@ class Paddle:
         ## TODO: make sure paddle doesn't move out of bounds
         if abs(delta_z) > PADDLE_SPEED:
             delta_z = PADDLE_SPEED
-        paddle_top = self.position.z + (PADDLE_WIDTH / 2)
-        paddle_bottom = self.position.z - (PADDLE_WIDTH / 2)
+        position = self._position
+        paddle_top = position._z + (PADDLE_WIDTH / 2)
+        paddle_bottom = position._z - (PADDLE_WIDTH / 2)
         if paddle_top + delta_z > FIELD_WIDTH:
             delta_z = FIELD_WIDTH - paddle_top
         elif paddle_bottom + delta_z < 0:
             delta_z = -paddle_bottom
-        self.position.move(0, 0, delta_z)
+        position._z += delta_z
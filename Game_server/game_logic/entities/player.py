@@ -7,6 +7,8 @@ from game_logic.entities.paddle import Paddle
 #   - paddle: the paddle of the player
 #   - score: the score of the player
 class Player:
+    __slots__ = ('_id', '_paddle', '_score', '_hits')
+
     def __init__(self, id: int, x_position: float):
         self._id: int = id
         self._paddle: Paddle = Paddle(x_position)
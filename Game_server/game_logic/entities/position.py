@@ -5,6 +5,8 @@
 #    - y: the y coordinate of the position
 #    - z: the z coordinate of the position
 class Position:
+    __slots__ = ('_x', '_y', '_z')
+
     def __init__(self, x: float, y: float, z: float):
         self._x: float = x
         self._y: float = y
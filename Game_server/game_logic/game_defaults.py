@@ -9,6 +9,11 @@ BALL_SPEED = 8.0
 
 PADDLE_SPEED = 9.0
 
+PHYSICS_RATE = 60 # ball and paddle speeds are in units per 1/60 second (one physics frame)
+                  # a server ticking at another rate moves the ball PHYSICS_RATE / TICK_RATE frames
+                  # per tick
+MAX_COLLISIONS_PER_STEP = 8 # upper bound of wall/paddle contacts resolved inside one swept step
+
 GAME_DURATION = 300 # game duration in seconds
                     # need to multiply this with something, set the result as gamestate.time_remaining
                     # and then subtract from it on every loop
@@ -0,0 +1,91 @@
+import math
+from game_logic.game_defaults import *
+
+WALL_EVENT = 'wall'
+PADDLE_EVENT = 'paddle'
+
+
+# RallySimulation class
+# Event-driven simulation of the ball during a rally
+# Between two contacts the ball moves in a straight line at constant speed, so instead of
+# moving it and testing for collisions every tick, the time of the next event is computed
+# analytically: a wall bounce, the ball reaching a paddle plane (hit or miss is decided
+# with the paddle position at that moment) or the ball crossing a goal line
+# Ticks without an event only compare two numbers, the ball entity is moved to the
+# current time only when the state is broadcast or a goal is scored (sync)
+# Follows the same rules as GameState.advance, so both give the same trajectory
+# Times are in physics frames since the start of the rally
+# Properties:
+#   - game_state: the game state of the rally
+#   - anchor_time: the time the ball entity's position is valid for
+#   - next_event_time / next_event: the next wall or paddle contact
+#   - goal_time: the time the ball crosses the goal line it is heading to
+#   - missed: whether the ball already passed a paddle plane without being hit
+class RallySimulation:
+    __slots__ = ('game_state', 'anchor_time', 'next_event_time', 'next_event', 'next_player',
+                 'goal_time', 'missed', 'events')
+
+    def __init__(self, game_state, now: float = 0.0):
+        self.game_state = game_state
+        self.anchor_time = now
+        self.missed = False
+        self.events = 0
+        self.schedule()
+
+    # schedule method
+    # computes the next event from the ball's position at anchor_time
+    def schedule(self) -> None:
+        ball = self.game_state.ball
+        time_to_wall = ball.time_to_wall()
+        if self.missed:
+            time_to_paddle, player_number = math.inf, None
+        else:
+            time_to_paddle, player_number = ball.time_to_paddle_plane()
+        if time_to_wall <= time_to_paddle:
+            self.next_event = WALL_EVENT
+            self.next_event_time = self.anchor_time + time_to_wall
+            self.next_player = None
+        else:
+            self.next_event = PADDLE_EVENT
+            self.next_event_time = self.anchor_time + time_to_paddle
+            self.next_player = player_number
+        delta_x = ball.delta_x
+        if delta_x < 0:
+            self.goal_time = self.anchor_time + ball.x / -delta_x
+        elif delta_x > 0:
+            self.goal_time = self.anchor_time + (FIELD_DEPTH - ball.x) / delta_x
+        else:
+            self.goal_time = math.inf
+
+    # advance_to method
+    # processes every event up to the given time
+    # sets the bounce flag, hitpos and hits of the game state like GameState.advance does
+    # returns True if the ball crossed a goal line by then (sync before checking the goal)
+    def advance_to(self, now: float) -> bool:
+        game_state = self.game_state
+        game_state.bounce = False
+        for _ in range(MAX_COLLISIONS_PER_STEP):
+            if self.next_event_time > now:
+                break
+            self.sync(self.next_event_time)
+            self.events += 1
+            ball = game_state.ball
+            if self.next_event == WALL_EVENT:
+                ball.bounce_from_wall()
+            else:
+                player = game_state.player1 if self.next_player == 1 else game_state.player2
+                if abs(ball.z - player.paddle.z) <= PADDLE_WIDTH / 2:
+                    player.add_hit()
+                    game_state.bounce = True
+                    game_state.hitpos = ball.bounce_from_paddle(player.paddle)
+                else:
+                    self.missed = True
+            self.schedule()
+        return now > self.goal_time
+
+    # sync method
+    # moves the ball entity to its position at the given time
+    def sync(self, now: float) -> None:
+        if now != self.anchor_time:
+            self.game_state.ball.update_position(now - self.anchor_time)
+            self.anchor_time = now
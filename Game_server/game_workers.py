@@ -0,0 +1,440 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.reduction import ForkingPickler
+
+GAME_WORKERS = int(os.environ.get('GAME_WORKERS', 0))   # 0 runs every game in the server process
+HASH_RING_REPLICAS = 64                                 # virtual nodes per worker on the hash ring
+WORKER_STATUS_INTERVAL = 0.5                            # seconds between two game count checks
+
+# Events routed to the worker that owns the game
+# start_game and join_game pick the worker from the game_id, the others follow the sid
+# spectate_game also picks the worker from the game_id, stop_spectating follows the watched game
+# request_keyframe of a spectator follows the watched game too
+GAME_ID_EVENTS = ('start_game', 'join_game')
+SID_EVENTS = ('move_paddle', 'quit_game', 'request_keyframe')
+SPECTATOR_EVENTS = ('spectate_game', 'stop_spectating')
+
+
+# HashRing class
+# Consistent hashing of game IDs onto workers
+# Every worker is placed on the ring HASH_RING_REPLICAS times, a game belongs to the
+# first worker clockwise from the hash of its ID, so changing the worker count only
+# moves the games of the added or removed worker
+class HashRing:
+    def __init__(self, nodes, replicas: int = HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self.ring = []
+        for node in nodes:
+            self.add(node)
+
+    # _hash method
+    # Maps a key to a position on the ring
+    @staticmethod
+    def _hash(key) -> int:
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+    # add method
+    # Places a node on the ring
+    def add(self, node) -> None:
+        for replica in range(self.replicas):
+            bisect.insort(self.ring, (self._hash(f"{node}:{replica}"), node))
+
+    # remove method
+    # Takes a node off the ring
+    def remove(self, node) -> None:
+        self.ring = [entry for entry in self.ring if entry[1] != node]
+
+    # node_for method
+    # Returns the node owning the given key
+    def node_for(self, key):
+        if not self.ring:
+            raise LookupError("Hash ring is empty")
+        index = bisect.bisect(self.ring, (self._hash(key), ))
+        if index == len(self.ring):
+            index = 0
+        return self.ring[index][1]
+
+
+# PipeWriter class
+# Sends messages over a multiprocessing connection from a thread of its own
+# Connection.send blocks while the pipe is full (the other process is busy), which would stall
+# every game of the event loop calling it. send() only pickles the message, so later changes to
+# the data are not sent, and queues it. The writer thread writes the messages in order
+# The messages are read with a PipeReader
+class PipeWriter:
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._write, name='pipe-writer', daemon=True)
+        self.thread.start()
+
+    def send(self, message) -> None:
+        self.queue.put(ForkingPickler.dumps(message))
+
+    # _write method
+    # Writer thread, runs until close() or until the connection is closed
+    def _write(self) -> None:
+        while True:
+            payload = self.queue.get()
+            if payload is None:
+                return
+            try:
+                self.conn.send_bytes(payload)
+            except (OSError, ValueError):
+                logging.error("Pipe closed, dropping the messages to the other process")
+                return
+
+    # close method
+    # Stops the writer thread once the queued messages are written
+    def close(self) -> None:
+        self.queue.put(None)
+
+
+# PipeReader class
+# Receives messages from a multiprocessing connection on a thread of its own
+# Connection.recv waits until the whole message arrived, so a message the other process has only
+# partly written would stall every game of the event loop reading it, even after poll() said the
+# pipe is readable. The reader thread receives the messages and hands them to the event loop in
+# order: on_message(message) is called on the loop for each of them, on_closed() once the other
+# end is closed
+class PipeReader:
+    def __init__(self, conn, loop, on_message, on_closed=None):
+        self.conn = conn
+        self.loop = loop
+        self.on_message = on_message
+        self.on_closed = on_closed
+        self.thread = threading.Thread(target=self._read, name='pipe-reader', daemon=True)
+        self.thread.start()
+
+    # _read method
+    # Reader thread, runs until the connection is closed or the event loop is gone
+    def _read(self) -> None:
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                if self.on_closed is not None:
+                    self._call(self.on_closed)
+                return
+            if not self._call(self.on_message, message):
+                return
+
+    # _call method
+    # Runs a callback on the event loop, returns False once the loop is closed
+    def _call(self, callback, *args) -> bool:
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            return False
+        return True
+
+
+# WorkerRelay class
+# Stands in for the Socket.IO server inside a game worker process
+# The game code calls emit/enter_room/leave_room/close_room as usual,
+# the relay forwards the calls to the front-end process that owns the sockets
+# through a PipeWriter, so a full pipe never blocks the worker's games
+class WorkerRelay:
+    def __init__(self, conn):
+        self.writer = PipeWriter(conn)
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, **kwargs):
+        self.writer.send(('emit', event, data, to or room, skip_sid))
+
+    async def enter_room(self, sid, room, namespace=None):
+        self.writer.send(('enter_room', sid, room))
+
+    async def leave_room(self, sid, room, namespace=None):
+        self.writer.send(('leave_room', sid, room))
+
+    async def close_room(self, room, namespace=None):
+        self.writer.send(('close_room', room))
+
+
+# install_relay function
+# Points the game server modules of this process at the relay
+def install_relay(relay) -> None:
+    import server
+    import server_utils
+    server.sio = relay
+    server_utils.sio = relay
+
+
+# worker_main function
+# Entry point of a game worker process
+# Receives ('event', name, sid, data) messages from the front end and runs the regular
+# event handlers of server.py on the worker's own games, until a 'stop' message arrives or the
+# front end closes the connection
+def worker_main(index: int, conn) -> None:
+    relay = WorkerRelay(conn)
+    install_relay(relay)
+    asyncio.run(_worker_loop(index, conn, relay))
+
+
+# report_games function
+# Sends ('status', index, games) to the front end whenever the number of games running on the
+# worker changed, checked every WORKER_STATUS_INTERVAL seconds
+async def report_games(index: int, relay) -> None:
+    import server
+    reported = None
+    while True:
+        games = len(server.active_games)
+        if games != reported:
+            relay.writer.send(('status', index, games))
+            reported = games
+        await asyncio.sleep(WORKER_STATUS_INTERVAL)
+
+
+# _worker_loop function
+# Event loop of a game worker, runs until the front end closes the connection
+async def _worker_loop(index: int, conn, relay) -> None:
+    import server
+    import server_utils
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    tasks = set()
+
+    def on_message(message):
+        kind, name, sid, data = message
+        if kind == 'stop':
+            on_closed()
+        if kind != 'event':
+            return
+        handler = getattr(server, name)
+        coro = handler(sid) if name == 'disconnect' else handler(sid, data)
+        task = loop.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def on_closed():
+        if not stopped.done():
+            stopped.set_result(None)
+
+    if server.result_writer.spool_path:
+        # each worker saves the results of its own games, with its own spool
+        server.result_writer.spool_path += f".worker{index}"
+    await server_utils.start_background_tasks()
+    PipeReader(conn, loop, on_message, on_closed)
+    reporter = asyncio.create_task(report_games(index, relay))
+    logging.info(f"Game worker {index} started (pid {os.getpid()})")
+    await stopped
+    reporter.cancel()
+    await server_utils.stop_background_tasks()
+
+
+# WorkerPool class
+# Runs GAME_WORKERS game worker processes and routes game events to them
+# The front-end process keeps every socket, the workers run the games
+# Properties:
+#   - size: the number of workers
+#   - ring: consistent hash ring mapping game IDs to workers
+#   - pipes: the front end's ends of the worker pipes, the workers' messages are read from them
+#   - connections: a PipeWriter per worker, events are sent to the workers through them
+#   - readers: a PipeReader per worker, started by listen()
+#   - sid_to_worker: the worker each session's game runs on
+#   - spectator_to_worker: the worker running the game each spectator session watches
+#   - worker_games: the number of games running on each worker, as last reported by the worker
+class WorkerPool:
+    def __init__(self, size: int):
+        self.size = size
+        self.ring = HashRing(range(size))
+        self.pipes = []
+        self.connections = []
+        self.readers = []
+        self.processes = []
+        self.sid_to_worker = {}
+        self.spectator_to_worker = {}
+        self.worker_games = [0] * size
+        self.sio = None
+        self._outbox = None
+
+    # start method
+    # Forks the worker processes, must run before the server starts any thread or event loop
+    # The writer threads are started once every worker is forked
+    def start(self) -> None:
+        context = multiprocessing.get_context('fork')
+        for index in range(self.size):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=worker_main, args=(index, child_conn), daemon=True,
+                                      name=f"game-worker-{index}")
+            process.start()
+            child_conn.close()
+            self.pipes.append(parent_conn)
+            self.processes.append(process)
+        self.connections = [PipeWriter(conn) for conn in self.pipes]
+
+    # attach method
+    # Replaces the game event handlers of the Socket.IO server with forwarders to the workers
+    def attach(self, sio) -> None:
+        self.sio = sio
+        for name in GAME_ID_EVENTS + SID_EVENTS + SPECTATOR_EVENTS:
+            sio.on(name, self._forwarder(name))
+        sio.on('disconnect', self.forward_disconnect)
+
+    # listen method
+    # Starts relaying the workers' emits on the server's event loop
+    # Messages of a worker are replayed in order by a single pump task
+    async def listen(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue()
+        self.readers = [PipeReader(conn, loop, self._outbox.put_nowait, self._on_closed)
+                        for conn in self.pipes]
+        asyncio.create_task(self._pump())
+
+    # _forwarder method
+    # Returns a Socket.IO event handler forwarding the event to the owning worker
+    def _forwarder(self, name):
+        async def forward(sid, data=None):
+            await self.forward(name, sid, data)
+        return forward
+
+    # worker_for method
+    # Returns the index of the worker that owns the event's game
+    # A spectator moving to a game of another worker is detached from its previous game first
+    def worker_for(self, name, sid, data):
+        if name in GAME_ID_EVENTS and isinstance(data, dict):
+            worker = self.ring.node_for(data.get('game_id'))
+            self.sid_to_worker[sid] = worker
+            return worker
+        if name == 'spectate_game' and isinstance(data, dict):
+            worker = self.ring.node_for(data.get('game_id'))
+            previous = self.spectator_to_worker.get(sid)
+            if previous is not None and previous != worker:
+                self.connections[previous].send(('event', 'stop_spectating', sid, None))
+            self.spectator_to_worker[sid] = worker
+            return worker
+        if name in SPECTATOR_EVENTS:
+            return self.spectator_to_worker.get(sid)
+        if name == 'request_keyframe' and sid not in self.sid_to_worker:
+            return self.spectator_to_worker.get(sid)
+        return self.sid_to_worker.get(sid)
+
+    # forward method
+    # Sends a game event to the owning worker
+    async def forward(self, name, sid, data) -> None:
+        worker = self.worker_for(name, sid, data)
+        if worker is None:
+            await self.sio.emit('error', {'message': 'No active game instance'}, room=sid)
+            logging.error(f"No game worker for sid: {sid}")
+            return
+        self.connections[worker].send(('event', name, sid, data))
+
+    # forward_disconnect method
+    # Lets the owning worker clean up after a disconnected session
+    async def forward_disconnect(self, sid, *args) -> None:
+        logging.info(f'Disconnect: {sid}')
+        worker = self.sid_to_worker.pop(sid, None)
+        if worker is not None:
+            self.connections[worker].send(('event', 'disconnect', sid, None))
+        spectated = self.spectator_to_worker.pop(sid, None)
+        if spectated is not None and spectated != worker:
+            self.connections[spectated].send(('event', 'disconnect', sid, None))
+
+    # running_games method
+    # Returns the number of games running on all workers
+    def running_games(self) -> int:
+        return sum(self.worker_games)
+
+    # _on_closed method
+    # Called when the connection to a worker is closed
+    @staticmethod
+    def _on_closed() -> None:
+        logging.error("Game worker connection closed")
+
+    # _pump method
+    # Replays the workers' messages on the Socket.IO server
+    async def _pump(self) -> None:
+        while True:
+            message = await self._outbox.get()
+            try:
+                await self._apply(message)
+            except Exception as e:
+                logging.error(f"Error relaying worker message {message[0]}: {e}")
+
+    # _apply method
+    # Runs one relayed server call
+    async def _apply(self, message) -> None:
+        kind = message[0]
+        if kind == 'emit':
+            _, event, data, room, skip_sid = message
+            await self.sio.emit(event, data, room=room, skip_sid=skip_sid)
+        elif kind == 'enter_room':
+            await self.sio.enter_room(message[1], message[2])
+        elif kind == 'leave_room':
+            await self.sio.leave_room(message[1], message[2])
+        elif kind == 'close_room':
+            await self.sio.close_room(message[1])
+        elif kind == 'status':
+            self.worker_games[message[1]] = message[2]
+
+    # stop method
+    # Stops the worker processes
+    # The pipes are closed once the workers exited, so no reader thread is still receiving on them
+    def stop(self) -> None:
+        for writer in self.connections:
+            writer.send(('stop', None, None, None))
+            writer.close()
+        for writer in self.connections:
+            writer.thread.join(timeout=1.0)
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=1.0)
+        for reader in self.readers:
+            reader.thread.join(timeout=1.0)
+        for conn in self.pipes:
+            conn.close()
+
+
+# NullEmitter class
+# Relay that drops everything, used to measure raw game throughput
+class NullEmitter:
+    async def emit(self, *args, **kwargs):
+        pass
+
+    async def enter_room(self, *args, **kwargs):
+        pass
+
+    async def leave_room(self, *args, **kwargs):
+        pass
+
+    async def close_room(self, *args, **kwargs):
+        pass
+
+
+# run_headless function
+# Runs the given number of games in this process as fast as possible for 'duration' seconds
+# Every game has one JSON client, so state frames are built as in production
+# Returns the number of game ticks stepped
+def run_headless(games: int, duration: float, first_game_id: int = 1) -> int:
+    install_relay(NullEmitter())
+    from server import PongGame
+
+    async def run():
+        instances = []
+        for game_id in range(first_game_id, first_game_id + games):
+            game = PongGame(game_id, game_id * 10 + 1, game_id * 10 + 2, False)
+            await game.add_player(f"sid{game_id}", game.game_state.player1.id)
+            game.start_rally()
+            instances.append(game)
+        ticks = 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            for game in instances:
+                await game.tick()
+                if not game.game_state.in_progress:
+                    game.game_state.in_progress = True
+                    game.game_state.player1.score = game.game_state.player2.score = 0
+                    game.start_rally()
+            ticks += len(instances)
+        return ticks
+
+    return asyncio.run(run())
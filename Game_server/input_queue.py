@@ -0,0 +1,62 @@
+from collections import deque
+import time
+
+MAX_QUEUED_INPUTS = 8           # inputs kept per player between two ticks, oldest dropped first
+MAX_INPUTS_PER_SECOND = 120     # inputs accepted per connection per second
+INPUT_BURST = 30                # inputs a connection can send back to back before being limited
+
+# InputQueue class
+# Bounded queue of paddle inputs of one player
+# Inputs are pushed by the move_paddle handler and drained once per tick
+# Properties:
+#   - inputs: the queued paddle deltas
+#   - dropped: number of inputs dropped because the queue was full
+class InputQueue:
+    def __init__(self, max_size: int = MAX_QUEUED_INPUTS):
+        self.inputs = deque(maxlen=max_size)
+        self.dropped = 0
+
+    # push method
+    # Adds a paddle delta to the queue, dropping the oldest input when the queue is full
+    def push(self, delta_z: float) -> None:
+        if len(self.inputs) == self.inputs.maxlen:
+            self.dropped += 1
+        self.inputs.append(delta_z)
+
+    # drain method
+    # Empties the queue and returns the merged paddle delta of all queued inputs
+    def drain(self) -> float:
+        merged = sum(self.inputs)
+        self.inputs.clear()
+        return merged
+
+    def __len__(self) -> int:
+        return len(self.inputs)
+
+
+# InputRateLimiter class
+# Token bucket limiting how many inputs one connection can submit per second
+# Properties:
+#   - rate: tokens added per second
+#   - capacity: maximum number of tokens, the allowed burst
+#   - rejected: number of inputs rejected so far
+class InputRateLimiter:
+    def __init__(self, rate: float = MAX_INPUTS_PER_SECOND, capacity: float = INPUT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.rejected = 0
+
+    # allow method
+    # Returns True if the connection may submit another input right now
+    def allow(self, now: float = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.rejected += 1
+        return False
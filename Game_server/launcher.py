@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import time
+import uvicorn
+
+# Runtime settings of the game server process
+# PRODUCTION=1 switches the defaults to the production setup: uvloop event loop, httptools HTTP
+# parser, WebSocket-only Socket.IO transport without per-message compression, and warning-level
+# logs
+# Every setting can still be overridden on its own
+PRODUCTION = os.environ.get('PRODUCTION', '0') == '1'
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 8010))
+# uvloop, asyncio or auto (uvloop when installed)
+EVENT_LOOP = os.environ.get('EVENT_LOOP', 'uvloop' if PRODUCTION else 'auto')
+# httptools, h11 or auto (httptools when installed)
+HTTP_PARSER = os.environ.get('HTTP_PARSER', 'httptools' if PRODUCTION else 'auto')
+# websockets-sansio, websockets, wsproto or auto
+WS_IMPLEMENTATION = os.environ.get('WS_IMPLEMENTATION',
+                                   'websockets-sansio' if PRODUCTION else 'auto')
+# Engine.IO transports offered to the clients
+SOCKETIO_TRANSPORTS = os.environ.get('SOCKETIO_TRANSPORTS',
+                                     'websocket' if PRODUCTION else 'polling,websocket').split(',')
+# compress WebSocket messages
+WS_PER_MESSAGE_DEFLATE = os.environ.get('WS_PER_MESSAGE_DEFLATE',
+                                        '0' if PRODUCTION else '1') == '1'
+# largest accepted client message (bytes)
+WS_MAX_MESSAGE_SIZE = int(os.environ.get('WS_MAX_MESSAGE_SIZE', 64 * 1024))
+# level of the per-event logs (connects, game starts...)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'warning' if PRODUCTION else 'info').lower()
+# seconds running games get to finish on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 60))
+DRAIN_POLL_INTERVAL = 0.5
+
+
+# DrainingServer class
+# uvicorn server that lets the running games finish before it shuts down
+# On SIGTERM/SIGINT the listening sockets are closed first, so no new client connects,
+# on_drain() is called (the server stops accepting new games), and the shutdown waits until
+# running_games() returns 0 or SHUTDOWN_DRAIN_TIMEOUT passes
+# Only then are the connections closed and the app's shutdown callbacks run
+# A second signal skips the rest of the drain, like it skips uvicorn's own graceful shutdown
+class DrainingServer(uvicorn.Server):
+    def __init__(self, config, running_games=None, on_drain=None,
+                 drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        super().__init__(config)
+        self.running_games = running_games
+        self.on_drain = on_drain
+        self.drain_timeout = drain_timeout
+
+    async def shutdown(self, sockets=None) -> None:
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        await self.drain()
+        await super().shutdown(sockets)
+
+    # drain method
+    # Waits for the running games to finish
+    async def drain(self) -> None:
+        if self.on_drain is not None:
+            self.on_drain()
+        if self.running_games is None:
+            return
+        deadline = time.monotonic() + self.drain_timeout
+        running = self.running_games()
+        if running:
+            logging.warning(f"Waiting up to {self.drain_timeout:.0f} s for {running} running "
+                            f"game(s) to finish")
+        while running and time.monotonic() < deadline and not self.force_exit:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+            running = self.running_games()
+        if running:
+            logging.warning(f"Shutting down with {running} game(s) still running")
+
+
+# server_config function
+# Returns the uvicorn configuration of the game server from the settings above
+def server_config(app, log_config=None) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        loop=EVENT_LOOP,
+        http=HTTP_PARSER,
+        ws=WS_IMPLEMENTATION,
+        ws_max_size=WS_MAX_MESSAGE_SIZE,
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+        ws_ping_interval=None,      # Engine.IO sends its own pings
+        log_level=LOG_LEVEL,
+        log_config=log_config,
+        access_log=False,
+    )
+
+
+# run function
+# Runs the app until the process is asked to stop, then drains the running games
+def run(app, log_config=None, running_games=None, on_drain=None) -> None:
+    config = server_config(app, log_config)
+    logging.info(f"Serving on {SERVER_HOST}:{SERVER_PORT} (loop: {EVENT_LOOP}, "
+                 f"http: {HTTP_PARSER}, websocket: {WS_IMPLEMENTATION}, "
+                 f"transports: {','.join(SOCKETIO_TRANSPORTS)}, "
+                 f"per-message deflate: {WS_PER_MESSAGE_DEFLATE})")
+    DrainingServer(config, running_games, on_drain).run()
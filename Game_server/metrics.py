@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+import os
+import time
+from send_queue import packet_event
+
+# serve /metrics and collect the metrics below
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1'
+METRICS_PATH = '/metrics'
+LOOP_LAG_INTERVAL = 0.5     # seconds between two event-loop lag probes
+
+# Histogram buckets (upper bounds, seconds or bytes)
+TICK_BUCKETS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066, 0.1, 0.25)
+LATENESS_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.017, 0.033, 0.05, 0.1, 0.25, 1.0)
+EMIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+TOKEN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+GAME_BYTES_BUCKETS = (1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 1e8)
+
+
+# format_value function
+# Formats a sample value like the Prometheus text format expects
+def format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# format_labels function
+# Returns the {name="value",...} part of a sample, or '' without labels
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    pairs = (f'{name}="{escape_label_value(value)}"' for name, value in labels)
+    return '{' + ','.join(pairs) + '}'
+
+
+# escape_label_value function
+# Escapes backslashes, quotes and newlines in a label value
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Counter class
+# A value that only goes up, optionally split by one label
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, label: str = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {} if label else {None: 0}
+
+    def inc(self, amount: float = 1, label_value=None) -> None:
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        for label_value, value in self.values.items():
+            labels = ((self.label, label_value),) if self.label else ()
+            yield self.name, labels, value
+
+
+# Gauge class
+# A value read from a function when the metrics are scraped
+# Used for sizes of the server's dictionaries and counters kept elsewhere, which cost nothing
+# to collect
+# With a label, read returns a dictionary of label value -> value
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, read, type: str = 'gauge', label: str = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.type = type
+        self.label = label
+
+    def samples(self):
+        if not self.label:
+            yield self.name, (), self.read()
+            return
+        for label_value, value in self.read().items():
+            yield self.name, ((self.label, label_value),), value
+
+
+# Histogram class
+# Pre-aggregated histogram, optionally split by one label
+# observe() only finds the bucket with a binary search and bumps two numbers,
+# the cumulative bucket counts are computed when the metrics are scraped
+# Properties:
+#   - buckets: the bucket upper bounds, +Inf is implicit
+#   - series: label value -> [bucket counts, sum, count]
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets, label: str = None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.series = {}
+
+    def observe(self, value: float, label_value=None) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for label_value, (counts, total, count) in self.series.items():
+            labels = ((self.label, label_value),) if self.label else ()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', format_value(float(bound))),)
+                yield self.name + '_bucket', bucket_labels, cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+# MetricsRegistry class
+# Holds the metrics of the process and renders them in the Prometheus text format
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, label: str = None) -> Counter:
+        return self.register(Counter(name, help, label))
+
+    def gauge(self, name: str, help: str, read, type: str = 'gauge', label: str = None) -> Gauge:
+        return self.register(Gauge(name, help, read, type, label))
+
+    def histogram(self, name: str, help: str, buckets, label: str = None) -> Histogram:
+        return self.register(Histogram(name, help, buckets, label))
+
+    # render method
+    # Returns every metric in the Prometheus text exposition format
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of this server process
+registry = MetricsRegistry()
+tick_duration = registry.histogram(
+    'game_server_tick_duration_seconds', 'Time spent stepping every game once', TICK_BUCKETS)
+tick_lateness = registry.histogram(
+    'game_server_tick_lateness_seconds', 'How late ticks start after their deadline',
+    LATENESS_BUCKETS)
+emit_duration = registry.histogram(
+    'game_server_emit_duration_seconds', 'Time spent in sio.emit per event type', EMIT_BUCKETS,
+    label='event')
+sent_bytes = registry.counter(
+    'game_server_sent_bytes_total', 'Socket.IO message bytes sent to clients')
+game_sent_bytes = registry.histogram(
+    'game_server_game_sent_bytes',
+    'Socket.IO message bytes sent to the clients of a game over its lifetime', GAME_BYTES_BUCKETS)
+game_event_bytes = registry.counter(
+    'game_server_game_sent_bytes_total',
+    'Socket.IO message bytes sent to the clients of running games per event', label='event')
+token_validation = registry.histogram(
+    'game_server_token_validation_seconds', 'Token service request latency', TOKEN_BUCKETS)
+loop_lag = registry.histogram(
+    'game_server_event_loop_lag_seconds', 'How late the event loop wakes up a sleeping task',
+    LOOP_LAG_BUCKETS)
+
+# Bytes sent so far to the sessions of each running game, moved to game_sent_bytes when the
+# game ends
+game_bytes = {}
+
+
+# record_tick function
+# Scheduler tick listener
+def record_tick(duration: float, lateness: float) -> None:
+    tick_duration.observe(duration)
+    tick_lateness.observe(lateness)
+
+
+# record_token_latency function
+# Token validator latency listener
+def record_token_latency(latency: float) -> None:
+    token_validation.observe(latency)
+
+
+# finish_game function
+# Moves the bytes sent to a game's sessions into the per-game histogram
+def finish_game(game_id) -> None:
+    sent = game_bytes.pop(game_id, None)
+    if sent is not None:
+        game_sent_bytes.observe(sent)
+
+
+# instrument_server function
+# Wraps the emit of the Socket.IO server to time it per event, and the Engine.IO packet send
+# to count the bytes of every message (room emits are encoded once and sent once per session)
+# Bytes sent to the sessions of a game go to game_event_bytes as they are sent, by event, which
+# also tells the protocols apart (send_game_state, send_game_state_v2, state_delta)
+# The attachments of a binary event count for the event
+# game_of_sid returns the game ID of a Socket.IO session, or None
+def instrument_server(sio, game_of_sid) -> None:
+    emit = sio.emit
+    send_packet = sio.eio.send_packet
+    manager = sio.manager
+    # Engine.IO session ID -> [event, attachments still to come] of the last binary event
+    attachments = {}
+
+    async def timed_emit(event, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await emit(event, *args, **kwargs)
+        finally:
+            emit_duration.observe(time.perf_counter() - start, event)
+
+    def event_of(eio_sid, data):
+        pending = attachments.get(eio_sid)
+        if pending is not None:
+            pending[1] -= 1
+            if pending[1] <= 0:
+                del attachments[eio_sid]
+            return pending[0]
+        event, count = packet_event(data)
+        if count:
+            attachments[eio_sid] = [event, count]
+        return event
+
+    async def counted_send_packet(eio_sid, pkt):
+        data = pkt.data
+        if isinstance(data, (str, bytes)):
+            size = len(data)
+            sent_bytes.inc(size)
+            event = event_of(eio_sid, data)
+            game_id = game_of_sid(manager.sid_from_eio_sid(eio_sid, '/'))
+            if game_id is not None:
+                game_bytes[game_id] = game_bytes.get(game_id, 0) + size
+                game_event_bytes.inc(size, event or 'other')
+        await send_packet(eio_sid, pkt)
+
+    sio.emit = timed_emit
+    sio.eio.send_packet = counted_send_packet
+
+
+# monitor_loop_lag function
+# Background task measuring how much later than asked the event loop wakes up a sleeping task
+# A busy loop (long ticks, blocking calls) shows up here before anything else
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - start - interval))
+
+
+# metrics_app function
+# ASGI app serving the metrics on METRICS_PATH, mounted next to the Socket.IO app
+async def metrics_app(scope, receive, send) -> None:
+    if scope['type'] != 'http':
+        return
+    if scope['path'] != METRICS_PATH or scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
+        return
+    body = registry.render().encode()
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,275 @@
+import os
+import struct
+
+# State frame protocol versions
+# Clients pick a version with the 'protocol' key of their start_game/join_game data
+#   - 1: JSON 'send_game_state' dictionaries (default, used when no version is given)
+#   - 2: fixed-layout binary 'send_game_state_v2' frames
+#   - 3: JSON 'state_delta' frames, periodic keyframes with only changed fields in between
+PROTOCOL_JSON = 1
+PROTOCOL_BINARY = 2
+PROTOCOL_DELTA = 3
+DEFAULT_PROTOCOL = PROTOCOL_JSON
+SUPPORTED_PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA)
+
+# Optional features, asked for with the 'features' list of the start_game/join_game data
+# They work with every state frame protocol, clients that don't list a feature get the old
+# behaviour
+#   - goal_animation: after a goal the client gets one 'goal_animation' event with the ball's
+#     trajectory and animates the ball through the goal itself, instead of getting state frames
+#     during the animation
+FEATURE_GOAL_ANIMATION = 'goal_animation'
+SUPPORTED_FEATURES = frozenset((FEATURE_GOAL_ANIMATION,))
+
+# Binary state frame layout (little-endian, 24 bytes)
+#   u8  version         always PROTOCOL_BINARY
+#   u8  flags           bit 0: bounce, bit 1: paused, bit 2: server time follows,
+#                       bit 3: input acknowledgement follows
+#   u32 game_id
+#   u32 tick            game tick number the frame was produced on
+#   i16 ball_x, ball_z  quantized with POSITION_SCALE
+#   i16 ball_dx, ball_dz  quantized with DELTA_SCALE
+#   i16 player1_z, player2_z  quantized with POSITION_SCALE
+#   u16 hitpos          quantized with HITPOS_SCALE
+# Optional trailers follow in this order when their flag is set:
+#   f64 server_time     server time of the tick in ms (see tick_scheduler.server_time)
+#   u32 player1_seq, player2_seq  sequence number of the last processed input of each player,
+#                       sent once the clients of the game number their inputs
+# Clients that only read the first 24 bytes keep working
+STATE_FRAME = struct.Struct('<BBIIhhhhhhH')
+STATE_FRAME_SIZE = STATE_FRAME.size
+SERVER_TIME = struct.Struct('<d')
+INPUT_ACK = struct.Struct('<II')
+
+POSITION_SCALE = 8      # 1/8 unit precision, covers -4096..4095
+DELTA_SCALE = 256       # 1/256 unit per tick precision, covers -128..127
+HITPOS_SCALE = 10000    # covers 0..6.5
+
+FLAG_BOUNCE = 0x01
+FLAG_PAUSED = 0x02
+FLAG_SERVER_TIME = 0x04
+FLAG_INPUT_ACK = 0x08
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+UINT16_MAX = 65535
+UINT32_MAX = 4294967295
+
+
+# negotiate_protocol function
+# Returns the state frame protocol requested in the handshake data
+# Falls back to the JSON protocol for missing or unsupported versions
+def negotiate_protocol(data) -> int:
+    protocol = data.get('protocol') if isinstance(data, dict) else None
+    if protocol in SUPPORTED_PROTOCOLS:
+        return protocol
+    return DEFAULT_PROTOCOL
+
+
+# negotiate_features function
+# Returns the supported features requested in the handshake data, unknown ones are ignored
+def negotiate_features(data) -> frozenset:
+    features = data.get('features') if isinstance(data, dict) else None
+    if not isinstance(features, (list, tuple)):
+        return frozenset()
+    return SUPPORTED_FEATURES.intersection(feature for feature in features
+                                           if isinstance(feature, str))
+
+
+# supports_binary function
+# Binary frames carry the game id as an u32, other game ids have to use JSON frames
+def supports_binary(game_id) -> bool:
+    return isinstance(game_id, int) and 0 <= game_id <= UINT32_MAX
+
+
+# _quantize function
+# Scales a float to a fixed-point int16, clamping values outside of the range
+def _quantize(value: float, scale: int) -> int:
+    return max(INT16_MIN, min(INT16_MAX, round(value * scale)))
+
+
+# encode_state_v2 function
+# Packs the game state into a binary state frame
+# server_time: server time of the tick in ms, or None
+# input_seqs: (player1_seq, player2_seq) acknowledged by the frame, or None
+def encode_state_v2(game_state, tick: int, input_seqs=None, server_time: float = None) -> bytes:
+    ball = game_state.ball
+    flags = 0
+    if game_state.bounce:
+        flags |= FLAG_BOUNCE
+    if game_state.paused:
+        flags |= FLAG_PAUSED
+    if server_time is not None:
+        flags |= FLAG_SERVER_TIME
+    if input_seqs is not None:
+        flags |= FLAG_INPUT_ACK
+    frame = STATE_FRAME.pack(
+        PROTOCOL_BINARY,
+        flags,
+        game_state.game_id,
+        tick & UINT32_MAX,
+        _quantize(ball.x, POSITION_SCALE),
+        _quantize(ball.z, POSITION_SCALE),
+        _quantize(ball.delta_x, DELTA_SCALE),
+        _quantize(ball.delta_z, DELTA_SCALE),
+        _quantize(game_state.player1.paddle.z, POSITION_SCALE),
+        _quantize(game_state.player2.paddle.z, POSITION_SCALE),
+        min(UINT16_MAX, round(abs(game_state.hitpos) * HITPOS_SCALE)),
+    )
+    if server_time is not None:
+        frame += SERVER_TIME.pack(server_time)
+    if input_seqs is not None:
+        frame += INPUT_ACK.pack(input_seqs[0] & UINT32_MAX, input_seqs[1] & UINT32_MAX)
+    return frame
+
+
+# decode_state_v2 function
+# Unpacks a binary state frame into the same dictionary shape as the JSON 'send_game_state'
+# Mirrors decodeGameState in Frontend/src/js/pong/socket.js, used by tests and tools
+def decode_state_v2(frame: bytes, player1_x: float = 0.0, player2_x: float = 0.0) -> dict:
+    (version, flags, game_id, tick, ball_x, ball_z, ball_dx, ball_dz,
+     player1_z, player2_z, hitpos) = STATE_FRAME.unpack_from(frame)
+    if version != PROTOCOL_BINARY:
+        raise ValueError(f"Unsupported state frame version: {version}")
+    state = {
+        'type': 'send_game_state',
+        'gameId': game_id,
+        'tick': tick,
+        'ballPosition': {
+            'x': ball_x / POSITION_SCALE,
+            'y': 0,
+            'z': ball_z / POSITION_SCALE,
+        },
+        'ballDelta': {
+            'dx': ball_dx / DELTA_SCALE,
+            'dz': ball_dz / DELTA_SCALE,
+        },
+        'player1Pos': {
+            'x': player1_x,
+            'z': player1_z / POSITION_SCALE,
+        },
+        'player2Pos': {
+            'x': player2_x,
+            'z': player2_z / POSITION_SCALE,
+        },
+        'bounce': bool(flags & FLAG_BOUNCE),
+        'hitpos': hitpos / HITPOS_SCALE,
+        'paused': bool(flags & FLAG_PAUSED),
+    }
+    offset = STATE_FRAME_SIZE
+    if flags & FLAG_SERVER_TIME:
+        state['serverTime'], = SERVER_TIME.unpack_from(frame, offset)
+        offset += SERVER_TIME.size
+    if flags & FLAG_INPUT_ACK:
+        state['player1Seq'], state['player2Seq'] = INPUT_ACK.unpack_from(frame, offset)
+    return state
+
+
+# Delta frames
+# Every frame carries the game id ('g'), a sequence number ('s') that grows by one per frame,
+# the game tick ('t') it was produced on and the server time of that tick in ms ('ts')
+# Keyframes ('k': True) carry every field, delta frames only the fields that changed
+# since the previous frame:
+#   - bx, bz: ball position    - dx, dz: ball delta
+#   - p1, p2: paddle z         - b: bounce, h: hitpos, p: paused
+#   - a1, a2: sequence number of the last processed input of each player, only in games
+#     whose clients number their inputs
+# A client that sees a gap in the sequence numbers sends 'request_keyframe'
+# Deltas are taken against the last frame produced, not the last one each client acknowledged,
+# so a client that missed a frame cannot use any delta until its keyframe arrives (one round
+# trip). That keyframe is a state frame too, which a full send queue may drop, so a request also
+# brings the stream's next keyframe forward to at most RECOVERY_KEYFRAME_INTERVAL frames away
+KEYFRAME_INTERVAL = int(os.environ.get('KEYFRAME_INTERVAL', 60))   # frames between keyframes
+RECOVERY_KEYFRAME_INTERVAL = 10     # most frames to the next keyframe after a client missed one
+DELTA_PRECISION = 3                                                 # decimals kept for coordinates
+
+
+# delta_fields function
+# Returns the flat, rounded fields of the game state used by delta frames
+def delta_fields(game_state) -> dict:
+    ball = game_state.ball
+    return {
+        'bx': round(ball.x, DELTA_PRECISION),
+        'bz': round(ball.z, DELTA_PRECISION),
+        'dx': round(ball.delta_x, DELTA_PRECISION),
+        'dz': round(ball.delta_z, DELTA_PRECISION),
+        'p1': round(game_state.player1.paddle.z, DELTA_PRECISION),
+        'p2': round(game_state.player2.paddle.z, DELTA_PRECISION),
+        'b': game_state.bounce,
+        'h': round(game_state.hitpos, DELTA_PRECISION),
+        'p': game_state.paused,
+    }
+
+
+# DeltaEncoder class
+# Produces the delta frame stream of one game
+# Properties:
+#   - game_id: the ID of the game
+#   - keyframe_interval: number of frames between two keyframes
+#   - seq: sequence number of the last produced frame
+#   - server_time: server time of the tick of the last produced frame
+#   - last_fields: the fields of the last produced frame
+#   - keyframe_due: whether the next frame has to be a keyframe
+class DeltaEncoder:
+    def __init__(self, game_id, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.game_id = game_id
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.seq = 0
+        self.tick = 0
+        self.server_time = None
+        self.last_fields = None
+        self.frames_since_keyframe = 0
+        self.keyframe_due = True
+
+    # encode method
+    # Returns the next frame for the game state, a keyframe when one is due
+    # input_seqs: (player1_seq, player2_seq) acknowledged by the frame, or None
+    # server_time: server time of the tick in ms, or None
+    def encode(self, game_state, tick: int, input_seqs=None, server_time: float = None) -> dict:
+        fields = delta_fields(game_state)
+        if input_seqs is not None:
+            fields['a1'], fields['a2'] = input_seqs
+        self.seq += 1
+        self.tick = tick
+        self.server_time = server_time
+        if (self.keyframe_due or self.last_fields is None
+                or self.frames_since_keyframe >= self.keyframe_interval):
+            self.last_fields = fields
+            self.keyframe_due = False
+            self.frames_since_keyframe = 0
+            return self.keyframe()
+        frame = self.header()
+        for key, value in fields.items():
+            if self.last_fields.get(key) != value:
+                frame[key] = value
+        self.last_fields = fields
+        self.frames_since_keyframe += 1
+        return frame
+
+    # keyframe method
+    # Returns a keyframe for the last produced frame, or None if nothing was produced yet
+    # Sent to a single client that asked for it, the following deltas apply on top of it
+    def keyframe(self):
+        if self.last_fields is None:
+            return None
+        return {**self.header(), 'k': True, **self.last_fields}
+
+    # header method
+    # Returns the keys every frame starts with
+    def header(self) -> dict:
+        header = {'g': self.game_id, 's': self.seq, 't': self.tick}
+        if self.server_time is not None:
+            header['ts'] = self.server_time
+        return header
+
+    # request_keyframe method
+    # Makes the next produced frame a keyframe, used when a new client joins the stream
+    def request_keyframe(self) -> None:
+        self.keyframe_due = True
+
+    # frame_missed method
+    # Brings the next keyframe forward to at most RECOVERY_KEYFRAME_INTERVAL frames away
+    # Called when a client asks for a keyframe, requests in between do not add keyframes
+    def frame_missed(self) -> None:
+        self.frames_since_keyframe = max(self.frames_since_keyframe,
+                                         self.keyframe_interval - RECOVERY_KEYFRAME_INTERVAL)
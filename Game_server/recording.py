@@ -0,0 +1,371 @@
+import asyncio
+import glob
+import io
+import json
+import logging
+import os
+import struct
+import sys
+import time
+
+# directory game recordings are written to, off when unset
+RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR')
+RECORDING_FLUSH_BYTES = 4096    # buffered record bytes written to the file at once
+MAX_REPLAY_SPEED = 16.0         # fastest replay speed a client can ask for (times real time)
+
+# Recording file layout
+# A header, then records appended while the game runs
+# Header (little-endian):
+#   4s  magic           b'PREC'
+#   u8  version         RECORDING_VERSION
+#   u8  flags           physics settings the game ran with (FLAG_*)
+#   u16 tick_rate       TICK_RATE of the server
+#   u16 broadcast_every ticks between two state frames (changes when event-driven rallies sync),
+#                       the most ticks between two frames with adaptive broadcast
+#   u32 seed            seed of the game state's random generator (serve directions)
+#   u16 meta_length     length of the JSON metadata that follows (game and player IDs, start time)
+# Records start with a tag byte, kind in the high nibble, followed by the tick as a varint
+# delta from the previous record:
+#   - input (0x1_): bit 0 player 2 instead of player 1, bit 1 double instead of float value
+#     followed by the merged paddle delta applied on that tick (f32, or f64 when f32 would
+#     round it)
+#   - score (0x20): followed by both scores as varints, after every goal
+#   - end (0x30): followed by the end reason byte, when the game loop stops
+# Ticks without input cost nothing, a tick with input of one player costs 6 bytes
+RECORDING_MAGIC = b'PREC'
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct('<4sBBHHIH')
+FLOAT = struct.Struct('<f')
+DOUBLE = struct.Struct('<d')
+
+FLAG_SWEPT = 0x01
+FLAG_EVENT_DRIVEN = 0x02
+FLAG_ADAPTIVE_BROADCAST = 0x04
+
+RECORD_INPUT = 0x10
+RECORD_SCORE = 0x20
+RECORD_END = 0x30
+INPUT_PLAYER2 = 0x01
+INPUT_DOUBLE = 0x02
+
+END_FINISHED = 1    # a player won
+END_STOPPED = 2     # cancelled, quit or the server shut down
+
+
+# RecordingError class
+# Raised for files that are not recordings or were written by another version
+class RecordingError(ValueError):
+    pass
+
+
+# TruncatedRecording class
+# Raised when the data ends in the middle of a record
+class TruncatedRecording(RecordingError):
+    pass
+
+
+# physics_flags function
+# Returns the header flags for the physics settings
+# Batch physics gives the same results as the discrete rules, so it is not part of the flags
+# Adaptive broadcast is, event-driven rallies sync the ball on other ticks with it
+def physics_flags(swept: bool, event_driven: bool, adaptive_broadcast: bool = False) -> int:
+    return ((FLAG_SWEPT if swept else 0) | (FLAG_EVENT_DRIVEN if event_driven else 0)
+            | (FLAG_ADAPTIVE_BROADCAST if adaptive_broadcast else 0))
+
+
+# write_varint function
+# Appends an unsigned LEB128 integer to the buffer
+def write_varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+# read_varint function
+# Reads an unsigned LEB128 integer, returns (value, next offset)
+def read_varint(data, offset: int):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise TruncatedRecording("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+# GameRecorder class
+# Appends the records of one game to a binary stream
+# Records are buffered and written RECORDING_FLUSH_BYTES at a time, and when the game ends
+# Properties:
+#   - stream: the file (or any binary stream) the recording is written to
+#   - last_tick: tick of the last record, records store the tick as a delta from it
+#   - size: bytes written so far, header included
+class GameRecorder:
+    def __init__(self, stream, seed: int, meta: dict, flags: int, tick_rate: int,
+                 broadcast_every: int):
+        self.stream = stream
+        self.buffer = bytearray()
+        self.last_tick = 0
+        self.size = 0
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode()
+        self.buffer += RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, flags, tick_rate,
+                                             broadcast_every, seed, len(meta_bytes))
+        self.buffer += meta_bytes
+
+    # _start_record method
+    # Writes the tag and the tick delta of a new record
+    def _start_record(self, tag: int, tick: int) -> bytearray:
+        buffer = self.buffer
+        buffer.append(tag)
+        write_varint(buffer, tick - self.last_tick)
+        self.last_tick = tick
+        return buffer
+
+    # input method
+    # Records the merged paddle delta a player's paddle moved by on the given tick
+    def input(self, tick: int, player_number: int, delta_z: float) -> None:
+        tag = RECORD_INPUT | (INPUT_PLAYER2 if player_number == 2 else 0)
+        packed = FLOAT.pack(delta_z)
+        if FLOAT.unpack(packed)[0] != delta_z:
+            tag |= INPUT_DOUBLE
+            packed = DOUBLE.pack(delta_z)
+        self._start_record(tag, tick).extend(packed)
+        self._flush_if_full()
+
+    # score method
+    # Records the scores after a goal
+    def score(self, tick: int, player1_score: int, player2_score: int) -> None:
+        buffer = self._start_record(RECORD_SCORE, tick)
+        write_varint(buffer, player1_score)
+        write_varint(buffer, player2_score)
+        self._flush_if_full()
+
+    # end method
+    # Records the end of the game and writes everything out
+    def end(self, tick: int, reason: int) -> None:
+        self._start_record(RECORD_END, tick).append(reason)
+        self.flush()
+
+    def _flush_if_full(self) -> None:
+        if len(self.buffer) >= RECORDING_FLUSH_BYTES:
+            self.flush()
+
+    # flush method
+    # Writes the buffered records to the stream
+    def flush(self) -> None:
+        if self.buffer:
+            self.stream.write(self.buffer)
+            self.stream.flush()
+            self.size += len(self.buffer)
+            self.buffer = bytearray()
+
+    # close method
+    # Writes the buffered records and closes the stream
+    def close(self) -> None:
+        self.flush()
+        self.stream.close()
+
+
+# recording_path function
+# Returns the path of a new recording of the game
+def recording_path(game_id, directory: str = None) -> str:
+    return os.path.join(directory or RECORDINGS_DIR, f"game_{game_id}_{time.time_ns()}.rec")
+
+
+# find_recording function
+# Returns the path of the latest recording of the game, or None
+def find_recording(game_id, directory: str = None):
+    directory = directory or RECORDINGS_DIR
+    if not directory:
+        return None
+    pattern = f"game_{glob.escape(str(game_id))}_*.rec"
+    paths = glob.glob(os.path.join(glob.escape(directory), pattern))
+    return max(paths, default=None)
+
+
+# Recording class
+# A parsed recording
+# Properties:
+#   - flags, tick_rate, broadcast_every, seed: the header fields
+#   - meta: game_id, player1_id, player2_id, is_remote, started_at
+#   - inputs: tick -> [player 1 delta, player 2 delta] (None when the player sent nothing)
+#   - scores: (tick, player 1 score, player 2 score) of every goal
+#   - end: (tick, reason) or None if the recording stops without an end record
+class Recording:
+    def __init__(self, flags, tick_rate, broadcast_every, seed, meta):
+        self.flags = flags
+        self.tick_rate = tick_rate
+        self.broadcast_every = broadcast_every
+        self.seed = seed
+        self.meta = meta
+        self.inputs = {}
+        self.scores = []
+        self.end = None
+
+    # last_tick property
+    # The tick of the last record
+    @property
+    def last_tick(self) -> int:
+        if self.end is not None:
+            return self.end[0]
+        ticks = list(self.inputs) + [tick for tick, _, _ in self.scores]
+        return max(ticks, default=0)
+
+    # parse class method
+    # Parses a recording, a truncated last record (crash while writing) is ignored
+    @classmethod
+    def parse(cls, data: bytes) -> 'Recording':
+        if len(data) < RECORDING_HEADER.size:
+            raise RecordingError("Not a game recording")
+        (magic, version, flags, tick_rate, broadcast_every, seed,
+         meta_length) = RECORDING_HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC:
+            raise RecordingError("Not a game recording")
+        if version != RECORDING_VERSION:
+            raise RecordingError(f"Unsupported recording version: {version}")
+        offset = RECORDING_HEADER.size
+        recording = cls(flags, tick_rate, broadcast_every, seed,
+                        json.loads(data[offset:offset + meta_length]))
+        offset += meta_length
+        tick = 0
+        try:
+            while offset < len(data):
+                tag = data[offset]
+                delta, offset = read_varint(data, offset + 1)
+                tick += delta
+                kind = tag & 0xf0
+                if kind == RECORD_INPUT:
+                    value_format = DOUBLE if tag & INPUT_DOUBLE else FLOAT
+                    if offset + value_format.size > len(data):
+                        raise TruncatedRecording("Truncated input record")
+                    (delta_z,) = value_format.unpack_from(data, offset)
+                    offset += value_format.size
+                    index = 1 if tag & INPUT_PLAYER2 else 0
+                    recording.inputs.setdefault(tick, [None, None])[index] = delta_z
+                elif kind == RECORD_SCORE:
+                    player1_score, offset = read_varint(data, offset)
+                    player2_score, offset = read_varint(data, offset)
+                    recording.scores.append((tick, player1_score, player2_score))
+                elif kind == RECORD_END:
+                    if offset >= len(data):
+                        raise TruncatedRecording("Truncated end record")
+                    recording.end = (tick, data[offset])
+                    offset += 1
+                else:
+                    raise RecordingError(f"Unknown record tag: {tag:#x}")
+        except TruncatedRecording:
+            pass
+        return recording
+
+    # load class method
+    # Reads and parses a recording file
+    @classmethod
+    def load(cls, path: str) -> 'Recording':
+        with open(path, 'rb') as file:
+            return cls.parse(file.read())
+
+
+# GameReplay class
+# Re-simulates a recording with the game logic of the server
+# A PongGame is created with the recorded seed, and every tick gets the recorded paddle inputs
+# before it runs, so the game goes through the same rallies as the recorded one as long as the
+# physics settings match
+# The replayed game does not use the shared batch physics engine, which is stepped by the
+# server's scheduler and not by the replay. Batch physics follows the discrete rules, so the
+# replay of a game recorded with it runs the same rallies
+# The replayed game records itself in memory, its score records have to match the recording's
+# Properties:
+#   - recording: the recording being replayed
+#   - game: the PongGame replaying it, its game ID names the rooms the replay frames go to
+#   - replayed: the recording made by the replayed game
+class GameReplay:
+    def __init__(self, recording: Recording, game_id=None):
+        import server
+        meta = recording.meta
+        self.recording = recording
+        config = (recording.flags, recording.tick_rate, recording.broadcast_every)
+        self.config_matches = config == server.RECORDING_CONFIG
+        if not self.config_matches:
+            logging.warning(f"Replaying game {meta.get('game_id')} with other physics settings, "
+                            f"it may diverge")
+        self.game = server.PongGame(game_id if game_id is not None else meta['game_id'],
+                                    meta['player1_id'], meta['player2_id'],
+                                    meta.get('is_remote', False), seed=recording.seed)
+        self.game.batch_physics = False
+        self.buffer = io.BytesIO()
+        self.game.recorder = server.create_recorder(self.game, self.buffer)
+        self.player_ids = (meta['player1_id'], meta['player2_id'])
+        self.last_tick = recording.last_tick
+        self.game.start_rally()
+
+    # done property
+    # Whether the replay reached the end of the recording or of the game
+    @property
+    def done(self) -> bool:
+        game_state = self.game.game_state
+        return (game_state is None or not game_state.in_progress
+                or self.game.tick_number >= self.last_tick)
+
+    # step method
+    # Runs the next tick with its recorded inputs
+    async def step(self) -> None:
+        game = self.game
+        deltas = self.recording.inputs.get(game.tick_number + 1)
+        if deltas is not None:
+            for player_id, delta_z in zip(self.player_ids, deltas):
+                if delta_z is not None:
+                    game.input_queues[player_id].push(delta_z)
+        await game.tick()
+
+    # run method
+    # Replays the whole recording as fast as possible, returns the replayed recording
+    async def run(self) -> Recording:
+        while not self.done:
+            await self.step()
+        return self.replayed()
+
+    # replayed method
+    # Returns what the replayed game recorded so far
+    def replayed(self) -> Recording:
+        self.game.recorder.flush()
+        return Recording.parse(self.buffer.getvalue())
+
+    # diverged method
+    # Returns the score records of the recording the replay did not reproduce
+    def diverged(self) -> list:
+        replayed = set(self.replayed().scores)
+        return [score for score in self.recording.scores if score not in replayed]
+
+
+# verify function
+# Replays every recording and checks that the goals happen on the same ticks with the same scores
+# Used as a regression corpus for physics changes, returns the number of diverging recordings
+def verify(paths) -> int:
+    failures = 0
+    for path in paths:
+        replay = GameReplay(Recording.load(path))
+        start = time.perf_counter()
+        asyncio.run(replay.run())
+        elapsed = time.perf_counter() - start
+        diverged = replay.diverged()
+        speed = replay.game.tick_number / replay.recording.tick_rate / elapsed if elapsed else 0.0
+        status = 'ok' if not diverged else f"DIVERGED at tick {diverged[0][0]}"
+        if not replay.config_matches:
+            status += ' (other physics settings)'
+        print(f"{path}: {replay.game.tick_number} ticks, {len(replay.recording.scores)} goals, "
+              f"{speed:.0f}x real time, {status}")
+        failures += bool(diverged)
+    return failures
+
+
+# Usage: python recording.py verify <recording files>
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'verify':
+        print("Usage: python recording.py verify <recording files>")
+        sys.exit(2)
+    sys.exit(1 if verify(sys.argv[2:]) else 0)
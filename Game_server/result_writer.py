@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import deque
+from datetime import datetime, timezone
+import httpx
+
+# game_history base URL, results are not saved when unset
+GAME_HISTORY_SERVICE = os.environ.get('GAME_HISTORY_SERVICE')
+GAME_RESULTS_PATH = '/game-results/'
+
+# file keeping unsaved results across outages and restarts
+RESULT_SPOOL = os.environ.get('RESULT_SPOOL', 'game_results.spool')
+# results saved per request
+RESULT_BATCH_SIZE = int(os.environ.get('RESULT_BATCH_SIZE', 100))
+# seconds a result waits for others to share its request
+RESULT_FLUSH_DELAY = float(os.environ.get('RESULT_FLUSH_DELAY', 1.0))
+RESULT_REQUEST_TIMEOUT = 5.0
+# first retry delay after a failed request (seconds), doubled on every failure
+RESULT_RETRY_MIN = 0.5
+RESULT_RETRY_MAX = 30.0
+# results kept while game_history is down, newer results are dropped beyond that
+RESULT_MAX_PENDING = 10000
+
+
+# game_result function
+# Returns the game_history result of a finished game from its game_over data
+def game_result(game_over: dict) -> dict:
+    return {
+        'game_id': game_over['game_id'],
+        'winner_id': game_over['winner'],
+        'player1_score': game_over['player1_score'],
+        'player2_score': game_over['player2_score'],
+        'player1_hits': game_over['player1_hits'],
+        'player2_hits': game_over['player2_hits'],
+        'longest_rally': game_over['longest_rally'],
+        'end_time': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+# ResultWriter class
+# Saves the results of finished games to game_history from a background task
+# submit() only puts the result into an in-memory outbox, the game never waits on the service
+# The writer sends up to RESULT_BATCH_SIZE results per POST to GAME_RESULTS_PATH over one pooled
+# httpx.AsyncClient, and retries failed requests with exponential backoff
+# While results can't be saved they are kept in the spool file, which is read back on start,
+# so results survive game_history outages and restarts of the game server
+# game_history saves results idempotently, a batch that is sent twice does no harm
+# Properties:
+#   - pending: results not saved yet, oldest first
+#   - spool_path: the spool file, None to keep results in memory only
+#   - saved: results saved so far
+#   - failed_requests: requests that failed and were retried
+#   - rejected: results game_history refused (4xx), they are not retried
+#   - dropped: results dropped because RESULT_MAX_PENDING results were already pending
+class ResultWriter:
+    def __init__(self, base_url: str = GAME_HISTORY_SERVICE, spool_path: str = RESULT_SPOOL,
+                 batch_size: int = RESULT_BATCH_SIZE, flush_delay: float = RESULT_FLUSH_DELAY,
+                 transport=None):
+        self.base_url = base_url or ''
+        self.spool_path = spool_path
+        self.batch_size = max(1, batch_size)
+        self.flush_delay = flush_delay
+        self.transport = transport
+        self.pending = deque()
+        self.saved = 0
+        self.failed_requests = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.spooled = False
+        self._wakeup = None
+        self._task = None
+        self._client = None
+
+    # enabled property
+    # Results are only saved when the game_history service is configured
+    @property
+    def enabled(self) -> bool:
+        return bool(self.base_url)
+
+    # client property
+    # The pooled HTTP client, created on first use so it belongs to the running event loop
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url,
+                                             timeout=RESULT_REQUEST_TIMEOUT,
+                                             transport=self.transport)
+        return self._client
+
+    # start method
+    # Starts the background task, which first reads the spool left by an earlier run
+    # Called on server startup, and by submit() in processes that did not start the writer
+    async def start(self) -> None:
+        self.ensure_started()
+
+    def ensure_started(self) -> None:
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # submit method
+    # Queues the result of a finished game, it is saved in the background
+    def submit(self, result: dict) -> None:
+        if not self.enabled:
+            return
+        self._append(result)
+        self.ensure_started()
+        self._wakeup.set()
+
+    # _append method
+    # Adds a result to the outbox, unless it is full
+    # (the oldest results may be in a request that is on its way, so they are never the ones
+    # dropped)
+    def _append(self, result: dict) -> None:
+        if len(self.pending) >= RESULT_MAX_PENDING:
+            self.dropped += 1
+            logging.error(f"Too many unsaved game results, dropping the result of game "
+                          f"{result.get('game_id')}")
+            return
+        self.pending.append(result)
+
+    # _run method
+    # The background task: waits for results, lets more of them gather for flush_delay,
+    # then sends them in batches until the outbox is empty
+    # A failed request is retried after RESULT_RETRY_MIN seconds, doubled up to RESULT_RETRY_MAX
+    async def _run(self) -> None:
+        spooled = await asyncio.to_thread(self._read_spool)
+        if spooled:
+            logging.info(f"{len(spooled)} game result(s) read from the spool {self.spool_path}")
+            # spooled results are older than the ones submitted since the start
+            self.pending.extendleft(reversed(spooled))
+            while len(self.pending) > RESULT_MAX_PENDING:
+                self.pending.pop()
+                self.dropped += 1
+            self._wakeup.set()
+        retry_delay = RESULT_RETRY_MIN
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(self.flush_delay)
+            while self.pending:
+                if await self.flush_batch():
+                    retry_delay = RESULT_RETRY_MIN
+                    continue
+                await self._write_spool()
+                await asyncio.sleep(retry_delay * random.uniform(0.8, 1.2))
+                retry_delay = min(RESULT_RETRY_MAX, retry_delay * 2)
+            if self.spooled:
+                await self._write_spool()
+
+    # flush_batch method
+    # Sends the oldest pending results in one request
+    # Returns False if the request failed and the results have to be retried
+    async def flush_batch(self) -> bool:
+        batch = [self.pending[index] for index in range(min(self.batch_size, len(self.pending)))]
+        try:
+            response = await self.client.post(GAME_RESULTS_PATH, json={'results': batch})
+        except httpx.HTTPError as e:
+            self.failed_requests += 1
+            logging.warning(f"Saving {len(batch)} game result(s) failed, retrying: {e!r}")
+            return False
+        if response.status_code >= 500:
+            self.failed_requests += 1
+            logging.warning(f"Saving {len(batch)} game result(s) failed with status "
+                            f"{response.status_code}, retrying")
+            return False
+        if response.status_code >= 400:
+            self.rejected += len(batch)
+            logging.error(f"game_history rejected {len(batch)} game result(s): "
+                          f"{response.status_code} {response.text[:200]}")
+        else:
+            self.saved += len(batch)
+        for _ in batch:
+            self.pending.popleft()
+        return True
+
+    # _read_spool method
+    # Returns the results stored in the spool file, one JSON object per line
+    def _read_spool(self) -> list:
+        if not self.spool_path:
+            return []
+        try:
+            with open(self.spool_path) as spool:
+                lines = spool.readlines()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logging.error(f"Cannot read the game result spool {self.spool_path}: {e}")
+            return []
+        results = []
+        for line in lines:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                logging.error(
+                    f"Skipping a corrupt line of the game result spool {self.spool_path}")
+        self.spooled = bool(results)
+        return results
+
+    # _write_spool method
+    # Replaces the spool with the pending results, or removes it when everything is saved
+    # The new spool is written next to the old one and renamed over it, so a crash never leaves
+    # half a file
+    async def _write_spool(self) -> None:
+        if not self.spool_path:
+            return
+        lines = [json.dumps(result) + '\n' for result in self.pending]
+        try:
+            await asyncio.to_thread(self._replace_spool, lines)
+        except OSError as e:
+            logging.error(f"Cannot write the game result spool {self.spool_path}: {e}")
+            return
+        self.spooled = bool(lines)
+
+    def _replace_spool(self, lines) -> None:
+        if not lines:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        temporary_path = self.spool_path + '.tmp'
+        with open(temporary_path, 'w') as spool:
+            spool.writelines(lines)
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(temporary_path, self.spool_path)
+
+    # stats method
+    # Returns the writer counters as a dictionary
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.pending),
+            'saved': self.saved,
+            'failed_requests': self.failed_requests,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+        }
+
+    # close method
+    # Stops the background task, tries once more to save the pending results,
+    # spools what is left and closes the HTTP client
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self.pending and await self.flush_batch():
+            pass
+        if self.pending or self.spooled:
+            await self._write_spool()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Shared writer used by PongGame.end_game
+result_writer = ResultWriter()
@@ -0,0 +1,209 @@
+import asyncio
+import os
+from collections import deque
+
+# messages held per slow connection, 0 turns the queues off
+SEND_QUEUE_SIZE = int(os.environ.get('SEND_QUEUE_SIZE', 8))
+# seconds between two checks that a backlogged connection is still open
+SEND_QUEUE_CHECK_INTERVAL = 1.0
+
+# Events carrying a full or delta game state, a newer frame makes an older one useless
+# Every other event (score, game_over, cancel_game...) is always delivered
+STATE_EVENTS = ('send_game_state', 'send_game_state_v2', 'state_delta')
+
+
+# packet_event function
+# Returns the event name of an encoded Socket.IO event of the default namespace:
+#   2["event",...]          text event
+#   5<n>-["event",...]      binary event, followed by <n> attachment packets
+# and the number of attachments, or (None, 0) for anything else
+def packet_event(data):
+    if not isinstance(data, str) or len(data) < 4:
+        return None, 0
+    attachments = 0
+    start = 1
+    if data[0] == '5':
+        dash = data.find('-', 1)
+        if dash < 0 or not data[1:dash].isdigit():
+            return None, 0
+        attachments = int(data[1:dash])
+        start = dash + 1
+    elif data[0] != '2':
+        return None, 0
+    if not data.startswith('["', start):
+        return None, 0
+    end = data.find('"', start + 2)
+    if end < 0:
+        return None, 0
+    return data[start + 2:end], attachments
+
+
+# QueuedMessage class
+# One Socket.IO message waiting in a connection's queue: the Engine.IO packets of the message
+# (a binary event and its attachments are one message) and whether a newer frame supersedes it
+class QueuedMessage:
+    __slots__ = ('event', 'packets', 'droppable', 'attachments')
+
+    def __init__(self, event, packet, attachments: int):
+        self.event = event
+        self.packets = [packet]
+        self.droppable = event in STATE_EVENTS
+        self.attachments = attachments
+
+
+# SendQueues class
+# Bounded outbound queues in front of Engine.IO's per-connection queues
+# Engine.IO already gives every connection a writer task, but its queue has no bound, so a client
+# on a bad network collects every frame sent to it and gets them later and later
+# As long as a connection's Engine.IO queue is empty (its writer took everything), a message goes
+# straight to it, healthy connections never see these queues
+# Once it is not, messages wait here and a writer task of the connection hands them over one by
+# one, each after Engine.IO took the previous one. When max_size messages wait, the oldest state
+# frame is dropped, the other events are always kept
+# Sending never waits on the network, emits of the game loop only append to a queue
+# Properties:
+#   - sockets: Engine.IO session ID -> Engine.IO socket, the server's eio.sockets
+#   - send_packet: coroutine function sending an Engine.IO packet to a session, the server's
+#     original
+#   - queues: Engine.IO session ID -> deque of QueuedMessage, only for connections with a backlog
+#   - dropped: Engine.IO session ID -> state frames dropped for the connection, pruned once it
+#     closed
+#   - dropped_events: event -> state frames dropped
+class SendQueues:
+    def __init__(self, sockets, send_packet, max_size: int = SEND_QUEUE_SIZE):
+        self.sockets = sockets
+        self.send_packet = send_packet
+        self.max_size = max(1, max_size)
+        self.queues = {}
+        self.writers = {}
+        self.pending_attachments = {}
+        self.dropped = {}
+        self.dropped_events = {}
+
+    # send method
+    # Replacement of the Engine.IO server's send_packet
+    async def send(self, eio_sid, pkt) -> None:
+        pending = self.pending_attachments.get(eio_sid)
+        if pending is not None:
+            # attachment of the last binary event, it follows the header
+            message, direct = pending
+            message.attachments -= 1
+            if message.attachments <= 0:
+                del self.pending_attachments[eio_sid]
+            if direct:
+                await self.send_packet(eio_sid, pkt)
+            else:
+                message.packets.append(pkt)
+            return
+        event, attachments = packet_event(pkt.data)
+        queue = self.queues.get(eio_sid)
+        if queue is None:
+            socket = self.sockets.get(eio_sid)
+            if socket is None or socket.queue.empty():
+                if attachments:
+                    self.pending_attachments[eio_sid] = (
+                        QueuedMessage(event, None, attachments), True)
+                await self.send_packet(eio_sid, pkt)
+                return
+            queue = self.queues[eio_sid] = deque()
+        message = QueuedMessage(event, pkt, attachments)
+        if attachments:
+            self.pending_attachments[eio_sid] = (message, False)
+        self.append(eio_sid, queue, message)
+        if eio_sid not in self.writers:
+            self.writers[eio_sid] = asyncio.create_task(self.write(eio_sid, queue))
+
+    # append method
+    # Queues a message, dropping the oldest state frame when the queue is full
+    # A new state frame is dropped itself when only events that must be delivered are waiting
+    def append(self, eio_sid, queue, message) -> None:
+        if len(queue) >= self.max_size:
+            stale = next((queued for queued in queue if queued.droppable), None)
+            if stale is not None:
+                queue.remove(stale)
+                self.count_drop(eio_sid, stale.event)
+            elif message.droppable:
+                self.count_drop(eio_sid, message.event)
+                return
+        queue.append(message)
+
+    def count_drop(self, eio_sid, event) -> None:
+        if eio_sid not in self.dropped:
+            self.prune()
+            self.dropped[eio_sid] = 0
+        self.dropped[eio_sid] += 1
+        self.dropped_events[event] = self.dropped_events.get(event, 0) + 1
+
+    # write method
+    # Writer task of a connection with a backlog, runs until its queue is empty or the connection
+    # closes
+    async def write(self, eio_sid, queue) -> None:
+        closed = False
+        try:
+            while queue:
+                socket = self.sockets.get(eio_sid)
+                closed = socket is None or socket.closed
+                if closed:
+                    break
+                try:
+                    await asyncio.wait_for(socket.queue.join(), SEND_QUEUE_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    continue
+                message = queue[0]
+                if message.attachments > 0:
+                    # the attachments of this binary event are still on their way
+                    await asyncio.sleep(0)
+                    continue
+                queue.popleft()
+                for pkt in message.packets:
+                    await self.send_packet(eio_sid, pkt)
+        finally:
+            if self.writers.get(eio_sid) is asyncio.current_task():
+                del self.writers[eio_sid]
+            if closed:
+                self.forget(eio_sid)
+            elif not queue:
+                self.queues.pop(eio_sid, None)
+
+    # forget method
+    # Drops what is kept about a closed connection
+    def forget(self, eio_sid) -> None:
+        self.queues.pop(eio_sid, None)
+        self.pending_attachments.pop(eio_sid, None)
+        self.dropped.pop(eio_sid, None)
+
+    # prune method
+    # Forgets the connections that are closed
+    def prune(self) -> None:
+        for eio_sid in [eio_sid for eio_sid in self.dropped if eio_sid not in self.sockets]:
+            self.forget(eio_sid)
+
+    # depths method
+    # Returns the number of queued messages per connection with a backlog
+    def depths(self) -> dict:
+        return {eio_sid: len(queue) for eio_sid, queue in self.queues.items()}
+
+    # drops method
+    # Returns the number of dropped state frames per open connection that had any
+    def drops(self) -> dict:
+        self.prune()
+        return dict(self.dropped)
+
+    # stats method
+    # Returns the queue counters as a dictionary
+    def stats(self) -> dict:
+        return {
+            'backlogged': len(self.queues),
+            'queued': sum(len(queue) for queue in self.queues.values()),
+            'dropped': sum(self.dropped_events.values()),
+        }
+
+
+# install_send_queues function
+# Puts bounded send queues in front of the Engine.IO server of a Socket.IO server
+# Install it after metrics.instrument_server, so the byte counters only see the messages that are
+# sent
+def install_send_queues(sio, max_size: int = SEND_QUEUE_SIZE) -> SendQueues:
+    queues = SendQueues(sio.eio.sockets, sio.eio.send_packet, max_size)
+    sio.eio.send_packet = queues.send
+    return queues
@@ -4,14 +4,84 @@ from game_logic.entities.player import Player
 from game_logic.game_defaults import *
 from game_logic.entities.ball import Ball
 import asyncio
-import threading
 import json
+import math
 import os
-import requests
-import uvicorn 
+import random
+import sys
+import time
 from server_utils import *
+from tick_scheduler import scheduler, server_time, TICK_RATE
+from input_queue import InputQueue, InputRateLimiter
+from token_validator import token_validator
+from result_writer import result_writer, game_result
+import launcher
+import metrics
+from game_workers import GAME_WORKERS, WorkerPool
+from cluster import ClusterNode
+from game_logic.batch_physics import BATCH_PHYSICS, BatchPhysics
+from game_logic.rally_simulation import RallySimulation
+from recording import (RECORDINGS_DIR, MAX_REPLAY_SPEED, END_FINISHED, END_STOPPED, GameRecorder,
+                       GameReplay, Recording, RecordingError, find_recording, physics_flags,
+                       recording_path)
+from json_codec import json_float
+from protocol import (PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA, SUPPORTED_PROTOCOLS,
+                      UINT32_MAX, FEATURE_GOAL_ANIMATION, negotiate_protocol, negotiate_features,
+                      supports_binary, encode_state_v2, DeltaEncoder)
 
-TOEKNSERVICE = os.environ.get('TOKEN_SERVICE')
+# Game phases driven by PongGame.tick
+PHASE_SERVE = 'serve'
+PHASE_RALLY = 'rally'
+PHASE_POST_RALLY = 'post_rally'
+
+SERVE_DELAY_TICKS = TICK_RATE       # little break before the start of the rally (1 second)
+POST_RALLY_TICKS = TICK_RATE        # length of the post-rally animation in ticks (1 second)
+
+# Simulation and broadcast rates
+# The ball moves TICK_STEP physics frames per tick on every physics path (discrete, swept, batch
+# and event-driven), so its speed in units per second does not depend on TICK_RATE
+# Below PHYSICS_RATE the ball moves further per tick than the discrete collision test can handle,
+# so swept collisions are used (SWEPT_COLLISIONS=1 forces them at any rate)
+# State frames go out BROADCAST_RATE times per second (at least once), plus on every bounce and
+# goal
+# EVENT_DRIVEN_PHYSICS=1 runs rallies on RallySimulation, which follows the swept collision rules
+# but only does work at wall/paddle events and when the state is broadcast
+TICK_STEP = PHYSICS_RATE / TICK_RATE
+EVENT_DRIVEN_PHYSICS = os.environ.get('EVENT_DRIVEN_PHYSICS', '0') == '1'
+SWEPT_COLLISIONS = (os.environ.get('SWEPT_COLLISIONS', '0') == '1' or TICK_RATE < PHYSICS_RATE
+                    or EVENT_DRIVEN_PHYSICS)
+BROADCAST_RATE = max(1, min(TICK_RATE, int(os.environ.get('BROADCAST_RATE', TICK_RATE))))
+BROADCAST_EVERY = max(1, round(TICK_RATE / BROADCAST_RATE))    # ticks between two state frames
+
+# ADAPTIVE_BROADCAST=1 only sends rally frames the clients cannot predict: on bounces, paddle
+# input, goals and changes of the ball's direction, and otherwise HEARTBEAT_RATE times per second
+# Clients extrapolate the ball from the last frame's position and ballDelta in between
+# (see PongGame.prediction_stale)
+ADAPTIVE_BROADCAST = os.environ.get('ADAPTIVE_BROADCAST', '0') == '1'
+HEARTBEAT_RATE = min(BROADCAST_RATE, float(os.environ.get('HEARTBEAT_RATE', 4)))
+# most ticks between two adaptive frames
+HEARTBEAT_EVERY = max(1, round(TICK_RATE / HEARTBEAT_RATE))
+# units the extrapolated ball may be off
+ADAPTIVE_MAX_ERROR = float(os.environ.get('ADAPTIVE_MAX_ERROR', 1.0))
+
+# Spectators (see spectate_game) get state frames SPECTATOR_FRAME_RATE times per second, plus on
+# every bounce and goal, and at most one frame per player frame
+# With ADAPTIVE_BROADCAST they get every rally frame, their clients extrapolate from them too
+SPECTATOR_FRAME_RATE = min(BROADCAST_RATE, int(os.environ.get('SPECTATOR_FRAME_RATE', 20)))
+SPECTATOR_EVERY = BROADCAST_EVERY * max(1, round(BROADCAST_RATE / max(1, SPECTATOR_FRAME_RATE)))
+MAX_SPECTATORS = int(os.environ.get('MAX_SPECTATORS', 1000))     # spectators per game
+
+# Shared physics engine stepping the rallies of every game at once, None when BATCH_PHYSICS is off
+# The engine implements the discrete collision test, so it is not used with swept collisions
+if BATCH_PHYSICS and SWEPT_COLLISIONS:
+    logging.warning("BATCH_PHYSICS is ignored with swept collisions")
+physics_engine = BatchPhysics() if BATCH_PHYSICS and not SWEPT_COLLISIONS else None
+
+# Physics settings written into game recordings, a recording replays exactly only with the same
+# settings
+# Event-driven rallies sync on the frames, so the adaptive mode and its heartbeat are part of them
+RECORDING_CONFIG = (physics_flags(SWEPT_COLLISIONS, EVENT_DRIVEN_PHYSICS, ADAPTIVE_BROADCAST),
+                    TICK_RATE, HEARTBEAT_EVERY if ADAPTIVE_BROADCAST else BROADCAST_EVERY)
 
 # PongGame class
 # Represents a game of Pong
@@ -19,16 +89,70 @@ TOEKNSERVICE = os.environ.get('TOKEN_SERVICE')
 #   - game_id: the ID of the game
 #   - game_state: the game state object
 #   - sids: a list of session IDs of the clients connected to the game
+#   - room: the Socket.IO room all of the game's sessions are in, named after game_id
+#   - protocol_sids: the session IDs receiving state frames, grouped by protocol version
+#   - goal_animation_sids: the session IDs that animate goals themselves (see send_goal_animation)
+#   - spectator_sids: the session IDs of the spectators, grouped by protocol version
+#   - spectator_goal_animation_sids: the spectators that animate goals themselves
+#   - tick_number: the number of ticks the game has run, sent with the state frames
+#   - tick_time: server time (ms) of the current tick, sent with the state frames and scores
+#   - delta_encoder: produces the keyframe/delta stream for delta protocol sessions
+#   - spectator_delta_encoder: the same for delta protocol spectators, whose frames are further
+#     apart
+#   - input_queues: bounded paddle input queues per player ID, drained at the start of every tick
+#   - input_limiters: input rate limiters per session ID
+#   - input_seqs: client sequence number of the last input received per player ID, processed on
+#     the next tick
+#   - input_acks: sequence number of the last processed input per player ID, echoed in the state
+#     frames
+#   - physics_slot: the game's row in physics_engine, when batch physics is on
+#   - batch_physics: whether the game's rallies go through physics_engine when it is on,
+#     replays step themselves and turn it off
+#   - rally_simulation: the event-driven simulation of the current rally, when event-driven
+#     physics is on
+#   - rally_time: physics frames since the start of the current rally
+#   - paddles_moved: whether paddle input was applied on the current tick
+#   - last_frame: tick, ball position, ball deltas, hitpos and paused flag of the last state frame
+#     sent to the players, what their clients extrapolate from with ADAPTIVE_BROADCAST
+#   - frames_sent: the number of state frames sent to the players
 #   - is_remote: a boolean indicating whether the game is remote or local
+#   - seed: seed of the game state's random generator, a recording replays with the same seed
+#   - recorder: the GameRecorder of the game, when games are recorded
 class PongGame:
-    def __init__(self, game_id, player1_id, player2_id, is_remote):
+    def __init__(self, game_id, player1_id, player2_id, is_remote, seed=None):
         self.game_id = game_id
+        self.seed = seed if seed is not None else random.getrandbits(32)
         self.game_state = self.init_game(game_id, player1_id, player2_id)
         self.sids = []
+        self.room = game_room(game_id)
+        self.protocol_sids = {protocol: set() for protocol in SUPPORTED_PROTOCOLS}
+        self.goal_animation_sids = set()
+        self.spectator_sids = {protocol: set() for protocol in SUPPORTED_PROTOCOLS}
+        self.spectator_goal_animation_sids = set()
+        self.tick_number = 0
+        self.tick_time = server_time()
+        self.delta_encoder = DeltaEncoder(game_id)
+        self.spectator_delta_encoder = DeltaEncoder(game_id)
+        self.input_queues = {player1_id: InputQueue(), player2_id: InputQueue()}
+        self.input_limiters = {}
+        self.input_seqs = {}
+        self.input_acks = {}
         self.sid_to_player_id = {}
         self.game_loop_task = None
         self.is_remote = is_remote
         self.is_quit = False
+        self.loop_done = None
+        self.phase = PHASE_SERVE
+        self.phase_ticks = 0
+        self.pending_state_send = False
+        self.physics_slot = None
+        self.batch_physics = True
+        self.rally_simulation = None
+        self.rally_time = 0.0
+        self.paddles_moved = False
+        self.last_frame = None
+        self.frames_sent = 0
+        self.recorder = None
 
     # init_game method
     # Initializes the game state
@@ -47,55 +171,255 @@ class PongGame:
         player1 = Player(player1_id, PLAYER1_START_X)
         player2 = Player(player2_id, PLAYER2_START_X)
         ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, BALL_DEFAULT_DIRECTION)
-        game_state = GameState(game_id, player1, player2, ball)
+        game_state = GameState(game_id, player1, player2, ball, random.Random(self.seed))
         return game_state
 
     # add_player method
-    # Adds a player session to the game
+    # Adds a player session to the game and to the game's room
+    # The session also joins the state room of the protocol it asked for in the handshake
     async def add_player(self, sid, player_id):
         self.sids.append(sid)
+        await sio.enter_room(sid, self.room)
+        protocol = sid_to_protocol.get(sid, PROTOCOL_JSON)
+        if not supports_binary(self.game_id):
+            protocol = PROTOCOL_JSON
+        self.protocol_sids[protocol].add(sid)
+        await sio.enter_room(sid, state_room(self.game_id, protocol))
+        if protocol == PROTOCOL_DELTA:
+            self.delta_encoder.request_keyframe()
+        if FEATURE_GOAL_ANIMATION in sid_to_features.get(sid, ()):
+            self.goal_animation_sids.add(sid)
         if self.is_remote:
             self.sid_to_player_id[sid] = player_id
 
     # remove_player method
-    # Removes a player session from the game
+    # Removes a player session from the game and from the game's room
     async def remove_player(self, sid):
         if sid in self.sids:
             self.sids.remove(sid)
+            await sio.leave_room(sid, self.room)
+            for protocol, protocol_sids in self.protocol_sids.items():
+                if sid in protocol_sids:
+                    protocol_sids.discard(sid)
+                    await sio.leave_room(sid, state_room(self.game_id, protocol))
+            self.goal_animation_sids.discard(sid)
             player_id = self.sid_to_player_id.pop(sid, None)
-     
+            self.input_limiters.pop(sid, None)
+
+    # release_sessions method
+    # Removes the player sessions from the game and the game from sid_to_game
+    # Bytes sent to the sessions afterwards no longer count for the finished game (see metrics.py)
+    def release_sessions(self):
+        for sid in self.sids:
+            if sid_to_game.get(sid) == self.game_id:
+                del sid_to_game[sid]
+        self.sids.clear()
+
+    # add_spectator method
+    # Adds a spectator session to the game's room (scores, goal animations, game over) and to the
+    # spectator room of its protocol, then sends it 'spectate_start' with the players and the score
+    # Spectators send no input and are not part of sids
+    async def add_spectator(self, sid):
+        protocol = sid_to_protocol.get(sid, PROTOCOL_JSON)
+        if not supports_binary(self.game_id):
+            protocol = PROTOCOL_JSON
+        sid_to_spectated[sid] = self.game_id
+        await sio.enter_room(sid, self.room)
+        self.spectator_sids[protocol].add(sid)
+        await sio.enter_room(sid, spectator_room(self.game_id, protocol))
+        if protocol == PROTOCOL_DELTA:
+            self.spectator_delta_encoder.request_keyframe()
+        if FEATURE_GOAL_ANIMATION in sid_to_features.get(sid, ()):
+            self.spectator_goal_animation_sids.add(sid)
+        data = {
+            'type': 'spectate_start',
+            'gameId': self.game_id,
+            'player1Id': self.game_state.player1.id,
+            'player2Id': self.game_state.player2.id,
+            'player1Score': self.game_state.player1.score,
+            'player2Score': self.game_state.player2.score,
+            'serverTime': round(server_time(), 1),
+            'tickRate': TICK_RATE,
+            'frameRate': TICK_RATE / SPECTATOR_EVERY,
+        }
+        await sio.emit('spectate_start', data, room=sid)
+
+    # remove_spectator method
+    # Removes a spectator session from the game's room and spectator room
+    async def remove_spectator(self, sid):
+        if sid_to_spectated.get(sid) == self.game_id:
+            del sid_to_spectated[sid]
+        for protocol, spectator_sids in self.spectator_sids.items():
+            if sid in spectator_sids:
+                spectator_sids.discard(sid)
+                await sio.leave_room(sid, self.room)
+                await sio.leave_room(sid, spectator_room(self.game_id, protocol))
+        self.spectator_goal_animation_sids.discard(sid)
+
+    # spectator_count method
+    # Returns the number of spectators of the game
+    def spectator_count(self) -> int:
+        return sum(len(spectator_sids) for spectator_sids in self.spectator_sids.values())
+
+    # close_rooms method
+    # Removes every session from the game's room, state rooms and spectator rooms
+    async def close_rooms(self):
+        await sio.close_room(self.room)
+        for protocol in SUPPORTED_PROTOCOLS:
+            await sio.close_room(state_room(self.game_id, protocol))
+            self.protocol_sids[protocol].clear()
+            await sio.close_room(spectator_room(self.game_id, protocol))
+            for sid in self.spectator_sids[protocol]:
+                sid_to_spectated.pop(sid, None)
+            self.spectator_sids[protocol].clear()
+        self.goal_animation_sids.clear()
+        self.spectator_goal_animation_sids.clear()
+
     # game_loop method
-    # Runs the game loop
-    # The game loop runs until the game is over
-    # The game loop updates the game state and sends the updated state to the client
-    # When goal is scored, the game is paused and the score is sent to the clients
-    # and the post-rally animation is run
-    # If game is not over, the game continues
+    # Runs the game on the shared tick scheduler
+    # The game registers itself with the scheduler and waits until tick() marks it finished
+    # Cancelling this task (end_game, cancel_game) unregisters the game from the scheduler
+    # When RECORDINGS_DIR is set the game is recorded from its first tick to the end of the loop
     async def game_loop(self) -> None:
-        while self.game_state.in_progress:
-            self.game_state.current_rally = 0
-            self.game_state.reset_ball()
+        self.loop_done = asyncio.get_running_loop().create_future()
+        if RECORDINGS_DIR and self.recorder is None:
+            self.start_recording()
+        self.start_rally()
+        scheduler.register(self.game_id, self)
+        try:
+            await self.loop_done
+        finally:
+            scheduler.unregister(self.game_id)
+            if self.physics_slot is not None:
+                physics_engine.remove(self.physics_slot)
+                self.physics_slot = None
+            if self.recorder is not None:
+                self.stop_recording()
+
+    # start_recording method
+    # Opens the game's recording file in RECORDINGS_DIR
+    def start_recording(self) -> None:
+        try:
+            self.recorder = create_recorder(self, open(recording_path(self.game_id), 'ab'))
+        except OSError as e:
+            logging.error(f"Cannot record game {self.game_id}: {e}")
+
+    # stop_recording method
+    # Writes the end record and closes the recording
+    def stop_recording(self) -> None:
+        finished = self.game_state is not None and self.game_state.is_game_over()
+        try:
+            self.recorder.end(self.tick_number, END_FINISHED if finished else END_STOPPED)
+            self.recorder.close()
+        except OSError as e:
+            logging.error(f"Cannot finish the recording of game {self.game_id}: {e}")
+        self.recorder = None
+
+    # start_rally method
+    # Resets the ball and starts the little break before the rally
+    def start_rally(self) -> None:
+        self.game_state.current_rally = 0
+        self.game_state.reset_ball()
+        self.phase = PHASE_SERVE
+        self.phase_ticks = SERVE_DELAY_TICKS
+        self.pending_state_send = True
+
+    # tick method
+    # Advances the game by one fixed timestep, called by the tick scheduler
+    # Queued paddle inputs are applied first, then the game moves through three phases:
+    #   - serve: little break before the rally, the ball waits in the middle
+    #     the state is only sent when a paddle moved
+    #   - rally: the ball moves, collisions are handled and the state is sent every tick
+    #     with batch physics the rally tick is queued and finished by run_batch_physics
+    #   - post_rally: after a goal the score is sent and the ball flies through the goal
+    #     clients that asked for the goal_animation feature animate it from one 'goal_animation'
+    #     event
+    # When the post-rally animation ends the next rally starts, or the game finishes
+    async def tick(self) -> None:
+        if self.game_state is None:
+            return
+        self.tick_number += 1
+        self.tick_time = scheduler.tick_time or server_time()
+        if not self.game_state.in_progress:
+            self.finish_loop()
+            return
+        moved = self.paddles_moved = self.apply_inputs()
+        if self.phase == PHASE_SERVE:
+            if self.pending_state_send or moved:
+                spectators = self.spectator_frame_due(self.pending_state_send)
+                self.pending_state_send = False
+                await self.send_game_state_to_client(spectators=spectators)
+            self.phase_ticks -= 1
+            if self.phase_ticks <= 0:
+                self.game_state.paused = False
+                self.phase = PHASE_RALLY
+                if EVENT_DRIVEN_PHYSICS:
+                    self.rally_time = 0.0
+                    self.rally_simulation = RallySimulation(self.game_state)
+                if physics_engine is not None and self.batch_physics:
+                    if self.physics_slot is None:
+                        self.physics_slot = physics_engine.add(self)
+                    physics_engine.load(self.physics_slot, self.game_state)
+        elif self.phase == PHASE_RALLY:
+            if self.physics_slot is not None:
+                physics_engine.queue(self.physics_slot, self.game_state.player1.paddle.z,
+                                     self.game_state.player2.paddle.z)
+                return
+            await self.update_game_state()
+            await self.end_rally_on_goal()
+        elif self.phase == PHASE_POST_RALLY:
+            await self.post_rally_animation()
+            self.phase_ticks -= 1
+            if self.phase_ticks <= 0:
+                if self.game_state.is_game_over():
+                    self.game_state.in_progress = False
+                    self.finish_loop()
+                else:
+                    self.start_rally()
+
+    # finish_rally_tick method
+    # Finishes a rally tick after physics_engine stepped the game
+    async def finish_rally_tick(self) -> None:
+        if self.game_state is None or self.phase != PHASE_RALLY:
+            return
+        physics_engine.store(self.physics_slot, self.game_state)
+        if self.broadcast_due():
             await self.send_game_state_to_client()
-            await asyncio.sleep(1.0) # Little break before start of the rally
-            self.game_state.paused = False
-            while not self.game_state.paused:
-                await self.update_game_state()
-                await asyncio.sleep(0.016)  # Adjust this to control the speed of the animation
+        await self.end_rally_on_goal()
+
+    # end_rally_on_goal method
+    # After a goal, sends the score and starts the post-rally animation
+    # Sessions with the goal_animation feature get the whole animation in one event
+    async def end_rally_on_goal(self) -> None:
+        if self.game_state.paused:
+            self.rally_simulation = None
             if self.game_state.current_rally > self.game_state.longest_rally:
                 self.game_state.longest_rally = self.game_state.current_rally
+            if self.recorder is not None:
+                self.recorder.score(self.tick_number, self.game_state.player1.score,
+                                    self.game_state.player2.score)
             await self.send_score()
-            await self.post_rally_animation()
-            if self.game_state.is_game_over():
-                self.game_state.in_progress = False
-                break  # Ensure the loop exits once the game is over
+            if self.goal_animation_sids or self.spectator_goal_animation_sids:
+                await self.send_goal_animation()
+            self.phase = PHASE_POST_RALLY
+            self.phase_ticks = POST_RALLY_TICKS
 
+    # finish_loop method
+    # Wakes up game_loop so the game can be ended
+    def finish_loop(self) -> None:
+        scheduler.unregister(self.game_id)
+        if self.loop_done is not None and not self.loop_done.done():
+            self.loop_done.set_result(None)
 
     # run_game method
     # Runs the game loop
     # When game loop is over, calls for end_game method
+    # 'game_start' carries the server time and the tick rate, for the clients' interpolation
+    # buffers
     async def run_game(self) -> None:
-        for sid in self.sids:
-            await sio.emit('game_start', {'type': 'game_start', 'gameId': self.game_id}, room=sid)
+        data = {'type': 'game_start', 'gameId': self.game_id,
+                'serverTime': round(server_time(), 1), 'tickRate': TICK_RATE}
+        await sio.emit('game_start', data, room=self.room)
         await asyncio.sleep(1.0)
         self.game_loop_task = asyncio.create_task(self.game_loop())
         # Wait for the game loop to finish
@@ -112,46 +436,150 @@ class PongGame:
     # The updated game state is sent to the client
     async def update_game_state(self):
         self.game_state.current_rally += 1
-        self.game_state.ball.update_position()
-        self.game_state.handle_collisions()
+        if self.rally_simulation is not None:
+            self.rally_time += TICK_STEP
+            scored = self.rally_simulation.advance_to(self.rally_time)
+            if scored or self.broadcast_due():
+                self.rally_simulation.sync(self.rally_time)
+        elif SWEPT_COLLISIONS:
+            self.game_state.advance(TICK_STEP)
+        else:
+            self.game_state.ball.update_position(TICK_STEP)
+            self.game_state.handle_collisions()
         self.game_state.current_rally += 1
         if self.game_state.check_goal():
             self.game_state.paused = True
-        await self.send_game_state_to_client()
- 
+        if self.broadcast_due():
+            await self.send_game_state_to_client()
+
+    # broadcast_due method
+    # Whether this rally tick sends a state frame: every BROADCAST_EVERY ticks,
+    # and always on bounces and goals so clients never miss a change of direction
+    # With ADAPTIVE_BROADCAST on bounces, goals, paddle input and when the clients' prediction is
+    # stale
+    def broadcast_due(self) -> bool:
+        if ADAPTIVE_BROADCAST:
+            return (self.game_state.bounce or self.game_state.paused or self.paddles_moved
+                    or self.prediction_stale())
+        return (self.tick_number % BROADCAST_EVERY == 0 or self.game_state.bounce
+                or self.game_state.paused)
+
+    # prediction_stale method
+    # Whether the ball the clients extrapolate from the last frame may differ from the game's:
+    #   - no frame was sent yet, or the last one is HEARTBEAT_EVERY ticks old
+    #   - the ball deltas, hitpos or paused flag changed (wall bounces, serves)
+    #   - the ball is more than ADAPTIVE_MAX_ERROR units away from where the last frame puts it
+    # The ball entity of an event-driven rally only moves when a frame is due, so its position is
+    # not checked, its deltas change at every event
+    def prediction_stale(self) -> bool:
+        if self.last_frame is None:
+            return True
+        tick, x, z, delta_x, delta_z, hitpos, paused = self.last_frame
+        ball = self.game_state.ball
+        if (self.tick_number - tick >= HEARTBEAT_EVERY or ball.delta_x != delta_x
+                or ball.delta_z != delta_z or self.game_state.hitpos != hitpos
+                or self.game_state.paused != paused):
+            return True
+        if self.rally_simulation is not None:
+            return False
+        elapsed = (self.tick_number - tick) * TICK_STEP
+        return (abs(x + delta_x * elapsed - ball.x) > ADAPTIVE_MAX_ERROR
+                or abs(z + delta_z * elapsed - ball.z) > ADAPTIVE_MAX_ERROR)
+
+    # spectator_frame_due method
+    # Whether the state frame of this tick also goes to the spectators: every SPECTATOR_EVERY
+    # ticks, and always when forced (bounces, goals, the first frame of a serve)
+    # Adaptive rally frames all go to the spectators, each of them changes what the clients predict
+    def spectator_frame_due(self, forced=False) -> bool:
+        return self.spectator_count() > 0 and (
+            forced or self.tick_number % SPECTATOR_EVERY == 0
+            or (ADAPTIVE_BROADCAST and self.phase == PHASE_RALLY))
+
+    # frame_rooms method
+    # Returns the rooms a state frame of the protocol goes to, as a single room when there is only
+    # one
+    # None when neither the players nor the spectators of the protocol get this frame
+    def frame_rooms(self, protocol, players, spectators):
+        rooms = []
+        if players and self.protocol_sids[protocol]:
+            rooms.append(state_room(self.game_id, protocol))
+        if spectators and self.spectator_sids[protocol]:
+            rooms.append(spectator_room(self.game_id, protocol))
+        if not rooms:
+            return None
+        return rooms[0] if len(rooms) == 1 else rooms
+
     # send_game_state_to_client method
     # Sends the game state to the client
-    # The game state is sent as a JSON object
-    # The JSON object contains the game ID, ball position, and player positions
-    # The JSON object is sent to each client session ID in
-    # the game instance's sids list
-    async def send_game_state_to_client(self):
+    # Each protocol version with at least one session gets its own frame:
+    #   - JSON clients get the 'send_game_state' object with the game ID, ball position,
+    #     and player positions
+    #   - binary clients get a packed 'send_game_state_v2' frame (see protocol.py)
+    #   - delta clients get a 'state_delta' keyframe or only the fields that changed since the
+    #     last frame
+    # Every frame is encoded once and sent to the protocol's state room
+    # When the frame is due for the spectators (spectator_frame_due by default), JSON and binary
+    # frames are sent in the same emit to the protocol's spectator room, so they are still encoded
+    # once
+    # Delta spectators skip frames, so they get their own stream from spectator_delta_encoder
+    # players=False only sends the frame to the spectators
+    # Frames sent to the players are counted (see state_frame_rate) and kept in last_frame
+    # Frames carry the tick number and time, and the sequence numbers of the last processed input
+    # of both players once a client of the game numbers its inputs (see acknowledged_inputs)
+    async def send_game_state_to_client(self, players=True, spectators=None):
+        if spectators is None:
+            spectators = self.spectator_frame_due(self.game_state.bounce or self.game_state.paused)
+        input_seqs = self.acknowledged_inputs()
+        tick_time = round(self.tick_time, 1)
+        if players:
+            ball = self.game_state.ball
+            self.last_frame = (self.tick_number, ball.x, ball.z, ball.delta_x, ball.delta_z,
+                               self.game_state.hitpos, self.game_state.paused)
+            self.frames_sent += 1
+        rooms = self.frame_rooms(PROTOCOL_BINARY, players, spectators)
+        if rooms is not None:
+            frame = encode_state_v2(self.game_state, self.tick_number, input_seqs, tick_time)
+            await sio.emit('send_game_state_v2', frame, room=rooms)
+        if players and self.protocol_sids[PROTOCOL_DELTA]:
+            frame = self.delta_encoder.encode(self.game_state, self.tick_number, input_seqs,
+                                              tick_time)
+            await sio.emit('state_delta', frame, room=state_room(self.game_id, PROTOCOL_DELTA))
+        if spectators and self.spectator_sids[PROTOCOL_DELTA]:
+            frame = self.spectator_delta_encoder.encode(self.game_state, self.tick_number,
+                                                        input_seqs, tick_time)
+            await sio.emit('state_delta', frame, room=spectator_room(self.game_id, PROTOCOL_DELTA))
+        rooms = self.frame_rooms(PROTOCOL_JSON, players, spectators)
+        if rooms is None:
+            return
         game_state_data = {
             'type': 'send_game_state',
             'gameId': self.game_state.game_id,
+            'tick': self.tick_number,
+            'serverTime': tick_time,
             'ballPosition': {
-                'x': self.game_state.ball.x,
+                'x': json_float(self.game_state.ball.x),
                 'y': self.game_state.ball.y,
-                'z': self.game_state.ball.z,       
+                'z': json_float(self.game_state.ball.z),
             },
             'ballDelta': {
-                'dx': self.game_state.ball.delta_x,
-                'dz': self.game_state.ball.delta_z,
+                'dx': json_float(self.game_state.ball.delta_x),
+                'dz': json_float(self.game_state.ball.delta_z),
             },
             'player1Pos': {
                 'x': self.game_state.player1.paddle.x,
-                'z': self.game_state.player1.paddle.z,
+                'z': json_float(self.game_state.player1.paddle.z),
             },
             'player2Pos': {
                 'x': self.game_state.player2.paddle.x,
-                'z': self.game_state.player2.paddle.z,
+                'z': json_float(self.game_state.player2.paddle.z),
             },
             'bounce' : self.game_state.bounce,
-            'hitpos' : self.game_state.hitpos,
+            'hitpos' : json_float(self.game_state.hitpos),
             'paused': self.game_state.paused,
         }
-        for sid in self.sids:
-            await sio.emit('send_game_state', game_state_data, room=sid)
+        if input_seqs is not None:
+            game_state_data['player1Seq'], game_state_data['player2Seq'] = input_seqs
+        await sio.emit('send_game_state', game_state_data, room=rooms)
 
     # end_game method
     # Ends the game
@@ -165,10 +593,13 @@ class PongGame:
             try:
                 await self.game_loop_task  # Await to handle cancellation gracefully
             except asyncio.CancelledError:
-                logging.info(f"Game loop for game {self.game_state.game_id} was cancelled.")
+                logging.info(f"Game loop for game {self.game_id} was cancelled.")
         else:
             logging.warning("Game loop task is None; cannot await a non-existent task.")
-        
+        if self.game_state is None:
+            # cancel_game finished the game while the loop was shutting down
+            return
+
         if self.game_state.player1.score > self.game_state.player2.score:
             winner = self.game_state.player1.id
         else:
@@ -186,24 +617,69 @@ class PongGame:
             "longest_rally": self.game_state.longest_rally,
             "game_duration": GAME_DURATION - self.game_state.time_remaining
         }
-        for sid in self.sids:
-            await sio.emit('game_over', json_data, room=sid)
-        self.sids.clear()  # Clear all session IDs from the game instance
+        await sio.emit('game_over', json_data, room=self.room)
+        if self.is_remote:
+            # only remote games have a game_history record
+            result_writer.submit(game_result(json_data))
+        await self.close_rooms()
+        self.release_sessions()  # Clear all session IDs from the game instance
+        metrics.finish_game(self.game_id)
         del active_games[self.game_id]  # Remove the game instance from the active games
         del self.game_state  # If possible, clear the game state
         print_active_games()
-        
+
 
     # post_rally_animation method
-    # Runs the post-rally animation (aka ball going through the goal)
-    # The ball position is updated for 40 frames
-    # The updated game state is sent to the clients each frame
+    # Runs one frame of the post-rally animation (aka ball going through the goal)
+    # Called every tick for POST_RALLY_TICKS ticks
+    # The updated game state is sent to the clients every BROADCAST_EVERY ticks,
+    # unless every session of the game animates the goal itself
+    # The same goes for the spectators, at their own rate
     async def post_rally_animation(self):
-        for _ in range(60):  # Adjust the range to control the duration of the animation
-            self.game_state.ball.update_position()
-            await self.send_game_state_to_client()
-            await asyncio.sleep(0.016)  # Adjust this to control the speed of the animation
-    
+        self.game_state.ball.update_position(TICK_STEP)
+        if self.tick_number % BROADCAST_EVERY == 0:
+            players = self.streams_post_rally()
+            spectators = self.spectators_stream_post_rally() and self.spectator_frame_due()
+            if players or spectators:
+                await self.send_game_state_to_client(players=players, spectators=spectators)
+
+    # streams_post_rally method
+    # Whether a session of the game needs state frames during the post-rally animation
+    # In a game mixing old and new clients everyone gets the frames, new clients keep animating
+    # from the event
+    def streams_post_rally(self) -> bool:
+        return len(self.goal_animation_sids) < len(self.sids)
+
+    # spectators_stream_post_rally method
+    # Whether a spectator of the game needs state frames during the post-rally animation
+    def spectators_stream_post_rally(self) -> bool:
+        return len(self.spectator_goal_animation_sids) < self.spectator_count()
+
+    # send_goal_animation method
+    # Sends the trajectory of the ball through the goal: start position, velocity in units per
+    # second and duration in ms, starting at serverTime. The ball moves in a straight line until
+    # the next rally starts, so the clients can animate it without any state frame
+    # The event goes to the game's room, clients without the feature have no handler for it
+    async def send_goal_animation(self):
+        ball = self.game_state.ball
+        data = {
+            'type': 'goal_animation',
+            'gameId': self.game_state.game_id,
+            'tick': self.tick_number,
+            'serverTime': round(self.tick_time, 1),
+            'ballPosition': {
+                'x': json_float(ball.x),
+                'y': ball.y,
+                'z': json_float(ball.z),
+            },
+            'ballVelocity': {
+                'dx': json_float(ball.delta_x * PHYSICS_RATE),
+                'dz': json_float(ball.delta_z * PHYSICS_RATE),
+            },
+            'duration': POST_RALLY_TICKS * 1000 / TICK_RATE,
+        }
+        await sio.emit('goal_animation', data, room=self.room)
+
     # send_score method
     # Sends the player scores to the clients
     # The player scores are sent as a JSON object
@@ -213,10 +689,11 @@ class PongGame:
             'gameId': self.game_state.game_id,
             'player1Score': self.game_state.player1.score,
             'player2Score': self.game_state.player2.score,
+            'tick': self.tick_number,
+            'serverTime': round(self.tick_time, 1),
         }
-        for sid in self.sids:
-            await sio.emit('score', data, room=sid)
- 
+        await sio.emit('score', data, room=self.room)
+
     async def cancel_game(self):
         # Mark the game as not in progress
         self.game_state.in_progress = False
@@ -227,7 +704,7 @@ class PongGame:
             try:
                 await self.game_loop_task  # Await to handle cancellation gracefully
             except asyncio.CancelledError:
-                logging.info(f"Game loop for game {self.game_state.game_id} was cancelled.")
+                logging.info(f"Game loop for game {self.game_id} was cancelled.")
             except Exception as e:
                 logging.error(f"Error while awaiting game loop cancellation: {e}")
 
@@ -237,14 +714,15 @@ class PongGame:
             'gameId': self.game_state.game_id,
             'message': 'Game has been cancelled',
         }
-        for sid in self.sids:
-            try:
-                await sio.emit('cancel_game', data, room=sid)
-            except Exception as e:
-                logging.error(f"Error sending cancel_game message to {sid}: {e}")
+        try:
+            await sio.emit('cancel_game', data, room=self.room)
+        except Exception as e:
+            logging.error(f"Error sending cancel_game message to game {self.game_id}: {e}")
 
         # Clear all session IDs from the game instance
-        self.sids.clear()
+        await self.close_rooms()
+        self.release_sessions()
+        metrics.finish_game(self.game_id)
 
         # Remove the game instance from the active games
         if self.game_id in active_games:
@@ -256,13 +734,16 @@ class PongGame:
     # handle_paddle_movement method
     # Handles paddle movement
     # The 'data' parameter is a dictionary containing the paddle movement data
+    # Inputs are not applied right away, they are queued per player and applied on the next tick,
+    # the state is only sent from the tick
+    # The optional 'seq' key numbers the inputs of a client, see receive_input_seq
     async def handle_paddle_movement(self, sid, data):
 
         if not isinstance(data, dict):  # Ensure data is a dictionary
             logging.error("Received data is not a dictionary")
             return
 
-        if not hasattr(self, 'game_state'):
+        if getattr(self, 'game_state', None) is None:
             logging.error("Game state is not initialized")
             return
 
@@ -280,27 +761,195 @@ class PongGame:
                 if not player_id:
                     logging.error(f"No player ID associated with sid: {sid}")
                     return
-                
+
                 p_delta_z = data.get('delta_z')
-                if player_id == self.game_state.player1.id:
-                    self.game_state.move_player(player_id, p_delta_z)
-                elif player_id == self.game_state.player2.id:
-                    self.game_state.move_player(player_id, p_delta_z)
-                else:
-                    logging.error(f"Player ID {player_id} not found in game state")
+                self.receive_input_seq(player_id, data.get('seq'))
+                if not self.allow_input(sid):
+                    return
+                self.queue_input(player_id, p_delta_z)
             else:
                 player1_id = data.get('player1_id')
                 p1_delta_z = data.get('p1_delta_z')
                 player2_id = data.get('player2_id')
                 p2_delta_z = data.get('p2_delta_z')
+                for player_id in (player1_id, player2_id):
+                    self.receive_input_seq(player_id, data.get('seq'))
+                if not self.allow_input(sid):
+                    return
                 if player1_id is not None and p1_delta_z is not None:
-                    self.game_state.move_player(player1_id, p1_delta_z)
-                
+                    self.queue_input(player1_id, p1_delta_z)
+
                 if player2_id is not None and p2_delta_z is not None:
-                    self.game_state.move_player(player2_id, p2_delta_z)
-        await self.send_game_state_to_client()
+                    self.queue_input(player2_id, p2_delta_z)
+
+    # allow_input method
+    # Checks the input rate limit of the connection
+    # Inputs over MAX_INPUTS_PER_SECOND are dropped
+    def allow_input(self, sid) -> bool:
+        limiter = self.input_limiters.get(sid)
+        if limiter is None:
+            limiter = self.input_limiters[sid] = InputRateLimiter()
+        if limiter.allow():
+            return True
+        logging.debug(f"Input rate limit reached for sid: {sid}")
+        return False
+
+    # receive_input_seq method
+    # Notes the client sequence number of a player's input
+    # The input counts as processed on the next tick, also when it was dropped (rate limit,
+    # invalid delta, full queue), so the client stops predicting it once the next frame arrives
+    # Sequence numbers are unsigned 32-bit ints growing by one per input
+    def receive_input_seq(self, player_id, seq) -> None:
+        if player_id not in self.input_queues:
+            return
+        if isinstance(seq, bool) or not isinstance(seq, int) or not 0 <= seq <= UINT32_MAX:
+            return
+        self.input_seqs[player_id] = seq
+
+    # acknowledged_inputs method
+    # Returns the sequence numbers of the last processed input of player 1 and player 2,
+    # 0 for a player without numbered inputs
+    # Returns None while no client of the game numbers its inputs
+    def acknowledged_inputs(self):
+        if not self.input_acks:
+            return None
+        return (self.input_acks.get(self.game_state.player1.id, 0),
+                self.input_acks.get(self.game_state.player2.id, 0))
+
+    # queue_input method
+    # Pushes a paddle delta into the player's input queue
+    # The input is applied at the start of the next tick
+    # json accepts NaN and Infinity, so non-finite deltas and ints beyond the float range are
+    # rejected, and a delta moves a paddle at most FIELD_WIDTH like a paddle stopping at the wall
+    def queue_input(self, player_id, delta_z) -> None:
+        queue = self.input_queues.get(player_id)
+        if queue is None:
+            logging.error(f"Player ID {player_id} not found in game state")
+            return
+        if isinstance(delta_z, bool) or not isinstance(delta_z, (int, float)):
+            logging.error(f"Invalid paddle delta from player {player_id}: {delta_z}")
+            return
+        try:
+            delta_z = float(delta_z)
+        except OverflowError:
+            delta_z = math.nan
+        if not math.isfinite(delta_z):
+            logging.error(f"Invalid paddle delta from player {player_id}: {delta_z}")
+            return
+        queue.push(max(-FIELD_WIDTH, min(FIELD_WIDTH, delta_z)))
+
+    # apply_inputs method
+    # Applies the merged queued inputs of both players
+    # The merged delta is applied in steps of at most PADDLE_SPEED,
+    # so the paddles move the same distance as when every input was applied on arrival
+    # (paddles stop at the walls, so a delta over FIELD_WIDTH moves them as far as FIELD_WIDTH)
+    # The merged deltas are what a game recording stores for the tick
+    # The inputs received so far are acknowledged in the next state frames
+    # Returns True if any paddle input was applied
+    def apply_inputs(self) -> bool:
+        if self.input_seqs:
+            self.input_acks.update(self.input_seqs)
+            self.input_seqs.clear()
+        moved = False
+        for player_id, queue in self.input_queues.items():
+            if not queue:
+                continue
+            moved = True
+            remaining = max(-FIELD_WIDTH, min(FIELD_WIDTH, queue.drain()))
+            if self.recorder is not None:
+                player_number = 1 if player_id == self.game_state.player1.id else 2
+                self.recorder.input(self.tick_number, player_number, remaining)
+            while remaining != 0:
+                step = max(-PADDLE_SPEED, min(PADDLE_SPEED, remaining))
+                self.game_state.move_player(player_id, step)
+                remaining -= step
+        return moved
+
+# create_recorder function
+# Returns a GameRecorder writing the game's recording to the stream
+def create_recorder(game, stream):
+    meta = {
+        'game_id': game.game_id,
+        'player1_id': game.game_state.player1.id,
+        'player2_id': game.game_state.player2.id,
+        'is_remote': game.is_remote,
+        'started_at': time.time(),
+    }
+    flags, tick_rate, broadcast_every = RECORDING_CONFIG
+    return GameRecorder(stream, game.seed, meta, flags, tick_rate, broadcast_every)
+
+# run_batch_physics function
+# Scheduler step hook: steps every queued rally at once and lets the games finish their tick
+async def run_batch_physics():
+    for game in physics_engine.step(TICK_STEP):
+        try:
+            await game.finish_rally_tick()
+        except Exception as e:
+            logging.error(f"Rally tick failed for game {game.game_id}: {e}")
+
+if physics_engine is not None:
+    scheduler.add_step_hook(run_batch_physics)
+
+# state_frame_rate function
+# Returns the state frames per second sent to the players of a game, averaged over the running
+# games
+def state_frame_rate() -> float:
+    rates = [game.frames_sent * TICK_RATE / game.tick_number
+             for game in active_games.values() if game.tick_number > 0]
+    return sum(rates) / len(rates) if rates else 0.0
+
+if metrics.METRICS_ENABLED:
+    scheduler.add_tick_listener(metrics.record_tick)
+    token_validator.latency_listeners.append(metrics.record_token_latency)
+    metrics.registry.gauge('game_server_dropped_ticks_total',
+                           'Ticks skipped because the scheduler fell too far behind',
+                           lambda: scheduler.dropped_ticks, type='counter')
+    metrics.registry.gauge('game_server_token_errors_total', 'Failed token service requests',
+                           lambda: token_validator.errors, type='counter')
+    metrics.registry.gauge('game_server_token_cache_hits_total',
+                           'Token validations answered from the cache',
+                           lambda: token_validator.hits, type='counter')
+    metrics.registry.gauge('game_server_token_cache_misses_total',
+                           'Token validations that went to the token service',
+                           lambda: token_validator.misses, type='counter')
+    metrics.registry.gauge('game_server_token_cache_hit_rate',
+                           'Share of the token validations answered from the cache',
+                           lambda: token_validator.stats()['cache_hit_rate'])
+    metrics.registry.gauge('game_server_state_frames_per_second',
+                           'State frames per second sent to the players of a game, averaged over '
+                           'the running games',
+                           state_frame_rate)
+
+# Results of finished remote games are saved to game_history in the background
+# (see result_writer.py)
+if result_writer.enabled:
+    startup_callbacks.append(result_writer.start)
+    shutdown_callbacks.append(result_writer.close)
+    if metrics.METRICS_ENABLED:
+        metrics.registry.gauge('game_server_pending_results',
+                               'Game results not saved to game_history yet',
+                               lambda: len(result_writer.pending))
+
+# Whether new games are accepted, turned off while the server drains on shutdown
+accepting_games = True
+
+# stop_accepting_games function
+# Called when the server starts draining, start_game and join_game are refused from then on
+def stop_accepting_games():
+    global accepting_games
+    accepting_games = False
+
+# refuse_while_draining function
+# Tells the client that no new game can start, returns True if the server is draining
+async def refuse_while_draining(sid) -> bool:
+    if accepting_games:
+        return False
+    await sio.emit('error', {'message': 'Server is shutting down'}, room=sid)
+    return True
 
 def print_active_games():
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        return
     if active_games:
         logging.info("List of active games:")
         for game_id, game_instance in active_games.items():
@@ -321,7 +970,12 @@ async def connect(sid, environ):
         "PADDLE_WIDTH": PADDLE_WIDTH,
         "PADDLE_DEPTH": PADDLE_DEPTH,
         "BALL_RADIUS": BALL_RADIUS,
-        "PADDLE_SPEED": PADDLE_SPEED
+        "PADDLE_SPEED": PADDLE_SPEED,
+        "TICK_RATE": TICK_RATE,
+        "BROADCAST_RATE": BROADCAST_RATE,
+        "ADAPTIVE_BROADCAST": ADAPTIVE_BROADCAST,
+        "PHYSICS_RATE": PHYSICS_RATE,
+        "PROTOCOLS": list(SUPPORTED_PROTOCOLS)
     }
     await sio.emit('game_defaults', json_data, room=sid)
 
@@ -333,12 +987,17 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     logging.info(f'Disconnect: {sid}')
+    sid_to_protocol.pop(sid, None)
+    sid_to_features.pop(sid, None)
+    remove_game_request(sid)
+    stop_replay(sid)
+    await detach_spectator(sid)
     if sid in sid_to_game:
         game_id = sid_to_game.pop(sid, None)
         if game_id is not None and game_id in active_games:
             game_instance = active_games[game_id]
             if sid in game_instance.sids:
-                game_instance.sids.remove(sid)
+                await game_instance.remove_player(sid)
                 if game_instance.is_remote and not game_instance.is_quit and game_instance.sids.__len__() == 1:
                     await game_instance.cancel_game()
                 elif game_instance.sids.__len__() == 0:
@@ -365,8 +1024,8 @@ async def message(sid, data):
 async def start_game(sid, data):
     # Log the received data
     logging.info(f"Start game request from {sid}: {data}")
-    
-    if await validate_data(data) is False:
+
+    if await refuse_while_draining(sid) or await validate_data(data) is False:
         return
 
     # Extract values
@@ -374,6 +1033,8 @@ async def start_game(sid, data):
     player1_id = data.get('player1_id')
     player2_id = data.get('player2_id')
     is_remote = data.get('is_remote')
+    sid_to_protocol[sid] = negotiate_protocol(data)
+    sid_to_features[sid] = negotiate_features(data)
     if game_id in active_games:
         await active_games[game_id].end_game()
         del active_games[game_id]
@@ -381,9 +1042,9 @@ async def start_game(sid, data):
     try:
         game_instance = PongGame(game_id, player1_id, player2_id, is_remote)
         active_games[game_id] = game_instance  # Track game instance by game_id
-        game_instance.sids = [sid]  # Initialize with the current session id
+        await game_instance.add_player(sid, player1_id)  # Initialize with the current session id
         sid_to_game[sid] = game_id
-        
+
         # Start the game in a separate task
         asyncio.create_task(game_instance.run_game())
     except Exception as e:
@@ -397,32 +1058,28 @@ async def start_online_game(p1_sid, p2_sid, game_id, player1_id, player2_id):
     try:
         game_instance = PongGame(game_id, player1_id, player2_id, True)
         active_games[game_id] = game_instance  # Track game instance by game_id
-        game_instance.sids = [p1_sid, p2_sid]  # Initialize with the current session id
-        #game_instance.add_player(p1_sid, player1_id)
-        #game_instance.add_player(p2_sid, player2_id)
+        await game_instance.add_player(p1_sid, player1_id)
+        await game_instance.add_player(p2_sid, player2_id)
         sid_to_game[p1_sid] = game_id
         sid_to_game[p2_sid] = game_id
-        
+
         # Start the game in a separate task
         asyncio.create_task(game_instance.run_game())
     except Exception as e:
         logging.error(f"Error starting game: {e}")
         await sio.emit('error', {'message': 'Error starting game'}, room=sid)
 
-def validate_token(id, token):
-    if token:
-        data = {"id" : id, "access" : token, "is_frontend" : True}
-        response = requests.post(f"{TOEKNSERVICE}/auth/token/validate-token/", data=data)
-        response_data = response.json()
-        if "error" not in response_data:
-            return True
-    return False
+# validate_token function
+# Validates the player's token against the token service
+# Runs on the pooled async client, so live games keep ticking while the token service responds
+async def validate_token(id, token):
+    return await token_validator.validate(id, token)
 
 @sio.event
 async def join_game(sid, data):
     # Log the received data
-    
-    if await validate_data(data) is False:
+
+    if await refuse_while_draining(sid) or await validate_data(data) is False:
         return
 
     # Extract values
@@ -433,10 +1090,12 @@ async def join_game(sid, data):
     is_remote = data.get('is_remote')
     token = data.get('token')
 
-    if validate_token(local_player_id, token) is False:
+    if await validate_token(local_player_id, token) is False:
         await sio.emit('invalid_token', room=sid)
         return
-    couple = coupled_request(game_id, player1_id, player2_id)
+    sid_to_protocol[sid] = negotiate_protocol(data)
+    sid_to_features[sid] = negotiate_features(data)
+    couple = coupled_request(game_id, player1_id, player2_id, sid)
     if couple is not None:
         if player1_id == local_player_id:
             player1_sid = sid
@@ -447,7 +1106,9 @@ async def join_game(sid, data):
         await start_online_game(player1_sid, player2_sid, game_id, player1_id, player2_id)
     else: 
         game_request = GameRequest(sid, game_id, player1_id, player2_id, is_remote)
-        remote_game_requests.append(game_request)
+        replaced = add_game_request(game_request)
+        if replaced is not None:
+            await replaced.send_cancel()
         return
 
 # This function is called when a client sends a move_paddle message to the server
@@ -468,10 +1129,151 @@ async def move_paddle(sid, data):
         await sio.emit('error', {'message': 'No active game instance'}, room=sid)
         logging.error(f"No active game instance for sid: {sid}")
 
+# Replays streamed to sessions, the streaming task of each session ID
+sid_to_replay = {}
+
+# Event handler for spectate_game message
+# Attaches the session to a running game as a spectator
+# data: {'game_id', 'protocol', 'features'}
+# The client gets 'spectate_start' (see PongGame.add_spectator), then the game's state frames at
+# SPECTATOR_FRAME_RATE and its score, goal animation and game over events
+# A session watches one game at a time, spectating another game leaves the first one
+@sio.event
+async def spectate_game(sid, data):
+    game_id = data.get('game_id') if isinstance(data, dict) else None
+    game = active_games.get(game_id) if game_id is not None else None
+    if game is None or getattr(game, 'game_state', None) is None:
+        await sio.emit('error', {'message': 'No running game with this ID'}, room=sid)
+        return
+    if sid in game.sids:
+        await sio.emit('error', {'message': 'Players cannot spectate their own game'}, room=sid)
+        return
+    await detach_spectator(sid)
+    if game.spectator_count() >= MAX_SPECTATORS:
+        await sio.emit('error', {'message': 'Too many spectators for this game'}, room=sid)
+        return
+    sid_to_protocol[sid] = negotiate_protocol(data)
+    sid_to_features[sid] = negotiate_features(data)
+    await game.add_spectator(sid)
+    logging.info(f"Session {sid} spectates game {game_id} ({game.spectator_count()} spectators)")
+
+# Event handler for stop_spectating message
+# Stops sending the watched game to the session
+@sio.event
+async def stop_spectating(sid, data=None):
+    await detach_spectator(sid)
+
+# detach_spectator function
+# Detaches the session from the game it is watching, if any
+async def detach_spectator(sid):
+    game_id = sid_to_spectated.pop(sid, None)
+    game = active_games.get(game_id) if game_id is not None else None
+    if game is not None:
+        await game.remove_spectator(sid)
+
+# Event handler for replay_game message
+# Streams the latest recording of a game to the client, re-simulated from its inputs
+# data: {'game_id', 'speed' (times real time, default 1), 'protocol'}
+# The client gets 'replay_start' with the replay ID, then the regular state and score events
+# of a game with that ID, then 'replay_end' with the final scores
+@sio.event
+async def replay_game(sid, data):
+    game_id = data.get('game_id') if isinstance(data, dict) else None
+    path = find_recording(game_id) if game_id is not None else None
+    if path is None:
+        await sio.emit('error', {'message': 'No recording for this game'}, room=sid)
+        return
+    try:
+        speed = min(MAX_REPLAY_SPEED, max(1.0 / MAX_REPLAY_SPEED, float(data.get('speed', 1.0))))
+    except (TypeError, ValueError):
+        speed = 1.0
+    try:
+        recording = await asyncio.to_thread(Recording.load, path)
+    except (OSError, RecordingError) as e:
+        logging.error(f"Cannot load recording {path}: {e}")
+        await sio.emit('error', {'message': 'Recording cannot be read'}, room=sid)
+        return
+    stop_replay(sid)
+    sid_to_protocol[sid] = negotiate_protocol(data)
+    sid_to_features[sid] = negotiate_features(data)
+    sid_to_replay[sid] = asyncio.create_task(stream_replay(sid, recording, speed))
+
+# stream_replay function
+# Replays the recording to one session at the given speed
+# The replayed game is not an active game, it is stepped here instead of by the scheduler
+async def stream_replay(sid, recording, speed):
+    replay = GameReplay(recording, game_id=f"replay_{sid}")
+    game = replay.game
+    await game.add_player(sid, game.game_state.player1.id)
+    await sio.emit('replay_start', {
+        'type': 'replay_start',
+        'gameId': recording.meta.get('game_id'),
+        'replayId': game.game_id,
+        'speed': speed,
+        'ticks': replay.last_tick,
+    }, room=sid)
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / (recording.tick_rate * speed)
+    deadline = loop.time()
+    try:
+        while not replay.done:
+            await replay.step()
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+        await sio.emit('replay_end', {
+            'type': 'replay_end',
+            'gameId': recording.meta.get('game_id'),
+            'replayId': game.game_id,
+            'player1Score': game.game_state.player1.score,
+            'player2Score': game.game_state.player2.score,
+        }, room=sid)
+    finally:
+        await game.close_rooms()
+        if sid_to_replay.get(sid) is asyncio.current_task():
+            del sid_to_replay[sid]
+
+# stop_replay function
+# Stops the replay streamed to the session, if any
+def stop_replay(sid):
+    task = sid_to_replay.pop(sid, None)
+    if task is not None:
+        task.cancel()
+
+# Event handler for request_keyframe message
+# Sent by delta protocol clients that missed a frame, players and spectators
+# The keyframe of the last sent frame goes only to the requesting client,
+# the following delta frames of its stream apply on top of it
+# The stream's next keyframe also comes sooner, in case the send queue drops this one
+@sio.event
+async def request_keyframe(sid, data=None):
+    if sid_to_game.get(sid) in active_games:
+        encoder = active_games[sid_to_game[sid]].delta_encoder
+    elif sid_to_spectated.get(sid) in active_games:
+        encoder = active_games[sid_to_spectated[sid]].spectator_delta_encoder
+    else:
+        return
+    encoder.frame_missed()
+    keyframe = encoder.keyframe()
+    if keyframe is not None:
+        await sio.emit('state_delta', keyframe, room=sid)
+
+# Event handler for clock_ping message
+# Clock synchronization: the client sends its own clock ('clientTime') and gets it back
+# in 'clock_pong' with the server time when the ping was handled
+# From the round trip the client estimates the offset of the server clock, and renders
+# the timestamped state frames at a fixed delay behind the server
+@sio.event
+async def clock_ping(sid, data=None):
+    client_time = data.get('clientTime') if isinstance(data, dict) else None
+    if isinstance(client_time, bool) or not isinstance(client_time, (int, float)):
+        client_time = None
+    await sio.emit('clock_pong',
+                   {'clientTime': client_time, 'serverTime': round(server_time(), 1)}, room=sid)
+
 @sio.event
 async def quit_game(sid, data):
     logging.info(f"Quit game request from {sid}: {data}")
-    
+
     game_id = data.get('game_id')
     player_id = data.get('player_id')
 
@@ -506,10 +1308,7 @@ async def quit_game(sid, data):
         }
 
         # Emit the `quit_game` event to all connected clients in the game session
-        for receiver_sid in game_instance.sids:
-            if receiver_sid == sid:
-                continue
-            await sio.emit('quit_game', json_data, room=receiver_sid)
+        await sio.emit('quit_game', json_data, room=game_instance.room, skip_sid=sid)
 
         # End the game and remove it from active games
         await game_instance.end_game()
@@ -525,22 +1324,52 @@ async def quit_game(sid, data):
 async def test(sid):
     await sio.emit('test', {'message': 'Test message'}, room=sid)
 
-def start_uvicorn():
-    uvicorn.run(app, host='0.0.0.0', port=8010, log_level="info", log_config=logging_config)
+# main function
+# Serves the app with the settings of launcher.py until the process is stopped
+# On shutdown the running games get SHUTDOWN_DRAIN_TIMEOUT seconds to finish
+# With game workers the games run in the workers, the drain waits for the games they report
+def main(worker_pool=None):
+    if worker_pool is not None:
+        running_games = worker_pool.running_games
+    else:
+        running_games = lambda: len(active_games)
+    launcher.run(app, log_config=logging_config, running_games=running_games,
+                 on_drain=stop_accepting_games)
+
 
-async def check_timed_out_requests():
-    for request in remote_game_requests[:]: #make a shallow coppy so it doesnt affect current for loop
-        if await request.has_timed_out() is True:
-            remote_game_requests.remove(request)
+# start_worker_pool function
+# Forks the game worker processes and routes the game events to them
+# Has to run before the event loop is started
+def start_worker_pool(size):
+    worker_pool = WorkerPool(size)
+    worker_pool.start()
+    worker_pool.attach(sio)
+    startup_callbacks.append(worker_pool.listen)
+    logging.info(f"Running games on {size} worker processes")
+    return worker_pool
 
 
-async def main():
-    uvicorn_thread = threading.Thread(target=start_uvicorn, daemon=True)
-    uvicorn_thread.start()
-    # while 1:
-    #      await check_timed_out_requests()
-    uvicorn_thread.join()
+# start_cluster_node function
+# Joins the game server cluster, player events are then run on the node owning their game
+def start_cluster_node(broker):
+    cluster_node = ClusterNode(broker)
+    cluster_node.attach(sio)
+    startup_callbacks.append(cluster_node.listen)
+    shutdown_callbacks.append(cluster_node.stop)
+    logging.info(f"Running in cluster mode as node {cluster_node.node_id}")
+    return cluster_node
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    # modules importing 'server' (workers, cluster, replays) get this module instead of a
+    # second copy
+    sys.modules.setdefault('server', sys.modules[__name__])
+    worker_pool = None
+    if cluster_broker is not None:
+        if GAME_WORKERS > 0:
+            logging.warning(
+                "GAME_WORKERS is ignored in cluster mode, scale with more nodes instead")
+        start_cluster_node(cluster_broker)
+    elif GAME_WORKERS > 0:
+        worker_pool = start_worker_pool(GAME_WORKERS)
+    main(worker_pool)
@@ -4,20 +4,44 @@ import json
 import logging
 import socketio
 import os
+import asyncio
+import heapq
+import itertools
+from cluster import create_broker, create_client_manager
+from fan_out import FanOutManager
+from json_codec import json_codec, JsonPacket
+from launcher import LOG_LEVEL, SOCKETIO_TRANSPORTS
+from send_queue import SEND_QUEUE_SIZE, install_send_queues
+from token_validator import token_validator
+import metrics
 
 # Define a dictionary to store active game instances
 active_games = {}
 
-# This will hold all the pendind game requests
-remote_game_requests = []
+# This will hold all the pendind game requests, indexed by (game_id, player1_id, player2_id)
+remote_game_requests = {}
+
+# Expiry heap of the pending game requests, entries are (expires_at, sequence, request)
+# Entries of requests that were paired or replaced stay in the heap and are skipped when popped
+# The sequence keeps requests with the same expiry in the order they were made
+request_expiry_heap = []
+request_sequence = itertools.count()
+
+# Define a dictionary to store the pending game request key of each session ID
+sid_to_request_key = {}
+
+REQUEST_TIMEOUT = 10.0          # seconds a remote game request waits for the other player
+REQUEST_SWEEP_INTERVAL = 1.0    # seconds between two expiry sweeps
+CANCEL_BATCH_SIZE = 100         # cancel_game messages sent concurrently per batch
 
 # Define custom logging configuration
+# LOG_LEVEL (see launcher.py) sets the level of the server's own logs
 logging_config = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
         'default': {
-            'level': 'INFO',
+            'level': LOG_LEVEL.upper(),
             'formatter': 'default',
             'class': 'logging.StreamHandler',
         },
@@ -29,7 +53,7 @@ logging_config = {
     'loggers': {
         '': {
             'handlers': ['default'],
-            'level': 'INFO',
+            'level': LOG_LEVEL.upper(),
         },
         'uvicorn.access': {
             'handlers': ['uvicorn_access'],
@@ -47,64 +71,246 @@ logging_config = {
 HOSTNAME = os.environ.get("HOSTNAME")
 full_host_url = f"https://{HOSTNAME}:3000"
 
+# Cluster broker (Redis or the in-process stand-in), None unless CLUSTER_URL is set
+# In cluster mode the Socket.IO manager shares rooms and emits with the other game server nodes
+cluster_broker = create_broker()
+
 # Create a new ASGI application using the Socket.IO server
 # The 'async_mode' parameter is set to 'asgi' to use the ASGI server
 # The 'cors_allowed_origins' parameter is set to '*' to allow all origins (this needs to be eventually restricted)
+# 'transports' is SOCKETIO_TRANSPORTS, WebSocket only in production (no long-polling requests
+# and upgrades)
+# Without cluster mode emits to a room are sent by FanOutManager (see fan_out.py)
+# Packets are JsonPackets encoded with the JSON_CODEC codec (see json_codec.py)
 sio = socketio.AsyncServer(
     async_mode='asgi',
+    transports=SOCKETIO_TRANSPORTS,
+    client_manager=create_client_manager(cluster_broker) or FanOutManager(),
+    serializer=JsonPacket,
+    json=json_codec,
     cors_allowed_origins= full_host_url,
     logger=False,              # Disable Socket.IO logging
     engineio_logger=False,      # Disable engineio logging
     ping_interval=10,
     ping_timeout=5
 )
-# Create an ASGI application using the Socket.IO server
-# This application can be run using an ASGI server such as Uvicorn
-app = socketio.ASGIApp(sio)
 
 
 # Define a dictionary to store the game instance associated with each session ID
 sid_to_game = {}
 
+# Define a dictionary to store the state frame protocol each session ID asked for in the handshake
+sid_to_protocol = {}
+
+# Define a dictionary to store the game ID each spectator session is watching
+sid_to_spectated = {}
+
+# Define a dictionary to store the optional features each session ID asked for in the handshake
+# (see protocol.py)
+sid_to_features = {}
+
+# Metrics served on /metrics (see metrics.py)
+# Emits are timed per event and the bytes sent to each session are added to its game
+if metrics.METRICS_ENABLED:
+    metrics.instrument_server(sio, sid_to_game.get)
+    metrics.registry.gauge('game_server_active_games', 'Games running on this server',
+                           lambda: len(active_games))
+    metrics.registry.gauge('game_server_connected_sessions', 'Connected Socket.IO sessions',
+                           lambda: len(sio.eio.sockets))
+    metrics.registry.gauge('game_server_pending_game_requests',
+                           'Remote game requests waiting for the other player',
+                           lambda: len(remote_game_requests))
+    metrics.registry.gauge('game_server_spectators', 'Sessions spectating a game',
+                           lambda: len(sid_to_spectated))
+
+# Bounded send queues of slow connections (see send_queue.py)
+# Installed after the metrics, so the dropped state frames are not counted as sent bytes
+send_queues = install_send_queues(sio) if SEND_QUEUE_SIZE > 0 else None
+
+# by_session function
+# Re-keys a dictionary of Engine.IO session IDs by Socket.IO session ID
+def by_session(values: dict) -> dict:
+    return {sio.manager.sid_from_eio_sid(eio_sid, '/') or eio_sid: value
+            for eio_sid, value in values.items()}
+
+# Only connections with a backlog or dropped frames have a per-session sample
+if send_queues is not None and metrics.METRICS_ENABLED:
+    metrics.registry.gauge('game_server_send_queue_depth',
+                           'Messages waiting in the send queue of a slow session',
+                           lambda: by_session(send_queues.depths()), label='sid')
+    metrics.registry.gauge('game_server_session_dropped_frames_total',
+                           'State frames dropped for a slow session',
+                           lambda: by_session(send_queues.drops()), type='counter', label='sid')
+    metrics.registry.gauge('game_server_dropped_frames_total',
+                           'State frames dropped from full send queues',
+                           lambda: send_queues.dropped_events, type='counter', label='event')
+
+# game_room function
+# Returns the name of the Socket.IO room that holds every session of a game
+# Game state frames are emitted once to this room instead of once per session
+def game_room(game_id):
+    return f"game_{game_id}"
+
+# state_room function
+# Returns the name of the room for sessions that receive state frames with the given protocol
+def state_room(game_id, protocol):
+    return f"game_{game_id}_v{protocol}"
+
+# spectator_room function
+# Returns the name of the room for spectators that receive state frames with the given protocol
+def spectator_room(game_id, protocol):
+    return f"game_{game_id}_spectators_v{protocol}"
+
 
 class GameRequest:
     def __init__(self, sid, game_id: int, player1_id, player2_id, is_remote):
         self.time_stamp = time.time()
+        self.expires_at = time.monotonic() + REQUEST_TIMEOUT
         self.game_id = game_id
         self.sid = sid
         self.player1_id = player1_id
         self.player2_id = player2_id
         self.is_remote = is_remote
 
-    async def has_timed_out(self):
-        curr_time = time.time()
-        if (curr_time - self.time_stamp) > 10.0:
-            logging.info("Request game has timed out, sending cancel_game!\n")
-            json_data = {
-                    "type": "cancel_game",
-                    "gameId": self.game_id,
-                    }
-            await sio.emit('cancel_game', json_data, room=self.sid)
-            return True
-        return False
+    # key property
+    # The matchmaking index key, both players of a game send requests with the same key
+    @property
+    def key(self):
+        return (self.game_id, self.player1_id, self.player2_id)
+
+    def has_timed_out(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return now >= self.expires_at
+
+    # send_cancel method
+    # Tells the requester that nobody joined the game in time
+    async def send_cancel(self):
+        json_data = {
+                "type": "cancel_game",
+                "gameId": self.game_id,
+                }
+        await sio.emit('cancel_game', json_data, room=self.sid)
 
     def is_a_match(self, game_id, player1_id, player2_id):
-        if (
-                self.game_id == game_id and
-                self.player1_id == player1_id and
-                self.player2_id == player2_id
-            ):
-            return True
-        else:
-            return False
+        return self.key == (game_id, player1_id, player2_id)
+
+# add_game_request function
+# Stores a pending remote game request and schedules its expiry
+# A newer request with the same key replaces the old one
+# Returns the replaced request if it was made by another session, which is then no longer
+# waiting for anything and has to be told with send_cancel
+# A session asking twice keeps waiting, for its newer request
+def add_game_request(request):
+    replaced = remote_game_requests.get(request.key)
+    remote_game_requests[request.key] = request
+    sid_to_request_key[request.sid] = request.key
+    heapq.heappush(request_expiry_heap, (request.expires_at, next(request_sequence), request))
+    if replaced is None or replaced.sid == request.sid:
+        return None
+    if sid_to_request_key.get(replaced.sid) == request.key:
+        del sid_to_request_key[replaced.sid]
+    return replaced
+
+# coupled_request function
+# Returns and removes the pending request matching the game and players, or None
+# A request made from the same sid is not a match (the player asked twice)
+def coupled_request(game_id, player1_id, player2_id, sid=None):
+    key = (game_id, player1_id, player2_id)
+    request = remote_game_requests.get(key)
+    if request is None or request.sid == sid:
+        return None
+    del remote_game_requests[key]
+    sid_to_request_key.pop(request.sid, None)
+    return request
+
+# remove_game_request function
+# Drops the pending request of a disconnected session
+def remove_game_request(sid):
+    key = sid_to_request_key.pop(sid, None)
+    request = remote_game_requests.get(key)
+    if request is not None and request.sid == sid:
+        del remote_game_requests[key]
+
+# pop_expired_requests function
+# Removes the requests that timed out from the index and returns them
+# Stale heap entries of paired or replaced requests are dropped on the way
+def pop_expired_requests(now=None):
+    if now is None:
+        now = time.monotonic()
+    expired = []
+    while request_expiry_heap and request_expiry_heap[0][0] <= now:
+        _, _, request = heapq.heappop(request_expiry_heap)
+        if remote_game_requests.get(request.key) is request:
+            del remote_game_requests[request.key]
+            if sid_to_request_key.get(request.sid) == request.key:
+                del sid_to_request_key[request.sid]
+            expired.append(request)
+    return expired
+
+# sweep_timed_out_requests function
+# Sends cancel_game to every requester whose request timed out
+# The messages go out concurrently in batches of CANCEL_BATCH_SIZE
+async def sweep_timed_out_requests(now=None):
+    expired = pop_expired_requests(now)
+    if expired:
+        logging.info(f"{len(expired)} game request(s) timed out, sending cancel_game")
+    for start in range(0, len(expired), CANCEL_BATCH_SIZE):
+        batch = expired[start:start + CANCEL_BATCH_SIZE]
+        results = await asyncio.gather(*(request.send_cancel() for request in batch),
+                                       return_exceptions=True)
+        for request, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logging.error(f"Error sending cancel_game to {request.sid}: {result}")
+    return expired
 
-def coupled_request(game_id, player1_id, player2_id):
-    for instance in remote_game_requests:
-        if instance.is_a_match(game_id, player1_id, player2_id):
-            remote_game_requests.remove(instance)
-            return instance
-    return None
+# request_sweeper function
+# Background task expiring pending game requests
+async def request_sweeper():
+    while True:
+        try:
+            await sweep_timed_out_requests()
+        except Exception as e:
+            logging.error(f"Game request sweep failed: {e}")
+        await asyncio.sleep(REQUEST_SWEEP_INTERVAL)
 
+# Background tasks running on the server's event loop
+background_tasks = []
+
+# Coroutine functions run once on the server's event loop at startup
+startup_callbacks = []
+
+# Coroutine functions run once on the server's event loop at shutdown
+shutdown_callbacks = []
+
+# start_background_tasks function
+# Called by the ASGI app on startup
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(request_sweeper()))
+    if metrics.METRICS_ENABLED:
+        background_tasks.append(asyncio.create_task(metrics.monitor_loop_lag()))
+    for callback in startup_callbacks:
+        await callback()
+
+# stop_background_tasks function
+# Called by the ASGI app on shutdown
+# The token validator's pooled HTTP client is closed last
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    for callback in shutdown_callbacks:
+        await callback()
+    await token_validator.close()
+
+# Create an ASGI application using the Socket.IO server
+# This application can be run using an ASGI server such as Uvicorn
+# The background tasks are started and stopped with the application's lifespan
+# Requests outside of /socket.io go to the metrics app, which serves /metrics
+app = socketio.ASGIApp(sio,
+                       other_asgi_app=metrics.metrics_app if metrics.METRICS_ENABLED else None,
+                       on_startup=start_background_tasks, on_shutdown=stop_background_tasks)
 
 #Function Validates the data received from the frontend before the start of the game
 async def validate_data(data):
@@ -0,0 +1,317 @@
+# simulator.py
+# Headless game simulator
+# Runs N PongGame instances with bot players and no sockets (emits go to NullEmitter),
+# either as fast as possible or in real time on a TickScheduler, and reports:
+#   - game ticks per second and scheduler ticks per second
+#   - state frames sent per second of game time (lower with ADAPTIVE_BROADCAST)
+#   - p50/p99/max duration of one scheduler tick (every game ticked once)
+#   - transient bytes allocated per game tick and blocks retained per game tick
+#   - memory per game, measured with tracemalloc while the games are created
+# Usage: python simulator.py [--games N] [--duration S | --ticks T] [--realtime]
+#                            [--bot random|tracking|idle] [--protocol 1|2|3] [--seed S] [--json]
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+from game_logic.game_defaults import *
+from game_workers import NullEmitter
+from tick_scheduler import TickScheduler, TICK_RATE, TICK_INTERVAL
+
+BOT_KINDS = ('random', 'tracking', 'idle')
+BOT_INPUT_RATE = 30         # paddle inputs per second a bot sends at most, like a held key
+ALLOCATION_SAMPLE_TICKS = 100   # scheduler ticks run under tracemalloc for the allocation figures
+
+
+# BotPlayer class
+# Stands in for a client steering one paddle
+# The bot sends an input on about BOT_INPUT_RATE ticks per second:
+#   - random: a random delta of up to PADDLE_SPEED either way
+#   - tracking: moves the paddle towards the ball, at most PADDLE_SPEED per input
+#   - idle: never moves
+class BotPlayer:
+    __slots__ = ('player_id', 'kind', 'rng', 'input_chance')
+
+    def __init__(self, player_id, kind: str, rng: random.Random):
+        if kind not in BOT_KINDS:
+            raise ValueError(f"Unknown bot kind: {kind}")
+        self.player_id = player_id
+        self.kind = kind
+        self.rng = rng
+        self.input_chance = min(1.0, BOT_INPUT_RATE / TICK_RATE)
+
+    # next_input method
+    # Returns the paddle delta the bot sends this tick, or None
+    def next_input(self, game_state):
+        if self.kind == 'idle' or self.rng.random() >= self.input_chance:
+            return None
+        if self.kind == 'random':
+            return self.rng.uniform(-PADDLE_SPEED, PADDLE_SPEED)
+        player = game_state.player1
+        if player.id != self.player_id:
+            player = game_state.player2
+        distance = game_state.ball.z - player.paddle.z
+        if abs(distance) < 1.0:
+            return None
+        return max(-PADDLE_SPEED, min(PADDLE_SPEED, distance))
+
+
+# SimulatedGame class
+# A PongGame driven by two bots
+# The bots queue their inputs before every tick, as move_paddle would between two ticks
+# A finished game starts over with 0-0, so the number of running games stays the same
+class SimulatedGame:
+    __slots__ = ('game', 'bots', 'games_played')
+
+    def __init__(self, game, bots):
+        self.game = game
+        self.bots = bots
+        self.games_played = 0
+
+    async def tick(self) -> None:
+        game = self.game
+        game_state = game.game_state
+        for bot in self.bots:
+            delta_z = bot.next_input(game_state)
+            if delta_z is not None:
+                game.queue_input(bot.player_id, delta_z)
+        await game.tick()
+        if not game_state.in_progress:
+            self.games_played += 1
+            game_state.in_progress = True
+            game_state.player1.score = game_state.player2.score = 0
+            game.start_rally()
+
+
+# percentile function
+# Returns the given percentile of the sorted samples (nearest rank)
+def percentile(sorted_samples, fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+# Simulation class
+# Creates the games and runs them on a private TickScheduler
+# The scheduler gets the step hooks of the server's scheduler (batch physics), so the games
+# run exactly as they do on the server, only their emits are dropped
+# Properties:
+#   - games: the SimulatedGame instances
+#   - durations: duration of every scheduler tick run so far (seconds)
+#   - lateness: how late every scheduler tick started, in real time mode (seconds)
+#   - memory_per_game: bytes allocated to create one game and add its client
+class Simulation:
+    def __init__(self, games: int, bot: str = 'tracking', protocol: int = None, seed: int = 0):
+        self.game_count = games
+        self.bot = bot
+        self.protocol = protocol
+        self.rng = random.Random(seed)
+        self.games = []
+        self.durations = []
+        self.lateness = []
+        self.memory_per_game = 0.0
+        self.scheduler = None
+
+    # new_scheduler method
+    # Returns a TickScheduler with the step hooks of the server's scheduler and no games
+    def new_scheduler(self) -> TickScheduler:
+        import server
+        scheduler = TickScheduler()
+        scheduler.step_hooks = list(server.scheduler.step_hooks)
+        return scheduler
+
+    # create_games method
+    # Creates the games, each with one client of the given protocol, and starts their first rally
+    async def create_games(self) -> None:
+        import server
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for game_id in range(1, self.game_count + 1):
+            player1_id, player2_id = game_id * 10 + 1, game_id * 10 + 2
+            game = server.PongGame(game_id, player1_id, player2_id, False)
+            sid = f"sim{game_id}"
+            if self.protocol is not None:
+                server.sid_to_protocol[sid] = self.protocol
+            await game.add_player(sid, player1_id)
+            server.sid_to_protocol.pop(sid, None)
+            game.start_rally()
+            bots = (BotPlayer(player1_id, self.bot, self.rng),
+                    BotPlayer(player2_id, self.bot, self.rng))
+            self.games.append(SimulatedGame(game, bots))
+        after = tracemalloc.get_traced_memory()[0]
+        if not tracing:
+            tracemalloc.stop()
+        self.memory_per_game = (after - before) / max(1, self.game_count)
+
+    # run_fast method
+    # Steps every game back to back until the duration or tick count is reached
+    async def run_fast(self, duration: float = None, ticks: int = None) -> float:
+        self.scheduler = self.new_scheduler()
+        for simulated in self.games:
+            self.scheduler.games[simulated.game.game_id] = simulated
+        durations = self.durations
+        step = self.scheduler.step
+        start = time.perf_counter()
+        deadline = start + duration if duration is not None else None
+        while True:
+            tick_start = time.perf_counter()
+            await step()
+            durations.append(time.perf_counter() - tick_start)
+            if ticks is not None and len(durations) >= ticks:
+                break
+            if deadline is not None and tick_start >= deadline:
+                break
+        return time.perf_counter() - start
+
+    # run_realtime method
+    # Runs the games on the scheduler clock at TICK_RATE for the given duration
+    # The scheduler loop stops by itself once the games are unregistered
+    async def run_realtime(self, duration: float) -> float:
+        self.scheduler = scheduler = self.new_scheduler()
+
+        def record(tick_duration, lateness):
+            self.durations.append(tick_duration)
+            self.lateness.append(lateness)
+        scheduler.add_tick_listener(record)
+        start = time.perf_counter()
+        for simulated in self.games:
+            scheduler.register(simulated.game.game_id, simulated)
+        await asyncio.sleep(duration)
+        for simulated in self.games:
+            scheduler.unregister(simulated.game.game_id)
+        return time.perf_counter() - start
+
+    # measure_allocations method
+    # Runs a few more ticks under tracemalloc, on a scheduler of their own
+    # Returns the average peak of memory allocated during one game tick and freed by its end
+    async def measure_allocations(self, ticks: int = ALLOCATION_SAMPLE_TICKS) -> float:
+        scheduler = self.new_scheduler()
+        for simulated in self.games:
+            scheduler.games[simulated.game.game_id] = simulated
+        tracemalloc.start()
+        transient = 0
+        try:
+            for _ in range(ticks):
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                await scheduler.step()
+                transient += tracemalloc.get_traced_memory()[1] - current
+        finally:
+            tracemalloc.stop()
+        return transient / (ticks * max(1, self.game_count))
+
+    # run method
+    # Creates the games, runs them and returns the report
+    async def run(self, duration: float = None, ticks: int = None, realtime: bool = False,
+                  allocation_ticks: int = ALLOCATION_SAMPLE_TICKS) -> dict:
+        await self.create_games()
+        blocks_before = sys.getallocatedblocks()
+        if realtime:
+            elapsed = await self.run_realtime(duration)
+        else:
+            elapsed = await self.run_fast(duration, ticks)
+        blocks_after = sys.getallocatedblocks()
+        scheduler_ticks = len(self.durations)
+        game_ticks = scheduler_ticks * self.game_count
+        frames_sent = sum(simulated.game.frames_sent for simulated in self.games)
+        transient = await self.measure_allocations(allocation_ticks) if allocation_ticks else 0.0
+        durations = sorted(self.durations)
+        lateness = sorted(self.lateness)
+        return {
+            'games': self.game_count,
+            'mode': 'realtime' if realtime else 'fast',
+            'bot': self.bot,
+            'protocol': self.protocol,
+            'tick_rate': TICK_RATE,
+            'elapsed': elapsed,
+            'scheduler_ticks': scheduler_ticks,
+            'game_ticks': game_ticks,
+            'games_played': sum(simulated.games_played for simulated in self.games),
+            'ticks_per_second': scheduler_ticks / elapsed if elapsed else 0.0,
+            'game_ticks_per_second': game_ticks / elapsed if elapsed else 0.0,
+            'frames_per_game_second': frames_sent * TICK_RATE / game_ticks if game_ticks else 0.0,
+            'tick_p50_ms': percentile(durations, 0.50) * 1000,
+            'tick_p99_ms': percentile(durations, 0.99) * 1000,
+            'tick_max_ms': (durations[-1] if durations else 0.0) * 1000,
+            'tick_budget_used': percentile(durations, 0.99) / TICK_INTERVAL,
+            'lateness_p99_ms': percentile(lateness, 0.99) * 1000,
+            'late_ticks': self.scheduler.late_ticks,
+            'dropped_ticks': self.scheduler.dropped_ticks,
+            'bytes_per_game_tick': transient,
+            'blocks_retained_per_game_tick':
+                (blocks_after - blocks_before) / game_ticks if game_ticks else 0.0,
+            'memory_per_game': self.memory_per_game,
+        }
+
+
+# simulate function
+# Runs a simulation with the emits of every game dropped, returns the report
+# The Socket.IO server of server.py is swapped for a NullEmitter for the time of the run
+def simulate(games: int, duration: float = None, ticks: int = None, realtime: bool = False,
+             bot: str = 'tracking', protocol: int = None, seed: int = 0,
+             allocation_ticks: int = ALLOCATION_SAMPLE_TICKS) -> dict:
+    if duration is None and ticks is None:
+        raise ValueError("Pass a duration or a number of ticks")
+    if realtime and duration is None:
+        duration = ticks * TICK_INTERVAL
+    import server
+    import server_utils
+    saved = server.sio, server_utils.sio
+    server.sio = server_utils.sio = NullEmitter()
+    try:
+        simulation = Simulation(games, bot, protocol, seed)
+        return asyncio.run(simulation.run(duration, ticks, realtime, allocation_ticks))
+    finally:
+        server.sio, server_utils.sio = saved
+
+
+# format_report function
+# Returns the report as readable lines
+def format_report(report: dict) -> str:
+    return '\n'.join((
+        f"games: {report['games']}  mode: {report['mode']}  bot: {report['bot']}  "
+        f"protocol: {report['protocol'] or 'json'}  tick rate: {report['tick_rate']} Hz",
+        f"ran {report['scheduler_ticks']} ticks ({report['game_ticks']} game ticks, "
+        f"{report['games_played']} games finished) in {report['elapsed']:.2f}s",
+        f"ticks/s: {report['ticks_per_second']:.1f}  "
+        f"game ticks/s: {report['game_ticks_per_second']:.0f}  "
+        f"state frames per game second: {report['frames_per_game_second']:.1f}",
+        f"tick duration p50: {report['tick_p50_ms']:.3f} ms  p99: {report['tick_p99_ms']:.3f} ms  "
+        f"max: {report['tick_max_ms']:.3f} ms  "
+        f"(p99 uses {report['tick_budget_used'] * 100:.1f}% of the tick)",
+        f"lateness p99: {report['lateness_p99_ms']:.3f} ms  late ticks: {report['late_ticks']}  "
+        f"dropped ticks: {report['dropped_ticks']}",
+        f"allocated per game tick: {report['bytes_per_game_tick']:.0f} B  "
+        f"blocks retained per game tick: {report['blocks_retained_per_game_tick']:.3f}",
+        f"memory per game: {report['memory_per_game'] / 1024:.1f} KiB",
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Pong games headless with bot players")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--duration', type=float, help="seconds to run (default 5)")
+    parser.add_argument('--ticks', type=int, help="scheduler ticks to run instead of a duration")
+    parser.add_argument('--realtime', action='store_true',
+                        help="run at TICK_RATE instead of full speed")
+    parser.add_argument('--bot', choices=BOT_KINDS, default='tracking')
+    parser.add_argument('--protocol', type=int, choices=(1, 2, 3),
+                        help="state frame protocol of the clients")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allocation-ticks', type=int, default=ALLOCATION_SAMPLE_TICKS)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    duration = args.duration if args.duration is not None or args.ticks is not None else 5.0
+
+    report = simulate(args.games, duration, args.ticks, args.realtime, args.bot,
+                      args.protocol, args.seed, args.allocation_ticks)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# conftest.py
+import asyncio
+import pytest
+import server
+from server import PongGame
+
+
+# FakeEmitter class
+# Stands in for the Socket.IO server and records every emitted event instead of sending it
+# Room membership is tracked so tests can check who would receive an event
+class FakeEmitter:
+    def __init__(self):
+        self.emitted = []
+        self.rooms = {}
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, **kwargs):
+        self.emitted.append((event, data, room))
+
+    async def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    async def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(room, set()).discard(sid)
+
+    async def close_room(self, room, namespace=None):
+        self.rooms.pop(room, None)
+
+    def events(self, name):
+        return [data for event, data, room in self.emitted if event == name]
+
+
+@pytest.fixture
+def emitter(monkeypatch):
+    fake = FakeEmitter()
+    for name in ('emit', 'enter_room', 'leave_room', 'close_room'):
+        monkeypatch.setattr(server.sio, name, getattr(fake, name))
+    return fake
+
+
+@pytest.fixture
+def game(emitter):
+    pong_game = PongGame(1, 11, 22, False)
+    asyncio.run(pong_game.add_player('sid1', 11))
+    return pong_game
+
+
+def run(coro):
+    return asyncio.run(coro)
@@ -0,0 +1,88 @@
+import pytest
+import server
+from server import PHASE_RALLY, PHASE_POST_RALLY, SERVE_DELAY_TICKS, TICK_STEP
+from game_logic.game_defaults import *
+from tests.conftest import run
+
+
+@pytest.fixture
+def rally(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'ADAPTIVE_BROADCAST', True)
+    game.start_rally()
+    for _ in range(SERVE_DELAY_TICKS):
+        run(game.tick())
+    assert game.phase == PHASE_RALLY
+    emitter.emitted.clear()
+    return game
+
+
+# play function
+# Runs the ticks and returns the tick numbers that sent a state frame
+def play(game, emitter, ticks):
+    sent = []
+    for _ in range(ticks):
+        frames = len(emitter.events('send_game_state'))
+        run(game.tick())
+        if len(emitter.events('send_game_state')) > frames:
+            sent.append(game.tick_number)
+    return sent
+
+
+def test_straight_flight_only_sends_heartbeats(rally, emitter):
+    rally.game_state.ball.set_motion(BALL_SPEED, 180)
+    sent = play(rally, emitter, 40)
+    assert sent[0] == sent[-1] - (len(sent) - 1) * server.HEARTBEAT_EVERY
+    frames = emitter.events('send_game_state')
+    # every frame is where the clients extrapolate the previous one to
+    for previous, frame in zip(frames, frames[1:]):
+        elapsed = (frame['tick'] - previous['tick']) * TICK_STEP
+        assert abs(previous['ballPosition']['x'] + previous['ballDelta']['dx'] * elapsed
+                   - frame['ballPosition']['x']) < 1e-2
+    assert len(frames) < 40 / server.HEARTBEAT_EVERY + 2
+
+
+def test_wall_bounce_sends_a_frame(rally, emitter):
+    rally.game_state.ball.set_motion(BALL_SPEED, 120)
+    bounced = None
+    for _ in range(60):
+        delta_z = rally.game_state.ball.delta_z
+        sent = play(rally, emitter, 1)
+        if rally.game_state.ball.delta_z != delta_z:
+            bounced = rally.tick_number
+            break
+    assert bounced is not None and sent == [bounced]
+    assert not emitter.events('send_game_state')[-1]['bounce']
+
+
+def test_paddle_input_sends_a_frame(rally, emitter):
+    rally.game_state.ball.set_motion(BALL_SPEED, 180)
+    play(rally, emitter, 2)
+    rally.queue_input(11, PADDLE_SPEED)
+    assert play(rally, emitter, 2) == [rally.tick_number - 1]
+
+
+def test_event_driven_rally_sends_the_goal(rally, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'EVENT_DRIVEN_PHYSICS', True)
+    monkeypatch.setattr(server, 'SWEPT_COLLISIONS', True)
+    rally.game_state.player1.paddle.position.z = PADDLE_WIDTH / 2
+    rally.game_state.ball.set_motion(BALL_SPEED, 180)
+    rally.rally_simulation = server.RallySimulation(rally.game_state)
+    rally.rally_time = 0.0
+    sent = []
+    for _ in range(200):
+        sent += play(rally, emitter, 1)
+        if rally.phase == PHASE_POST_RALLY:
+            break
+    assert rally.phase == PHASE_POST_RALLY
+    assert sent[-1] == rally.tick_number and emitter.events('send_game_state')[-1]['paused']
+    assert len(sent) < rally.tick_number - SERVE_DELAY_TICKS
+
+
+def test_state_frame_rate(rally, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'active_games', {rally.game_id: rally})
+    rally.game_state.ball.set_motion(BALL_SPEED, 180)
+    play(rally, emitter, 30)
+    assert server.state_frame_rate() == rally.frames_sent * server.TICK_RATE / rally.tick_number
+    assert 0 < server.state_frame_rate() < server.BROADCAST_RATE
+    monkeypatch.setattr(server, 'active_games', {})
+    assert server.state_frame_rate() == 0.0
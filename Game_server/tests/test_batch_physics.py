@@ -0,0 +1,117 @@
+import random
+import server
+from server import PongGame, PHASE_RALLY, SERVE_DELAY_TICKS, run_batch_physics
+from game_logic.batch_physics import BatchPhysics
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+from tests.conftest import run
+
+GAMES = 30
+TICKS = 2000
+
+
+def new_game_state(game_id):
+    ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, BALL_DEFAULT_DIRECTION)
+    return GameState(game_id, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X), ball)
+
+
+# serve function
+# Puts the ball back in the middle with a direction drawn from the game's own generator
+def serve(game_state, rng):
+    game_state.ball.speed = BALL_SPEED
+    game_state.ball.direction = rng.choice((rng.uniform(-40, 40), rng.uniform(140, 220)))
+    game_state.ball.position = BALL_DEFAULT_X, 0, BALL_DEFAULT_Z
+
+
+# follow_ball function
+# Moves both paddles towards the ball, some games are given an offset so they miss
+def follow_ball(game_state, game_id):
+    offset = (game_id * 37) % 140 - 70
+    for player in (game_state.player1, game_state.player2):
+        target = min(FIELD_WIDTH - PADDLE_WIDTH / 2,
+                     max(PADDLE_WIDTH / 2, game_state.ball.z + offset))
+        player.paddle._position._z = target
+
+
+def test_batch_trajectories_match_entity_classes():
+    scalar = [new_game_state(game_id) for game_id in range(GAMES)]
+    batched = [new_game_state(game_id) for game_id in range(GAMES)]
+    scalar_rngs = [random.Random(game_id) for game_id in range(GAMES)]
+    batched_rngs = [random.Random(game_id) for game_id in range(GAMES)]
+    engine = BatchPhysics(capacity=8)
+    slots = [engine.add(game_state) for game_state in batched]
+    for game_id in range(GAMES):
+        serve(scalar[game_id], scalar_rngs[game_id])
+        serve(batched[game_id], batched_rngs[game_id])
+        engine.load(slots[game_id], batched[game_id])
+
+    hits = goals = 0
+    for tick in range(TICKS):
+        for game_id, game_state in enumerate(scalar):
+            follow_ball(game_state, game_id)
+            game_state.current_rally += 1
+            game_state.ball.update_position()
+            game_state.handle_collisions()
+            game_state.current_rally += 1
+            if game_state.check_goal():
+                game_state.paused = True
+
+        for game_id, game_state in enumerate(batched):
+            follow_ball(game_state, game_id)
+            engine.queue(slots[game_id], game_state.player1.paddle.z, game_state.player2.paddle.z)
+        engine.step()
+
+        for game_id, game_state in enumerate(batched):
+            engine.store(slots[game_id], game_state)
+            expected = scalar[game_id]
+            assert game_state.ball.x == expected.ball.x, (tick, game_id)
+            assert game_state.ball.z == expected.ball.z, (tick, game_id)
+            assert game_state.ball.direction == expected.ball.direction, (tick, game_id)
+            assert game_state.ball.speed == expected.ball.speed
+            assert game_state.bounce == expected.bounce
+            assert game_state.paused == expected.paused
+            assert game_state.current_rally == expected.current_rally
+            for player, expected_player in ((game_state.player1, expected.player1),
+                                            (game_state.player2, expected.player2)):
+                assert (player.hits, player.score) == (expected_player.hits, expected_player.score)
+            hits += game_state.bounce
+            if game_state.paused:
+                goals += 1
+                for state, rng in ((expected, scalar_rngs[game_id]),
+                                   (game_state, batched_rngs[game_id])):
+                    state.paused = False
+                    serve(state, rng)
+                engine.load(slots[game_id], game_state)
+
+    assert engine.capacity >= GAMES
+    assert hits > 100 and goals > 50
+
+
+def test_removed_rows_are_reused_and_not_stepped():
+    engine = BatchPhysics(capacity=2)
+    first = engine.add('a')
+    second = engine.add('b')
+    engine.queue(first, PLAYER_START_Z, PLAYER_START_Z)
+    engine.queue(second, PLAYER_START_Z, PLAYER_START_Z)
+    engine.remove(second)
+    assert engine.step() == ['a']
+    assert engine.add('c') == second
+    assert len(engine) == 2
+
+
+def test_game_rallies_on_the_shared_engine(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'physics_engine', BatchPhysics())
+    game.start_rally()
+    for _ in range(SERVE_DELAY_TICKS):
+        run(game.tick())
+    assert game.phase == PHASE_RALLY
+    start_x = game.game_state.ball.x
+    emitter.emitted.clear()
+
+    run(game.tick())
+    assert game.game_state.ball.x == start_x
+    run(run_batch_physics())
+    assert game.game_state.ball.x == start_x + game.game_state.ball.delta_x
+    assert len(emitter.events('send_game_state')) == 1
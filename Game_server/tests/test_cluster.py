@@ -0,0 +1,239 @@
+import asyncio
+from types import SimpleNamespace
+import socketio
+import server
+import server_utils
+from cluster import MemoryBroker, MemoryManager, GameRegistry, ClusterNode, OWNERSHIP_GRACE
+from json_codec import JsonPacket, json_codec
+from tests.conftest import run
+
+
+# make_handlers function
+# Event handlers of a fake game server node, recording the events they run
+def make_handlers(calls):
+    async def handler(name, sid, data=None):
+        calls.append((name, sid, data))
+
+    return SimpleNamespace(
+        active_games={},
+        start_game=lambda sid, data: handler('start_game', sid, data),
+        join_game=lambda sid, data: handler('join_game', sid, data),
+        move_paddle=lambda sid, data: handler('move_paddle', sid, data),
+        quit_game=lambda sid, data: handler('quit_game', sid, data),
+        request_keyframe=lambda sid, data: handler('request_keyframe', sid, data),
+        spectate_game=lambda sid, data: handler('spectate_game', sid, data),
+        stop_spectating=lambda sid, data: handler('stop_spectating', sid, data),
+        disconnect=lambda sid: handler('disconnect', sid),
+    )
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_first_node_claims_the_game():
+    async def scenario():
+        registry = GameRegistry(MemoryBroker())
+        assert await registry.claim(1, 'a') == 'a'
+        assert await registry.claim(1, 'b') == 'a'
+        assert not await registry.release(1, 'b')
+        assert await registry.release(1, 'a')
+        assert await registry.claim(1, 'b') == 'b'
+
+    run(scenario())
+
+
+def test_player_events_run_on_the_owning_node():
+    calls_a, calls_b = [], []
+
+    async def scenario():
+        broker = MemoryBroker()
+        node_a = ClusterNode(broker, 'a', make_handlers(calls_a))
+        node_b = ClusterNode(broker, 'b', make_handlers(calls_b))
+        await node_a.listen()
+        await node_b.listen()
+
+        # player 1 lands on node b, player 2 on node a: both end up on b
+        await node_b.route('join_game', 'p1', {'game_id': 9})
+        await node_a.route('join_game', 'p2', {'game_id': 9})
+        await node_a.route('move_paddle', 'p2', {'delta': 1})
+        await node_a.route_disconnect('p2')
+        await settle()
+        await node_a.stop()
+        await node_b.stop()
+
+    run(scenario())
+    assert calls_a == []
+    assert [(name, sid) for name, sid, data in calls_b] == [
+        ('join_game', 'p1'), ('join_game', 'p2'), ('move_paddle', 'p2'), ('disconnect', 'p2')]
+
+
+def test_spectators_are_routed_to_the_owner_without_claiming():
+    calls_a, calls_b = [], []
+
+    async def scenario():
+        broker = MemoryBroker()
+        node_a = ClusterNode(broker, 'a', make_handlers(calls_a))
+        node_b = ClusterNode(broker, 'b', make_handlers(calls_b))
+        await node_a.listen()
+        await node_b.listen()
+
+        await node_b.route('join_game', 'p1', {'game_id': 9})
+        await node_a.route('spectate_game', 's1', {'game_id': 9})
+        await node_a.route('spectate_game', 's2', {'game_id': 10})
+        await node_a.route('request_keyframe', 's1', None)
+        await node_a.route('stop_spectating', 's1', None)
+        await settle()
+        assert await node_a.registry.owner(10) is None
+        await node_a.stop()
+        await node_b.stop()
+
+    run(scenario())
+    assert [(name, sid) for name, sid, data in calls_a] == [('spectate_game', 's2')]
+    assert [(name, sid) for name, sid, data in calls_b] == [
+        ('join_game', 'p1'), ('spectate_game', 's1'), ('request_keyframe', 's1'),
+        ('stop_spectating', 's1')]
+
+
+def test_claims_of_finished_games_are_released():
+    async def scenario():
+        broker = MemoryBroker()
+        node = ClusterNode(broker, 'a', make_handlers([]))
+        await node.route('start_game', 's1', {'game_id': 1})
+        await node.route('start_game', 's2', {'game_id': 2})
+        node.handlers.active_games[1] = object()
+        now = node.claimed[2] + OWNERSHIP_GRACE + 1
+        await node.refresh_claims(now)
+        assert await node.registry.owner(1) == 'a'
+        assert await node.registry.owner(2) is None
+        assert list(node.claimed) == [1]
+
+    run(scenario())
+
+
+def test_emits_reach_sessions_on_other_nodes():
+    sent = []
+
+    async def send_packet(eio_sid, pkt):
+        sent.append((eio_sid, pkt.data))
+
+    async def scenario():
+        broker = MemoryBroker()
+        servers = []
+        for _ in range(2):
+            sio = socketio.AsyncServer(async_mode='asgi', client_manager=MemoryManager(broker))
+            sio.manager.initialize()
+            servers.append(sio)
+        await settle()
+        node_a, node_b = servers
+        node_a.eio.send_packet = send_packet
+        sid = await node_a.manager.connect('eio1', '/')
+
+        # node b runs the game: it puts the remote session in the game room and broadcasts
+        await node_b.enter_room(sid, 'game_9')
+        await node_b.emit('score', {'gameId': 9}, room='game_9')
+        await settle()
+        for sio in servers:
+            sio.manager.thread.cancel()
+
+    run(scenario())
+    assert len(sent) == 1
+    assert sent[0][0] == 'eio1'
+    assert sent[0][1] == '2["score",{"gameId":9}]'
+
+
+# join_data function
+# join_game data of a player of a remote game
+def join_data(game_id, local_player_id, token='token'):
+    return {'game_id': game_id, 'local_player_id': local_player_id, 'player1_id': 1,
+            'player2_id': 2, 'is_remote': True, 'token': token}
+
+
+def test_remote_game_across_two_nodes(monkeypatch):
+    sent = []
+    released = None
+
+    async def send_packet(eio_sid, pkt):
+        sent.append((eio_sid, pkt.data))
+
+    # the token service answers at once, except for the 'slow' token
+    async def validate_token(player_id, token):
+        if token == 'slow':
+            await released.wait()
+        return True
+
+    monkeypatch.setattr(server, 'validate_token', validate_token)
+
+    async def scenario():
+        nonlocal released
+        released = asyncio.Event()
+        broker = MemoryBroker()
+        servers = []
+        for _ in range(2):
+            sio = socketio.AsyncServer(async_mode='asgi', client_manager=MemoryManager(broker),
+                                       serializer=JsonPacket, json=json_codec)
+            sio.manager.initialize()
+            servers.append(sio)
+        await settle()
+        sio_a, sio_b = servers
+        # both nodes run the server's real handlers, node b's emits go through its own manager
+        monkeypatch.setattr(server, 'sio', sio_b)
+        monkeypatch.setattr(server_utils, 'sio', sio_b)
+        node_a = ClusterNode(broker, 'a', server)
+        node_b = ClusterNode(broker, 'b', server)
+        node_a.attach(sio_a)
+        node_b.attach(sio_b)
+        await node_a.listen()
+        await node_b.listen()
+        sio_a.eio.send_packet = send_packet
+        p1 = await sio_b.manager.connect('eio_p1', '/')
+        p2 = await sio_a.manager.connect('eio_p2', '/')
+        p3 = await sio_a.manager.connect('eio_p3', '/')
+        p4 = await sio_b.manager.connect('eio_p4', '/')
+        p5 = await sio_a.manager.connect('eio_p5', '/')
+        try:
+            # player 1 lands on node b and claims game 9, player 2 lands on node a
+            await node_b.route('join_game', p1, join_data(9, 1))
+            await node_a.route('join_game', p2, join_data(9, 2))
+            await node_a.route('move_paddle', p2, {'type': 'move_paddle', 'game_id': 9,
+                                                   'player_id': 2, 'delta_z': 3})
+            for _ in range(3):
+                await settle()
+            assert await node_a.registry.owner(9) == 'b'
+            game = server.active_games[9]
+            assert game.sids == [p1, p2]
+            assert game.input_queues[2].drain() == 3
+            assert ('eio_p2', '2["game_start"') in [(eio_sid, data[:14]) for eio_sid, data in sent]
+
+            # a join waiting for the token service does not hold up the other forwarded events
+            await node_b.route('join_game', p4, join_data(10, 1))
+            await node_a.route('join_game', p3, join_data(10, 2, token='slow'))
+            await node_a.route('move_paddle', p2, {'type': 'move_paddle', 'game_id': 9,
+                                                   'player_id': 2, 'delta_z': -2})
+            await settle()
+            assert game.input_queues[2].drain() == -2
+            assert 10 not in server.active_games
+            released.set()
+            await settle()
+            assert server.active_games[10].sids == [p4, p3]
+
+            # a local game started on node a is claimed and run by node a
+            await node_a.route('start_game', p5, {'game_id': 11, 'player1_id': 5, 'player2_id': 6,
+                                                  'is_remote': False})
+            assert await node_b.registry.owner(11) == 'a'
+            assert node_a.sid_to_owner[p5] == 'a' and server.active_games[11].sids == [p5]
+        finally:
+            for game_id in (9, 10, 11):
+                server.active_games.pop(game_id, None)
+            for sid in (p1, p2, p3, p4, p5):
+                for sessions in (server.sid_to_game, server.sid_to_protocol,
+                                 server.sid_to_features, server.sid_to_request_key):
+                    sessions.pop(sid, None)
+            server.remote_game_requests.clear()
+            await node_a.stop()
+            await node_b.stop()
+            for sio in servers:
+                sio.manager.thread.cancel()
+
+    run(scenario())
@@ -0,0 +1,98 @@
+from protocol import DeltaEncoder, PROTOCOL_DELTA, RECOVERY_KEYFRAME_INTERVAL, delta_fields
+from server import PongGame, sid_to_protocol, sid_to_game, active_games, request_keyframe
+from tests.conftest import run
+
+
+# apply_frames function
+# Python version of the client-side DeltaStateDecoder, returns the rebuilt fields
+def apply_frames(frames):
+    fields = None
+    seq = None
+    for frame in frames:
+        if frame.get('k'):
+            fields = dict(frame)
+        else:
+            assert fields is not None and frame['s'] == seq + 1
+            fields.update(frame)
+        seq = frame['s']
+    return fields
+
+
+def play(game_state, ticks):
+    for _ in range(ticks):
+        game_state.ball.update_position()
+        game_state.handle_collisions()
+        yield game_state
+
+
+def test_keyframes_at_configured_interval(game):
+    encoder = DeltaEncoder(game.game_id, keyframe_interval=10)
+    frames = [encoder.encode(state, tick) for tick, state in enumerate(play(game.game_state, 35))]
+    keyframes = [frame['s'] for frame in frames if frame.get('k')]
+    assert keyframes == [1, 12, 23, 34]
+    assert [frame['s'] for frame in frames] == list(range(1, 36))
+
+
+def test_delta_frames_only_carry_changed_fields(game):
+    encoder = DeltaEncoder(game.game_id)
+    state = game.game_state
+    state.paused = False
+    encoder.encode(state, 1)
+    state.ball.update_position()
+    frame = encoder.encode(state, 2)
+    assert set(frame) == {'g', 's', 't', 'bx'}
+    state.move_player(state.player1.id, 5)
+    frame = encoder.encode(state, 3)
+    assert 'p1' in frame and 'p2' not in frame
+
+
+def test_input_acknowledgements_are_sent_when_they_change(game):
+    encoder = DeltaEncoder(game.game_id)
+    state = game.game_state
+    encoder.encode(state, 1)
+    frame = encoder.encode(state, 2, (4, 0))
+    assert (frame['a1'], frame['a2']) == (4, 0)
+    frame = encoder.encode(state, 3, (4, 2))
+    assert 'a1' not in frame and frame['a2'] == 2
+    assert encoder.keyframe()['a1'] == 4
+
+
+def test_applying_deltas_rebuilds_the_state(game):
+    encoder = DeltaEncoder(game.game_id, keyframe_interval=25)
+    state = game.game_state
+    state.reset_ball()
+    frames = []
+    for tick, state in enumerate(play(state, 100)):
+        state.move_player(state.player2.id, 3 if tick % 40 < 20 else -3)
+        frames.append(encoder.encode(state, tick))
+    rebuilt = apply_frames(frames)
+    for key, value in delta_fields(state).items():
+        assert rebuilt[key] == value
+
+
+def test_keyframe_request_goes_to_requester_only(emitter, monkeypatch):
+    monkeypatch.setitem(sid_to_protocol, 'delta_sid', PROTOCOL_DELTA)
+    game = PongGame(9, 1, 2, True)
+    monkeypatch.setitem(active_games, 9, game)
+    monkeypatch.setitem(sid_to_game, 'delta_sid', 9)
+    run(game.add_player('delta_sid', 1))
+    run(game.send_game_state_to_client())
+    run(game.send_game_state_to_client())
+    run(request_keyframe('delta_sid', {'game_id': 9}))
+    event, frame, room = emitter.emitted[-1]
+    assert event == 'state_delta' and room == 'delta_sid'
+    assert frame['k'] is True and frame['s'] == 2
+
+
+def test_missed_frame_brings_the_next_keyframe_forward(game):
+    encoder = DeltaEncoder(game.game_id, keyframe_interval=60)
+    states = play(game.game_state, 40)
+    for tick in range(5):
+        encoder.encode(next(states), tick)
+    encoder.frame_missed()
+    # a second request before the keyframe does not push it further
+    encoder.encode(next(states), 5)
+    encoder.frame_missed()
+    frames = [encoder.encode(state, tick) for tick, state in enumerate(states, 6)]
+    keyframes = [frame['s'] for frame in frames if frame.get('k')]
+    assert keyframes[0] == 5 + RECOVERY_KEYFRAME_INTERVAL + 1
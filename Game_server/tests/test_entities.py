@@ -0,0 +1,37 @@
+import math
+import pytest
+from game_logic.entities.ball import Ball
+from game_logic.entities.paddle import Paddle
+from game_logic.game_defaults import *
+from tests.conftest import run
+
+
+def test_entities_have_no_instance_dict(game):
+    game_state = game.game_state
+    for entity in (game_state, game_state.ball, game_state.ball.position,
+                   game_state.player1, game_state.player1.paddle):
+        assert not hasattr(entity, '__dict__')
+    with pytest.raises(AttributeError):
+        game_state.ball.color = 'red'
+
+
+def test_wall_bounce_mirrors_direction_and_delta():
+    ball = Ball(BALL_DEFAULT_X, BALL_RADIUS, BALL_RADIUS, BALL_SPEED, 300)
+    delta_x, delta_z = ball.delta_x, ball.delta_z
+    ball.bounce_from_wall()
+    assert ball.direction == 60
+    assert (ball.delta_x, ball.delta_z) == (delta_x, -delta_z)
+
+
+def test_paddle_bounce_matches_speed_and_direction():
+    paddle = Paddle(PLAYER1_START_X)
+    for offset in (-45, -15, -5, 0, 5, 15, 45):
+        ball = Ball(PADDLE_DEPTH, paddle.z + offset, BALL_RADIUS, BALL_SPEED, 200)
+        hitpos = ball.bounce_from_paddle(paddle)
+        assert hitpos == abs(offset / (PADDLE_WIDTH / 2))
+        assert ball.speed > BALL_SPEED
+        assert 0 <= ball.direction < 360
+        assert ball.delta_x > 0  # the ball goes back towards player 2
+        radians = math.radians(ball.direction)
+        assert (ball.delta_x, ball.delta_z) == (math.cos(radians) * ball.speed,
+                                                math.sin(radians) * ball.speed)
@@ -0,0 +1,173 @@
+import asyncio
+import multiprocessing
+import os
+import struct
+from collections import Counter
+from multiprocessing.reduction import ForkingPickler
+import game_workers
+import server
+from game_workers import HashRing, PipeReader, WorkerPool, WorkerRelay, report_games
+from tests.conftest import run, FakeEmitter
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def test_hash_ring_spreads_games_over_workers():
+    ring = HashRing(range(4))
+    owners = Counter(ring.node_for(game_id) for game_id in range(10000))
+    assert set(owners) == {0, 1, 2, 3}
+    assert min(owners.values()) > 1500
+
+
+def test_hash_ring_only_moves_games_of_removed_worker():
+    ring = HashRing(range(4))
+    before = {game_id: ring.node_for(game_id) for game_id in range(1000)}
+    ring.remove(3)
+    for game_id, owner in before.items():
+        if owner != 3:
+            assert ring.node_for(game_id) == owner
+        else:
+            assert ring.node_for(game_id) != 3
+
+
+def test_events_follow_the_game_owner():
+    pool = WorkerPool(2)
+    pool.connections = [FakeConnection(), FakeConnection()]
+    pool.sio = FakeEmitter()
+    owner = pool.ring.node_for(5)
+
+    run(pool.forward('start_game', 'sid1', {'game_id': 5, 'player1_id': 1}))
+    run(pool.forward('move_paddle', 'sid1', {'game_id': 5, 'player_id': 1, 'delta': 1}))
+    run(pool.forward_disconnect('sid1'))
+
+    names = [message[1] for message in pool.connections[owner].sent]
+    assert names == ['start_game', 'move_paddle', 'disconnect']
+    assert pool.connections[1 - owner].sent == []
+    assert 'sid1' not in pool.sid_to_worker
+
+
+def test_spectators_follow_the_watched_game():
+    pool = WorkerPool(2)
+    pool.connections = [FakeConnection(), FakeConnection()]
+    pool.sio = FakeEmitter()
+    first = pool.ring.node_for(5)
+    other = next(game_id for game_id in range(6, 100) if pool.ring.node_for(game_id) != first)
+
+    run(pool.forward('spectate_game', 'spec1', {'game_id': 5}))
+    run(pool.forward('spectate_game', 'spec1', {'game_id': other}))
+    run(pool.forward('request_keyframe', 'spec1', None))
+    run(pool.forward_disconnect('spec1'))
+
+    assert [message[1] for message in pool.connections[first].sent] == [
+        'spectate_game', 'stop_spectating']
+    assert [message[1] for message in pool.connections[1 - first].sent] == [
+        'spectate_game', 'request_keyframe', 'disconnect']
+    assert pool.sid_to_worker == {} and pool.spectator_to_worker == {}
+
+
+def test_event_without_game_is_rejected():
+    pool = WorkerPool(2)
+    pool.connections = [FakeConnection(), FakeConnection()]
+    pool.sio = FakeEmitter()
+    run(pool.forward('move_paddle', 'unknown', {'delta': 1}))
+    assert pool.sio.events('error')
+    assert all(not conn.sent for conn in pool.connections)
+
+
+def test_relayed_calls_are_replayed_on_the_server():
+    worker_end, front_end = multiprocessing.Pipe()
+    relay = WorkerRelay(worker_end)
+    pool = WorkerPool(1)
+    pool.sio = FakeEmitter()
+
+    async def scenario():
+        data = {'game_id': 1}
+        await relay.enter_room('sid1', 'game_1')
+        await relay.emit('game_start', data, room='game_1')
+        await relay.close_room('game_1')
+        # the relay sends what the data was at the time of the emit
+        data['game_id'] = 2
+        for _ in range(3):
+            assert front_end.poll(1.0)
+            await pool._apply(front_end.recv())
+
+    run(scenario())
+    assert pool.sio.emitted == [('game_start', {'game_id': 1}, 'game_1')]
+    assert 'game_1' not in pool.sio.rooms
+    relay.writer.close()
+    relay.writer.thread.join(1.0)
+    assert not relay.writer.thread.is_alive()
+
+
+def test_relay_does_not_block_on_a_full_pipe():
+    worker_end, front_end = multiprocessing.Pipe()
+    relay = WorkerRelay(worker_end)
+    frame = {'ball': 'x' * 10000}
+
+    async def scenario():
+        # far more than a pipe buffer holds, while nobody reads the other end
+        for _ in range(200):
+            await relay.emit('send_game_state', frame, room='game_1')
+    run(scenario())
+    received = 0
+    while received < 200 and front_end.poll(1.0):
+        front_end.recv()
+        received += 1
+    assert received == 200
+    relay.writer.close()
+
+
+def test_partly_written_message_does_not_block_the_loop():
+    worker_end, front_end = multiprocessing.Pipe()
+    payload = ForkingPickler.dumps(('emit', 'score', {'player1Score': 1}, 'game_1', None))
+    header = struct.pack('!i', len(payload))
+
+    async def scenario():
+        received = asyncio.Queue()
+        PipeReader(front_end, asyncio.get_running_loop(), received.put_nowait)
+        # the worker wrote the header and a few bytes of the message so far
+        os.write(worker_end.fileno(), header + payload[:5])
+        ticks = 0
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert received.empty()
+        os.write(worker_end.fileno(), payload[5:])
+        return ticks, await asyncio.wait_for(received.get(), 1.0)
+
+    ticks, message = run(scenario())
+    assert ticks == 10 and message[:2] == ('emit', 'score')
+    worker_end.close()
+
+
+def test_drain_counts_the_games_the_workers_report(monkeypatch):
+    monkeypatch.setattr(game_workers, 'WORKER_STATUS_INTERVAL', 0.01)
+    monkeypatch.setattr(server, 'active_games', {1: 'game'})
+    worker_end, front_end = multiprocessing.Pipe()
+    relay = WorkerRelay(worker_end)
+    pool = WorkerPool(2)
+    # sessions routed to a worker, without a game running there
+    pool.sid_to_worker = {'sid1': 1, 'sid2': 1, 'sid3': 1}
+
+    async def scenario():
+        reporter = asyncio.create_task(report_games(1, relay))
+        await asyncio.sleep(0.05)
+        server.active_games.clear()
+        await asyncio.sleep(0.05)
+        reporter.cancel()
+        counts = []
+        while front_end.poll(0.2):
+            await pool._apply(front_end.recv())
+            counts.append(pool.running_games())
+        return counts
+
+    # a status message only when the count changed
+    assert run(scenario()) == [1, 0]
+    assert pool.worker_games == [0, 0]
+    relay.writer.close()
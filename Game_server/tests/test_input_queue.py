@@ -0,0 +1,98 @@
+from input_queue import InputQueue, InputRateLimiter
+from game_logic.game_defaults import FIELD_WIDTH, PADDLE_SPEED, PLAYER_START_Z
+from server import PongGame
+from tests.conftest import run
+
+
+def move(player1_delta=None, player2_delta=None):
+    data = {'type': 'move_paddle', 'game_id': 1, 'player1_id': 11, 'player2_id': 22}
+    if player1_delta is not None:
+        data['p1_delta_z'] = player1_delta
+    if player2_delta is not None:
+        data['p2_delta_z'] = player2_delta
+    return data
+
+
+def test_queue_is_bounded_and_drops_oldest():
+    queue = InputQueue(max_size=3)
+    for delta in (1, 2, 3, 4):
+        queue.push(delta)
+    assert len(queue) == 3
+    assert queue.dropped == 1
+    assert queue.drain() == 9
+    assert len(queue) == 0
+
+
+def test_rate_limiter_caps_inputs_per_second():
+    limiter = InputRateLimiter(rate=10, capacity=5)
+    now = limiter.updated
+    assert sum(limiter.allow(now) for _ in range(20)) == 5
+    assert limiter.rejected == 15
+    assert sum(limiter.allow(now + 1.0) for _ in range(20)) == 5
+
+
+def test_move_paddle_is_applied_on_next_tick_without_broadcast(game, emitter):
+    run(game.handle_paddle_movement('sid1', move(player1_delta=-PADDLE_SPEED)))
+    assert game.game_state.player1.paddle.z == PLAYER_START_Z
+    assert emitter.emitted == []
+    game.start_rally()
+    run(game.tick())
+    assert game.game_state.player1.paddle.z == PLAYER_START_Z - PADDLE_SPEED
+    assert len(emitter.events('send_game_state')) == 1
+
+
+def test_inputs_are_merged_per_tick(game, emitter):
+    for _ in range(3):
+        data = move(player1_delta=-PADDLE_SPEED, player2_delta=PADDLE_SPEED)
+        run(game.handle_paddle_movement('sid1', data))
+    assert game.apply_inputs() is True
+    assert game.game_state.player1.paddle.z == PLAYER_START_Z - 3 * PADDLE_SPEED
+    assert game.game_state.player2.paddle.z == PLAYER_START_Z + 3 * PADDLE_SPEED
+    assert game.apply_inputs() is False
+
+
+def test_serve_phase_only_sends_state_when_paddles_move(game, emitter):
+    game.start_rally()
+    run(game.tick())
+    run(game.tick())
+    assert len(emitter.events('send_game_state')) == 1
+    run(game.handle_paddle_movement('sid1', move(player2_delta=PADDLE_SPEED)))
+    run(game.tick())
+    assert len(emitter.events('send_game_state')) == 2
+
+
+def test_invalid_inputs_are_ignored(game):
+    run(game.handle_paddle_movement('sid1', move(player1_delta='up')))
+    run(game.handle_paddle_movement('sid1', {'type': 'move_paddle', 'game_id': 1,
+                                             'player1_id': 99, 'p1_delta_z': 5}))
+    assert game.apply_inputs() is False
+
+
+def test_non_finite_and_oversized_inputs_are_rejected(game):
+    for delta in (float('nan'), float('inf'), -float('inf'), 10 ** 400):
+        game.queue_input(11, delta)
+    assert not game.input_queues[11]
+    game.queue_input(11, 10 ** 300)
+    game.queue_input(22, -1e300)
+    assert game.input_queues[11].drain() == FIELD_WIDTH
+    assert game.input_queues[22].drain() == -FIELD_WIDTH
+
+
+def test_state_frames_acknowledge_processed_input_seqs(emitter):
+    game = PongGame(3, 11, 22, True)
+    run(game.add_player('sid1', 11))
+    run(game.add_player('sid2', 22))
+    run(game.send_game_state_to_client())
+    frame = emitter.events('send_game_state')[-1]
+    assert frame['tick'] == 0 and 'player1Seq' not in frame
+    for seq in (1, 2, 3):
+        run(game.handle_paddle_movement('sid1', {'type': 'move_paddle', 'game_id': 3,
+                                                  'player_id': 11, 'delta_z': -PADDLE_SPEED,
+                                                  'seq': seq}))
+    run(game.handle_paddle_movement('sid2', {'type': 'move_paddle', 'game_id': 3, 'player_id': 22,
+                                              'delta_z': 'up', 'seq': 7}))
+    run(game.tick())
+    frame = emitter.events('send_game_state')[-1]
+    assert frame['tick'] == 1
+    assert (frame['player1Seq'], frame['player2Seq']) == (3, 7)
+    assert frame['player1Pos']['z'] == PLAYER_START_Z - 3 * PADDLE_SPEED
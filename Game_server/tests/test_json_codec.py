@@ -0,0 +1,63 @@
+import json
+import math
+import pytest
+from socketio import packet
+from json_codec import OrjsonCodec, JsonPacket, select_codec, float_rounder, json_float
+from tests.conftest import run
+
+orjson = pytest.importorskip('orjson')
+
+
+# encode function
+# Returns the encoded Socket.IO event packet, with the given packet class and codec
+def encode(packet_class, codec, event, data):
+    saved = packet_class.json
+    packet_class.json = codec
+    try:
+        return packet_class(packet.EVENT, namespace='/', data=[event, data]).encode()
+    finally:
+        packet_class.json = saved
+
+
+def test_orjson_packets_decode_like_json_packets(game, emitter):
+    game.game_state.ball.x = 412.3456789
+    run(game.send_game_state_to_client())
+    frame = emitter.events('send_game_state')[0]
+    fast = encode(JsonPacket, OrjsonCodec, 'send_game_state', frame)
+    slow = encode(packet.Packet, json, 'send_game_state', frame)
+    assert fast.startswith('2["send_game_state",{')
+    assert json.loads(fast[1:]) == json.loads(slow[1:])
+    assert len(fast) == len(slow)
+
+
+def test_binary_payloads_keep_their_attachments():
+    fast = encode(JsonPacket, OrjsonCodec, 'send_game_state_v2', b'\x01\x02')
+    assert fast == encode(packet.Packet, json, 'send_game_state_v2', b'\x01\x02')
+    assert fast[0] == '51-["send_game_state_v2",{"_placeholder":true,"num":0}]'
+    assert fast[1] == b'\x01\x02'
+
+
+def test_orjson_codec_falls_back_to_json():
+    expected = json.dumps({'seq': 2 ** 70}, separators=(',', ':'))
+    assert OrjsonCodec.dumps({'seq': 2 ** 70}) == expected
+    assert OrjsonCodec.dumps({1: 'a'}) == '{"1":"a"}'
+    assert math.isnan(OrjsonCodec.loads('{"a":NaN}')['a'])
+    with pytest.raises(ValueError):
+        OrjsonCodec.loads('{"a":')
+
+
+def test_codec_selection():
+    assert select_codec('json') is json
+    assert select_codec('auto') is OrjsonCodec
+    assert select_codec('orjson') is OrjsonCodec
+
+
+def test_frame_coordinates_are_rounded(game, emitter):
+    game.game_state.ball.x = 412.3456789
+    game.game_state.hitpos = 0.123456789
+    run(game.send_game_state_to_client())
+    frame = emitter.events('send_game_state')[0]
+    assert frame['ballPosition']['x'] == json_float(412.3456789)
+    assert frame['hitpos'] == json_float(0.123456789)
+    assert float_rounder(3)(412.3456789) == 412.346 and float_rounder(3)(-0.5551) == -0.555
+    assert float_rounder(-1)(412.3456789) == 412.3456789
@@ -0,0 +1,30 @@
+import uvicorn
+import launcher
+from launcher import DrainingServer
+from tests.conftest import run
+
+
+async def app(scope, receive, send):
+    pass
+
+
+def test_drain_waits_for_the_running_games(monkeypatch):
+    monkeypatch.setattr(launcher, 'DRAIN_POLL_INTERVAL', 0.01)
+    games = [3]
+    drained = []
+
+    def running_games():
+        games[0] = max(0, games[0] - 1)
+        return games[0]
+
+    server = DrainingServer(uvicorn.Config(app), running_games, lambda: drained.append(games[0]),
+                            drain_timeout=5)
+    run(server.drain())
+    assert drained == [3] and games == [0]
+
+
+def test_drain_gives_up_after_the_timeout(monkeypatch):
+    monkeypatch.setattr(launcher, 'DRAIN_POLL_INTERVAL', 0.01)
+    server = DrainingServer(uvicorn.Config(app), lambda: 1, drain_timeout=0.05)
+    run(server.drain())
+    assert server.running_games() == 1
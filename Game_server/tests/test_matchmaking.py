@@ -0,0 +1,110 @@
+import time
+import pytest
+import server
+import server_utils
+from server_utils import (
+    GameRequest, add_game_request, coupled_request, remove_game_request,
+    pop_expired_requests, sweep_timed_out_requests,
+)
+from tests.conftest import run
+
+
+@pytest.fixture(autouse=True)
+def clean_requests(monkeypatch):
+    monkeypatch.setattr(server_utils, 'remote_game_requests', {})
+    monkeypatch.setattr(server_utils, 'request_expiry_heap', [])
+    monkeypatch.setattr(server_utils, 'sid_to_request_key', {})
+
+
+def fill(count):
+    for game_id in range(count):
+        add_game_request(GameRequest(f'sid{game_id}', game_id, 1, 2, True))
+
+
+# NoScan class
+# Request index failing the test when it is iterated, requests must be looked up by key
+class NoScan(dict):
+    def __iter__(self):
+        raise AssertionError('the pending requests were scanned')
+
+    keys = values = items = __iter__
+
+
+def test_pairing_looks_up_100k_pending_requests_by_key(monkeypatch):
+    monkeypatch.setattr(server_utils, 'remote_game_requests', NoScan())
+    fill(100_000)
+    for game_id in (0, 54_321, 99_999):
+        assert coupled_request(game_id, 1, 2, 'other_sid').game_id == game_id
+    assert coupled_request(-1, 1, 2, 'other_sid') is None
+    assert len(server_utils.remote_game_requests) == 99_997
+    # paired requests leave their heap entry behind until the sweep reaches it
+    assert len(server_utils.request_expiry_heap) == 100_000
+    expired = pop_expired_requests(time.monotonic() + server_utils.REQUEST_TIMEOUT + 1)
+    assert len(expired) == 99_997
+    assert server_utils.request_expiry_heap == [] and server_utils.sid_to_request_key == {}
+
+
+def test_pairing_matches_the_other_player():
+    first = GameRequest('sid_a', 3, 1, 2, True)
+    add_game_request(first)
+    assert coupled_request(3, 1, 2, 'sid_a') is None  # same player asked twice
+    assert coupled_request(3, 1, 2, 'sid_b') is first
+    assert coupled_request(3, 1, 2, 'sid_c') is None
+    assert server_utils.remote_game_requests == {}
+
+
+def test_replaced_request_of_another_session_is_cancelled(emitter, monkeypatch):
+    first = GameRequest('sid_a', 3, 1, 2, True)
+    assert add_game_request(first) is None
+    # asking twice from the same session keeps the session waiting
+    assert add_game_request(GameRequest('sid_a', 3, 1, 2, True)) is None
+    assert add_game_request(GameRequest('sid_b', 3, 1, 2, True)).sid == 'sid_a'
+    assert server_utils.sid_to_request_key == {'sid_b': (3, 1, 2)}
+
+    # join_game tells the replaced session its request is gone
+    # (another session's request is normally paired, the replacement is forced here)
+    async def validate_token(player_id, token):
+        return True
+
+    monkeypatch.setattr(server, 'validate_token', validate_token)
+    monkeypatch.setattr(server, 'coupled_request', lambda *args: None)
+    run(server.join_game('sid_c', {'game_id': 3, 'local_player_id': 1, 'player1_id': 1,
+                                   'player2_id': 2, 'is_remote': True, 'token': 'token'}))
+    assert [room for event, data, room in emitter.emitted if event == 'cancel_game'] == ['sid_b']
+    server.sid_to_protocol.pop('sid_c', None)
+    server.sid_to_features.pop('sid_c', None)
+
+
+def test_disconnect_removes_pending_request():
+    add_game_request(GameRequest('sid_a', 3, 1, 2, True))
+    remove_game_request('sid_a')
+    assert server_utils.remote_game_requests == {}
+
+
+def test_expired_requests_are_popped_in_order():
+    fill(5)
+    paired = coupled_request(2, 1, 2, 'other_sid')
+    assert pop_expired_requests(time.monotonic()) == []
+    expired = pop_expired_requests(time.monotonic() + server_utils.REQUEST_TIMEOUT + 1)
+    assert [request.game_id for request in expired] == [0, 1, 3, 4]
+    assert paired not in expired
+    assert server_utils.remote_game_requests == {}
+    assert server_utils.request_expiry_heap == []
+
+
+def test_sweep_sends_cancel_game_in_batches(emitter, monkeypatch):
+    monkeypatch.setattr(server_utils, 'CANCEL_BATCH_SIZE', 4)
+    fill(10)
+    expired = run(sweep_timed_out_requests(time.monotonic() + server_utils.REQUEST_TIMEOUT + 1))
+    assert len(expired) == 10
+    cancelled = [(data['gameId'], room) for event, data, room in emitter.emitted
+                 if event == 'cancel_game']
+    assert sorted(cancelled) == [(i, f'sid{i}') for i in range(10)]
+
+
+def test_requests_with_the_same_expiry_expire_in_order():
+    requests = [GameRequest(f'sid{game_id}', game_id, 1, 2, True) for game_id in range(50)]
+    for request in requests:
+        request.expires_at = 0.0
+        add_game_request(request)
+    assert pop_expired_requests(1.0) == requests
@@ -0,0 +1,111 @@
+import httpx
+import metrics
+import server
+from types import SimpleNamespace
+from metrics import MetricsRegistry, instrument_server
+from server_utils import app
+from tests.conftest import run
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', (0.1, 1.0), label='event')
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, 'score')
+    lines = registry.render().splitlines()
+    assert '# TYPE latency_seconds histogram' in lines
+    assert 'latency_seconds_bucket{event="score",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{event="score",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{event="score",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{event="score"} 6.05' in lines
+    assert 'latency_seconds_count{event="score"} 4' in lines
+
+
+def test_counters_and_gauges():
+    registry = MetricsRegistry()
+    registry.counter('sent_total', 'Sent').inc(3)
+    registry.gauge('games', 'Games', lambda: 2)
+    registry.gauge('queue_depth', 'Depth', lambda: {'sid1': 4}, label='sid')
+    lines = registry.render().splitlines()
+    assert 'sent_total 3' in lines
+    assert 'games 2' in lines
+    assert 'queue_depth{sid="sid1"} 4' in lines
+
+
+def test_sent_bytes_are_added_to_the_game_of_the_session():
+    sent = []
+
+    async def emit(event, data=None, room=None):
+        await sio.eio.send_packet('eio1', SimpleNamespace(data='2["score",{}]'))
+
+    async def send_packet(eio_sid, pkt):
+        sent.append(eio_sid)
+
+    manager = SimpleNamespace(sid_from_eio_sid=lambda eio_sid, namespace: 'sid1')
+    sio = SimpleNamespace(emit=emit, eio=SimpleNamespace(send_packet=send_packet), manager=manager)
+    instrument_server(sio, {'sid1': 77}.get)
+    before = metrics.sent_bytes.values[None]
+    run(sio.emit('score', {}, room='game_77'))
+
+    assert sent == ['eio1']
+    assert metrics.sent_bytes.values[None] - before == 13
+    assert metrics.game_bytes[77] == 13
+    assert metrics.emit_duration.series['score'][2] >= 1
+    metrics.finish_game(77)
+    assert 77 not in metrics.game_bytes
+
+
+def test_sent_bytes_of_running_games_are_counted_per_event():
+    async def send_packet(eio_sid, pkt):
+        pass
+
+    sids = {'eio1': 'sid1', 'eio2': 'sid2'}
+    manager = SimpleNamespace(sid_from_eio_sid=lambda eio_sid, namespace: sids[eio_sid])
+    sio = SimpleNamespace(emit=None, eio=SimpleNamespace(send_packet=send_packet), manager=manager)
+    instrument_server(sio, {'sid1': 78}.get)
+    before = dict(metrics.game_event_bytes.values)
+
+    async def scenario():
+        header = '51-["send_game_state_v2",{"_placeholder":true,"num":0}]'
+        await sio.eio.send_packet('eio1', SimpleNamespace(data=header))
+        await sio.eio.send_packet('eio1', SimpleNamespace(data=b'\x01\x02\x03'))
+        await sio.eio.send_packet('eio1', SimpleNamespace(data='2["score",{}]'))
+        # sid2 is not in a game
+        await sio.eio.send_packet('eio2', SimpleNamespace(data='2["score",{}]'))
+        return header
+
+    header = run(scenario())
+    added = {event: value - before.get(event, 0)
+             for event, value in metrics.game_event_bytes.values.items()}
+    # counted while the game is still running
+    assert added['send_game_state_v2'] == len(header) + 3 and added['score'] == 13
+    assert metrics.game_bytes[78] == len(header) + 16
+    metrics.finish_game(78)
+
+
+def test_finished_games_stop_counting_bytes(game, monkeypatch):
+    monkeypatch.setitem(server.active_games, game.game_id, game)
+    monkeypatch.setitem(server.sid_to_game, 'sid1', game.game_id)
+    monkeypatch.setitem(server.sid_to_game, 'sid2', 2)
+    game.sids.append('sid2')
+    run(game.end_game())
+    # sid2 moved on to another game, its session is left alone
+    assert 'sid1' not in server.sid_to_game and server.sid_to_game['sid2'] == 2
+    assert game.game_id not in metrics.game_bytes
+
+
+def test_metrics_route_is_served_next_to_socketio():
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://game-server') as client:
+            return await client.get('/metrics'), await client.get('/other')
+
+    response, missing = run(scenario())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'game_server_active_games 0' in response.text
+    assert 'game_server_tick_duration_seconds' in metrics.registry.metrics
+    assert 'game_server_token_cache_hits_total' in response.text
+    assert 'game_server_token_cache_misses_total' in response.text
+    assert 'game_server_token_cache_hit_rate' in response.text
+    assert missing.status_code == 404
@@ -0,0 +1,164 @@
+import pytest
+from protocol import (
+    PROTOCOL_JSON, PROTOCOL_BINARY, STATE_FRAME_SIZE, POSITION_SCALE, DELTA_SCALE,
+    FEATURE_GOAL_ANIMATION, negotiate_protocol, negotiate_features, encode_state_v2,
+    decode_state_v2,
+)
+import server
+from server import (PongGame, PHASE_POST_RALLY, POST_RALLY_TICKS, sid_to_protocol, sid_to_features,
+                    state_room)
+from tests.conftest import run
+
+
+def test_negotiate_features_ignores_unknown_features():
+    features = negotiate_features({'features': ['goal_animation', 'teleport', 3]})
+    assert features == {FEATURE_GOAL_ANIMATION}
+    assert negotiate_features({'features': 'goal_animation'}) == frozenset()
+    assert negotiate_features({}) == frozenset()
+    assert negotiate_features(None) == frozenset()
+
+
+def test_negotiate_protocol_falls_back_to_json():
+    assert negotiate_protocol({'protocol': 2}) == PROTOCOL_BINARY
+    assert negotiate_protocol({'protocol': 1}) == PROTOCOL_JSON
+    assert negotiate_protocol({'protocol': 99}) == PROTOCOL_JSON
+    assert negotiate_protocol({}) == PROTOCOL_JSON
+
+
+def test_binary_frame_round_trip(game):
+    state = game.game_state
+    state.ball.position = 123.456, 0, 321.987
+    state.player1.move_paddle(-7.3)
+    state.bounce = True
+    state.hitpos = 0.4321
+    state.paused = False
+    frame = encode_state_v2(state, 1234)
+    assert len(frame) == STATE_FRAME_SIZE
+    decoded = decode_state_v2(frame)
+    assert decoded['gameId'] == state.game_id
+    assert decoded['tick'] == 1234
+    assert decoded['ballPosition']['x'] == pytest.approx(state.ball.x, abs=1 / POSITION_SCALE)
+    assert decoded['ballPosition']['z'] == pytest.approx(state.ball.z, abs=1 / POSITION_SCALE)
+    assert decoded['ballDelta']['dx'] == pytest.approx(state.ball.delta_x, abs=1 / DELTA_SCALE)
+    assert decoded['ballDelta']['dz'] == pytest.approx(state.ball.delta_z, abs=1 / DELTA_SCALE)
+    paddle_z = (decoded['player1Pos']['z'], decoded['player2Pos']['z'])
+    assert paddle_z == pytest.approx((state.player1.paddle.z, state.player2.paddle.z),
+                                     abs=1 / POSITION_SCALE)
+    assert decoded['bounce'] is True
+    assert decoded['paused'] is False
+    assert decoded['hitpos'] == pytest.approx(0.4321, abs=1e-4)
+
+
+def test_binary_frame_trailers(game):
+    plain = encode_state_v2(game.game_state, 5)
+    frame = encode_state_v2(game.game_state, 5, (41, 7), 1760000000123.4)
+    assert len(frame) == STATE_FRAME_SIZE + 16
+    assert frame[2:STATE_FRAME_SIZE] == plain[2:]
+    decoded = decode_state_v2(frame)
+    assert decoded['serverTime'] == 1760000000123.4
+    assert (decoded['player1Seq'], decoded['player2Seq']) == (41, 7)
+    decoded = decode_state_v2(encode_state_v2(game.game_state, 5, input_seqs=(3, 0)))
+    assert decoded['player1Seq'] == 3 and 'serverTime' not in decoded
+    assert 'player1Seq' not in decode_state_v2(plain)
+
+
+def test_out_of_range_coordinates_are_clamped(game):
+    game.game_state.ball.position = 10000.0, 0, -10000.0
+    decoded = decode_state_v2(encode_state_v2(game.game_state, 1))
+    assert decoded['ballPosition']['x'] == pytest.approx(32767 / POSITION_SCALE)
+    assert decoded['ballPosition']['z'] == pytest.approx(-32768 / POSITION_SCALE)
+
+
+def test_each_protocol_gets_its_own_frame(emitter, monkeypatch):
+    monkeypatch.setitem(sid_to_protocol, 'binary_sid', PROTOCOL_BINARY)
+    game = PongGame(5, 1, 2, True)
+    run(game.add_player('json_sid', 1))
+    run(game.add_player('binary_sid', 2))
+    assert emitter.rooms[state_room(5, PROTOCOL_JSON)] == {'json_sid'}
+    assert emitter.rooms[state_room(5, PROTOCOL_BINARY)] == {'binary_sid'}
+    run(game.send_game_state_to_client())
+    assert len(emitter.events('send_game_state')) == 1
+    frames = emitter.events('send_game_state_v2')
+    assert len(frames) == 1 and isinstance(frames[0], bytes)
+
+
+def test_json_frame_skipped_without_json_clients(emitter, monkeypatch):
+    monkeypatch.setitem(sid_to_protocol, 'binary_sid', PROTOCOL_BINARY)
+    game = PongGame(6, 1, 2, True)
+    run(game.add_player('binary_sid', 1))
+    run(game.send_game_state_to_client())
+    assert emitter.events('send_game_state') == []
+    assert len(emitter.events('send_game_state_v2')) == 1
+
+
+def test_frames_and_scores_carry_the_tick_time(game, emitter, monkeypatch):
+    monkeypatch.setattr(server.scheduler, 'tick_time', 1760000000000.0)
+    game.start_rally()
+    run(game.tick())
+    frame = emitter.events('send_game_state')[-1]
+    assert (frame['tick'], frame['serverTime']) == (1, 1760000000000.0)
+    run(game.send_score())
+    assert emitter.events('score')[-1]['serverTime'] == 1760000000000.0
+
+
+def test_clock_ping_echoes_the_client_time(emitter):
+    before = server.server_time()
+    run(server.clock_ping('sid1', {'clientTime': 1234.5}))
+    event, data, room = emitter.emitted[-1]
+    assert (event, room, data['clientTime']) == ('clock_pong', 'sid1', 1234.5)
+    assert data['serverTime'] >= round(before, 1)
+
+
+# play_goal function
+# Plays a rally of the game until the goal, then the post-rally animation
+# Returns the state frames sent during the given number of animation ticks
+async def play_goal(game, emitter, ticks=POST_RALLY_TICKS):
+    game.start_rally()
+    while game.phase != PHASE_POST_RALLY:
+        await game.tick()
+    frames_before = len(emitter.events('send_game_state'))
+    for _ in range(ticks):
+        await game.tick()
+    return emitter.events('send_game_state')[frames_before:]
+
+
+def test_goal_animation_replaces_the_post_rally_frames(emitter):
+    sid_to_features['anim1'] = negotiate_features({'features': ['goal_animation']})
+    game = PongGame(1, 11, 22, False)
+    try:
+        run(game.add_player('anim1', 11))
+        # the last animation tick starts the next rally
+        frames = run(play_goal(game, emitter, POST_RALLY_TICKS - 1))
+    finally:
+        sid_to_features.pop('anim1', None)
+    assert frames == []
+    animations = emitter.events('goal_animation')
+    assert len(animations) == 1
+    animation = animations[0]
+    assert animation['tick'] == emitter.events('score')[0]['tick']
+    assert animation['duration'] == 1000 * POST_RALLY_TICKS / server.TICK_RATE
+    # the server's ball followed the announced trajectory, up to the rounding of the coordinates
+    seconds = (POST_RALLY_TICKS - 1) / server.TICK_RATE
+    ball = game.game_state.ball
+    position, velocity = animation['ballPosition'], animation['ballVelocity']
+    assert abs(position['x'] + velocity['dx'] * seconds - ball.x) < 1e-2
+    assert abs(position['z'] + velocity['dz'] * seconds - ball.z) < 1e-2
+
+
+def test_post_rally_frames_are_streamed_to_clients_without_goal_animation(emitter):
+    sid_to_features['anim1'] = negotiate_features({'features': ['goal_animation']})
+    game = PongGame(1, 11, 22, True)
+    try:
+        run(game.add_player('anim1', 11))
+        run(game.add_player('old2', 22))
+        frames = run(play_goal(game, emitter))
+    finally:
+        sid_to_features.pop('anim1', None)
+    assert len(frames) == POST_RALLY_TICKS // server.BROADCAST_EVERY
+    assert len(emitter.events('goal_animation')) == 1
+
+
+def test_old_clients_get_no_goal_animation(game, emitter):
+    frames = run(play_goal(game, emitter))
+    assert len(frames) == POST_RALLY_TICKS // server.BROADCAST_EVERY
+    assert emitter.events('goal_animation') == []
@@ -0,0 +1,91 @@
+import math
+import random
+import server
+from server import PHASE_RALLY, PHASE_POST_RALLY, SERVE_DELAY_TICKS
+from game_logic.rally_simulation import RallySimulation
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+from tests.conftest import run
+
+
+def make_state(direction, speed=BALL_SPEED):
+    ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, speed, direction)
+    return GameState(1, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X), ball)
+
+
+# move_paddles function
+# Moves the paddles like players would: following the ball, with a per-rally offset so some
+# rallies end
+def move_paddles(game_state, ball_z, offset):
+    for player in (game_state.player1, game_state.player2):
+        target = min(FIELD_WIDTH - PADDLE_WIDTH / 2, max(PADDLE_WIDTH / 2, ball_z + offset))
+        player.paddle.position.z = target
+
+
+# rounding differs slightly between the two (one move per event vs one per tick),
+# so positions are compared with a tolerance
+def test_events_follow_swept_trajectory():
+    rng = random.Random(4)
+    for rally in range(40):
+        direction = rng.choice((rng.uniform(-40, 40), rng.uniform(140, 220)))
+        offset = rng.uniform(-70, 70)
+        dt = rng.choice((1.0, 2.0))
+        swept = make_state(direction)
+        evented = make_state(direction)
+        simulation = RallySimulation(evented)
+        now = 0.0
+        for tick in range(600):
+            move_paddles(swept, swept.ball.z, offset)
+            move_paddles(evented, swept.ball.z, offset)
+            now += dt
+            swept.advance(dt)
+            scored = simulation.advance_to(now)
+            simulation.sync(now)
+            assert math.isclose(evented.ball.x, swept.ball.x, abs_tol=1e-3), (rally, tick)
+            assert math.isclose(evented.ball.z, swept.ball.z, abs_tol=1e-3), (rally, tick)
+            assert evented.bounce == swept.bounce
+            assert scored == swept.check_goal()
+            if scored:
+                break
+        assert evented.player1.hits == swept.player1.hits
+        assert evented.player2.hits == swept.player2.hits
+
+
+def test_ticks_between_events_leave_the_ball_alone():
+    game_state = make_state(0)
+    simulation = RallySimulation(game_state)
+    # straight at player 2's paddle plane: (800 - 8 - 400) / 8 frames away
+    assert simulation.next_event_time == (FIELD_DEPTH - BALL_RADIUS - BALL_DEFAULT_X) / BALL_SPEED
+    for now in range(1, 49):
+        assert not simulation.advance_to(now)
+    assert game_state.ball.x == BALL_DEFAULT_X
+    assert simulation.events == 0
+    simulation.advance_to(49)
+    assert simulation.events == 1
+    assert game_state.bounce
+    assert game_state.ball.delta_x < 0
+
+
+def test_game_scores_on_event_driven_rally(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'EVENT_DRIVEN_PHYSICS', True)
+    monkeypatch.setattr(server, 'SWEPT_COLLISIONS', True)
+    game.start_rally()
+    for _ in range(SERVE_DELAY_TICKS):
+        run(game.tick())
+    assert game.phase == PHASE_RALLY
+    assert game.rally_simulation is not None
+    game.game_state.player1.paddle.position.z = PADDLE_WIDTH / 2
+    game.game_state.player2.paddle.position.z = PADDLE_WIDTH / 2
+    game.game_state.ball.set_motion(BALL_SPEED, 180)
+    game.rally_simulation = server.RallySimulation(game.game_state)
+    game.rally_time = 0.0
+    for _ in range(200):
+        run(game.tick())
+        if game.phase == PHASE_POST_RALLY:
+            break
+    assert game.phase == PHASE_POST_RALLY
+    assert game.game_state.player2.score == 1
+    assert game.game_state.ball.x < 0
+    assert emitter.events('score')
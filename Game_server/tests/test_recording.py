@@ -0,0 +1,116 @@
+import io
+import random
+import pytest
+import recording
+import server
+from game_logic.batch_physics import BatchPhysics
+from recording import GameRecorder, GameReplay, Recording, RecordingError, END_FINISHED
+from server import PongGame, create_recorder
+from tests.conftest import run
+
+
+async def play(game, ticks, seed=1):
+    rng = random.Random(seed)
+    game.start_rally()
+    for _ in range(ticks):
+        if rng.random() < 0.3:
+            game.queue_input(game.game_state.player1.id, rng.choice((9.0, -9.0, 3.3)))
+        if rng.random() < 0.3:
+            game.queue_input(game.game_state.player2.id, rng.uniform(-9, 9))
+        await game.tick()
+        if server.physics_engine is not None:
+            await server.run_batch_physics()
+        if not game.game_state.in_progress:
+            break
+    game.recorder.end(game.tick_number, END_FINISHED)
+
+
+def record_game(ticks=4000, seed=7):
+    game = PongGame(5, 11, 22, False, seed=seed)
+    buffer = io.BytesIO()
+    game.recorder = create_recorder(game, buffer)
+    run(play(game, ticks))
+    return game, buffer.getvalue()
+
+
+def test_records_round_trip():
+    buffer = io.BytesIO()
+    recorder = GameRecorder(buffer, 42, {'game_id': 1, 'player1_id': 2, 'player2_id': 3}, 1, 60, 1)
+    recorder.input(3, 1, 9.0)
+    recorder.input(3, 2, 0.1)
+    recorder.score(400, 1, 0)
+    recorder.end(900, END_FINISHED)
+    parsed = Recording.parse(buffer.getvalue())
+    assert (parsed.seed, parsed.flags, parsed.tick_rate) == (42, 1, 60)
+    assert parsed.meta['player2_id'] == 3
+    assert parsed.inputs == {3: [9.0, 0.1]}
+    assert parsed.scores == [(400, 1, 0)]
+    assert parsed.end == (900, END_FINISHED)
+
+
+def test_truncated_record_is_ignored_and_garbage_rejected():
+    buffer = io.BytesIO()
+    recorder = GameRecorder(buffer, 1, {}, 0, 60, 1)
+    recorder.input(5, 1, 9.0)
+    recorder.input(6, 1, 9.0)
+    recorder.flush()
+    parsed = Recording.parse(buffer.getvalue()[:-2])
+    assert parsed.inputs == {5: [9.0, None]}
+    with pytest.raises(RecordingError):
+        Recording.parse(b'not a recording')
+
+
+def test_recording_is_a_few_bytes_per_tick(emitter):
+    game, data = record_game()
+    assert len(data) < game.tick_number * 6
+
+
+def test_replay_reproduces_the_goals(emitter):
+    game, data = record_game()
+    recorded = Recording.parse(data)
+    assert recorded.scores
+    replay = GameReplay(recorded, game_id='replay')
+    replayed = run(replay.run())
+    assert replay.diverged() == []
+    assert replayed.scores == recorded.scores
+    assert replay.game.game_state.player1.score == game.game_state.player1.score
+    assert replay.game.game_state.player2.score == game.game_state.player2.score
+
+
+def test_replay_of_a_batch_physics_game(emitter, monkeypatch):
+    monkeypatch.setattr(server, 'physics_engine', BatchPhysics())
+    game, data = record_game()
+    assert game.physics_slot is not None
+    replay = GameReplay(Recording.parse(data), game_id='replay')
+    run(replay.run())
+    # the replay steps its rallies itself, nothing waits for the scheduler's batch step
+    assert replay.game.physics_slot is None
+    assert replay.diverged() == []
+    assert replay.replayed().scores == Recording.parse(data).scores
+
+
+def test_replay_with_another_seed_diverges(emitter):
+    _, data = record_game()
+    recorded = Recording.parse(data)
+    recorded.seed += 1
+    replay = GameReplay(recorded, game_id='replay')
+    run(replay.run())
+    assert replay.diverged()
+
+
+def test_replay_game_streams_the_recording(emitter, tmp_path, monkeypatch):
+    monkeypatch.setattr(recording, 'RECORDINGS_DIR', str(tmp_path))
+    _, data = record_game(ticks=600)
+    (tmp_path / 'game_5_1.rec').write_bytes(data)
+
+    async def scenario():
+        await server.replay_game('sid9', {'game_id': 5, 'speed': 16})
+        await server.sid_to_replay['sid9']
+
+    run(scenario())
+    start, = emitter.events('replay_start')
+    end, = emitter.events('replay_end')
+    assert start['gameId'] == 5 and start['replayId'] == 'replay_sid9'
+    assert emitter.events('send_game_state')
+    assert 'sid9' not in server.sid_to_replay
+    server.sid_to_protocol.pop('sid9', None)
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import httpx
+import result_writer
+from result_writer import ResultWriter, game_result
+from tests.conftest import run
+
+
+def make_writer(handler, spool_path=None, **kwargs):
+    async def async_handler(request):
+        return await handler(request)
+    return ResultWriter(base_url='http://game-history', spool_path=spool_path, flush_delay=0.01,
+                        transport=httpx.MockTransport(async_handler), **kwargs)
+
+
+def make_result(game_id):
+    return game_result({'game_id': game_id, 'winner': 1, 'player1_score': 5, 'player2_score': 3,
+                        'player1_hits': 12, 'player2_hits': 9, 'longest_rally': 7})
+
+
+async def wait_until_saved(writer, count):
+    for _ in range(500):
+        if writer.saved >= count:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_results_are_saved_in_batches():
+    requests = []
+
+    async def handler(request):
+        requests.append(json.loads(request.content)['results'])
+        return httpx.Response(200, json={'saved': len(requests[-1])})
+
+    writer = make_writer(handler, batch_size=4)
+
+    async def scenario():
+        for game_id in range(10):
+            writer.submit(make_result(game_id))
+        await wait_until_saved(writer, 10)
+        await writer.close()
+
+    run(scenario())
+    assert [len(batch) for batch in requests] == [4, 4, 2]
+    assert [result['game_id'] for batch in requests for result in batch] == list(range(10))
+    assert requests[0][0]['winner_id'] == 1 and requests[0][0]['player2_hits'] == 9
+    assert writer.stats() == {'pending': 0, 'saved': 10, 'failed_requests': 0, 'rejected': 0,
+                              'dropped': 0}
+
+
+def test_failed_requests_are_spooled_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_writer, 'RESULT_RETRY_MIN', 0.01)
+    spool_path = str(tmp_path / 'results.spool')
+    responses = [503]
+    spooled = []
+
+    async def handler(request):
+        spooled.append(os.path.exists(spool_path))
+        status = responses.pop(0) if responses else 200
+        return httpx.Response(status)
+
+    writer = make_writer(handler, spool_path=spool_path)
+
+    async def scenario():
+        writer.submit(make_result(1))
+        await wait_until_saved(writer, 1)
+        await writer.close()
+
+    run(scenario())
+    assert spooled == [False, True]
+    assert writer.saved == 1 and writer.failed_requests == 1
+    assert not os.path.exists(spool_path)
+
+
+def test_spooled_results_are_saved_on_start(tmp_path):
+    spool_path = tmp_path / 'results.spool'
+    spool_path.write_text(json.dumps(make_result(1)) + '\n' + 'not json\n'
+                          + json.dumps(make_result(2)) + '\n')
+    requests = []
+
+    async def handler(request):
+        requests.append(json.loads(request.content)['results'])
+        return httpx.Response(200)
+
+    writer = make_writer(handler, spool_path=str(spool_path))
+
+    async def scenario():
+        await writer.start()
+        writer.submit(make_result(3))
+        await wait_until_saved(writer, 3)
+        await writer.close()
+
+    run(scenario())
+    assert [result['game_id'] for batch in requests for result in batch] == [1, 2, 3]
+    assert not spool_path.exists()
+
+
+def test_rejected_results_are_not_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={'error': 'invalid result'})
+
+    writer = make_writer(handler)
+
+    async def scenario():
+        writer.submit(make_result(1))
+        for _ in range(100):
+            if writer.rejected:
+                break
+            await asyncio.sleep(0.01)
+        await writer.close()
+
+    run(scenario())
+    assert len(calls) == 1
+    assert writer.stats()['rejected'] == 1 and writer.stats()['pending'] == 0
+
+
+def test_disabled_writer_ignores_results():
+    writer = ResultWriter(base_url=None, spool_path=None)
+    writer.submit(make_result(1))
+    assert not writer.enabled and writer.stats()['pending'] == 0
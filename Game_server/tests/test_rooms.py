@@ -0,0 +1,24 @@
+from server import PongGame, game_room, state_room
+from protocol import PROTOCOL_JSON
+from tests.conftest import run
+
+
+def test_players_join_and_leave_game_room(emitter):
+    game = PongGame(7, 1, 2, True)
+
+    async def scenario():
+        await game.add_player('a', 1)
+        await game.add_player('b', 2)
+        assert emitter.rooms[game_room(7)] == {'a', 'b'}
+        await game.remove_player('a')
+        assert emitter.rooms[game_room(7)] == {'b'}
+
+    run(scenario())
+
+
+def test_state_is_emitted_once_per_frame(game, emitter):
+    run(game.add_player('sid2', 22))
+    run(game.send_game_state_to_client())
+    frames = [entry for entry in emitter.emitted if entry[0] == 'send_game_state']
+    assert len(frames) == 1
+    assert frames[0][2] == state_room(game.game_id, PROTOCOL_JSON)
@@ -0,0 +1,126 @@
+import asyncio
+from engineio import packet as eio_packet
+from socketio import packet
+import send_queue
+from send_queue import SendQueues, packet_event
+from tests.conftest import run
+
+
+# FakeSocket class
+# Stands in for an Engine.IO socket: its queue is what the Engine.IO writer would send
+class FakeSocket:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    # deliver method
+    # Takes every queued packet like the Engine.IO writer does, returns their data
+    def deliver(self):
+        delivered = []
+        while not self.queue.empty():
+            delivered.append(self.queue.get_nowait().data)
+            self.queue.task_done()
+        return delivered
+
+
+def make_queues(max_size=4):
+    sockets = {'eio1': FakeSocket()}
+
+    async def send_packet(eio_sid, pkt):
+        sockets[eio_sid].queue.put_nowait(pkt)
+    return SendQueues(sockets, send_packet, max_size), sockets['eio1']
+
+
+# encode function
+# Returns the Engine.IO packets of a Socket.IO event, like the server's emit builds them
+def encode(event, data):
+    encoded = packet.Packet(packet.EVENT, namespace='/', data=[event, data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return [eio_packet.Packet(eio_packet.MESSAGE, data) for data in encoded]
+
+
+async def emit(queues, event, data):
+    for pkt in encode(event, data):
+        await queues.send('eio1', pkt)
+
+
+def test_packet_event():
+    assert packet_event('2["score",{"a":1}]') == ('score', 0)
+    binary_frame = '51-["send_game_state_v2",{"_placeholder":true,"num":0}]'
+    assert packet_event(binary_frame) == ('send_game_state_v2', 1)
+    assert packet_event('0{"sid":"x"}') == (None, 0)
+    assert packet_event(b'binary') == (None, 0)
+
+
+def test_healthy_connections_are_not_queued():
+    queues, socket = make_queues()
+
+    async def scenario():
+        for tick in range(10):
+            await emit(queues, 'send_game_state', {'tick': tick})
+            assert len(socket.deliver()) == 1
+
+    run(scenario())
+    assert queues.queues == {} and queues.writers == {}
+    assert queues.stats()['dropped'] == 0
+
+
+def test_slow_connections_drop_stale_frames_but_keep_events():
+    queues, socket = make_queues(max_size=4)
+
+    async def scenario():
+        # the writer of the socket is busy with it
+        await emit(queues, 'send_game_state', {'tick': 0})
+        await emit(queues, 'score', {'player1Score': 1})
+        for tick in range(1, 10):
+            await emit(queues, 'send_game_state', {'tick': tick})
+        await emit(queues, 'game_over', {'winner': 1})
+        assert queues.depths() == {'eio1': 4}
+        delivered = []
+        for _ in range(20):
+            delivered += socket.deliver()
+            await asyncio.sleep(0)
+        return delivered
+
+    delivered = run(scenario())
+    assert [data.split(',')[0] for data in delivered] == [
+        '2["send_game_state"', '2["score"', '2["send_game_state"', '2["send_game_state"',
+        '2["game_over"']
+    assert '{"tick":8}' in delivered[2] and '{"tick":9}' in delivered[3]
+    assert queues.drops() == {'eio1': 7}
+    assert queues.dropped_events == {'send_game_state': 7}
+    assert queues.queues == {} and queues.writers == {}
+
+
+def test_binary_frames_keep_their_attachments():
+    queues, socket = make_queues(max_size=2)
+
+    async def scenario():
+        for tick in range(4):
+            await emit(queues, 'send_game_state_v2', bytes([tick]))
+        delivered = []
+        for _ in range(20):
+            delivered += socket.deliver()
+            await asyncio.sleep(0)
+        return delivered
+
+    delivered = run(scenario())
+    # the first frame went out at once, the second was dropped with its attachment
+    assert [data for data in delivered if isinstance(data, bytes)] == [b'\x00', b'\x02', b'\x03']
+    assert sum(1 for data in delivered if isinstance(data, str)) == 3
+
+
+def test_closed_connections_are_forgotten(monkeypatch):
+    monkeypatch.setattr(send_queue, 'SEND_QUEUE_CHECK_INTERVAL', 0.01)
+    queues, socket = make_queues(max_size=1)
+
+    async def scenario():
+        for tick in range(3):
+            await emit(queues, 'send_game_state', {'tick': tick})
+        assert queues.drops() == {'eio1': 1}
+        del queues.sockets['eio1']
+        await asyncio.sleep(0.05)
+
+    run(scenario())
+    assert queues.queues == {} and queues.writers == {} and queues.dropped == {}
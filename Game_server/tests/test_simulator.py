@@ -0,0 +1,36 @@
+import random
+import server
+import server_utils
+from game_logic.game_defaults import PADDLE_SPEED
+from simulator import BotPlayer, simulate
+
+
+def test_simulate_reports_every_tick():
+    report = simulate(3, ticks=200, bot='random', allocation_ticks=10)
+    assert report['scheduler_ticks'] == 200
+    assert report['game_ticks'] == 600
+    assert report['tick_p50_ms'] <= report['tick_p99_ms'] <= report['tick_max_ms']
+    assert report['memory_per_game'] > 0
+    assert report['bytes_per_game_tick'] >= 0
+    assert 0 < report['frames_per_game_second'] <= server.TICK_RATE
+
+
+def test_simulate_restores_the_socketio_server():
+    sio = server.sio
+    simulate(1, ticks=10, protocol=2, allocation_ticks=0)
+    assert server.sio is sio
+    assert server_utils.sio is sio
+    assert not server.sid_to_protocol
+
+
+def test_idle_games_start_over_when_finished():
+    report = simulate(1, ticks=6000, bot='idle', allocation_ticks=0)
+    assert report['games_played'] >= 1
+
+
+def test_tracking_bot_moves_towards_the_ball():
+    game = server.PongGame(1, 11, 22, False)
+    game.game_state.ball._position._z = game.game_state.player1.paddle.z + 50
+    bot = BotPlayer(11, 'tracking', random.Random(0))
+    bot.input_chance = 1.0
+    assert bot.next_input(game.game_state) == PADDLE_SPEED
@@ -0,0 +1,128 @@
+import pytest
+import socketio
+import server
+from server import (PHASE_RALLY, SPECTATOR_EVERY, state_room, spectator_room, active_games,
+                    sid_to_spectated)
+from fan_out import FanOutManager
+from protocol import PROTOCOL_JSON, PROTOCOL_DELTA
+from tests.conftest import run
+
+
+# watched fixture
+# Registers the game fixture as an active game, so spectate_game finds it,
+# and forgets the spectator sessions of the test
+@pytest.fixture
+def watched(game, monkeypatch):
+    monkeypatch.setitem(active_games, game.game_id, game)
+    yield game
+    for sid in ('spec1', 'spec2'):
+        server.sid_to_protocol.pop(sid, None)
+        server.sid_to_features.pop(sid, None)
+        sid_to_spectated.pop(sid, None)
+
+
+def frames_to(emitter, event, room):
+    return [data for name, data, rooms in emitter.emitted
+            if name == event and (rooms == room or (isinstance(rooms, list) and room in rooms))]
+
+
+def test_spectators_share_the_player_frames_at_their_rate(watched, emitter):
+    game = watched
+
+    async def scenario():
+        await server.spectate_game('spec1', {'game_id': game.game_id})
+        await server.spectate_game('spec2', {'game_id': game.game_id})
+        assert emitter.events('spectate_start')[0]['player1Id'] == 11
+        game.start_rally()
+        while game.phase != PHASE_RALLY:
+            await game.tick()
+        del emitter.emitted[:]
+        for _ in range(SPECTATOR_EVERY * 4):
+            await game.tick()
+            game.game_state.bounce = False
+
+    run(scenario())
+    assert emitter.rooms[spectator_room(game.game_id, PROTOCOL_JSON)] == {'spec1', 'spec2'}
+    players = frames_to(emitter, 'send_game_state', state_room(game.game_id, PROTOCOL_JSON))
+    spectators = frames_to(emitter, 'send_game_state', spectator_room(game.game_id, PROTOCOL_JSON))
+    assert len(spectators) < len(players)
+    assert all(frame['tick'] % SPECTATOR_EVERY == 0 or frame['bounce'] for frame in spectators)
+    # a spectator frame is the player frame of the tick, emitted once to both rooms
+    assert len(emitter.events('send_game_state')) == len(players)
+
+
+def test_delta_spectators_get_their_own_stream(watched, emitter):
+    game = watched
+
+    async def scenario():
+        await server.spectate_game('spec1', {'game_id': game.game_id, 'protocol': PROTOCOL_DELTA})
+        game.game_state.paused = False
+        for _ in range(SPECTATOR_EVERY * 2):
+            game.tick_number += 1
+            await game.send_game_state_to_client()
+
+    run(scenario())
+    deltas = frames_to(emitter, 'state_delta', spectator_room(game.game_id, PROTOCOL_DELTA))
+    assert len(deltas) == 2
+    assert deltas[0]['k'] == 1 and deltas[1]['s'] == deltas[0]['s'] + 1
+
+
+def test_spectators_get_scores_and_leave(watched, emitter):
+    game = watched
+
+    async def scenario():
+        await server.spectate_game('spec1', {'game_id': game.game_id})
+        await game.send_score()
+        assert sid_to_spectated['spec1'] == game.game_id
+        await server.disconnect('spec1')
+
+    run(scenario())
+    assert emitter.emitted[-1][0] == 'score' and 'spec1' not in emitter.rooms[game.room]
+    assert game.spectator_count() == 0 and 'spec1' not in sid_to_spectated
+    assert game.sids == ['sid1']
+
+
+def test_unknown_games_and_players_cannot_be_spectated(watched, emitter):
+    game = watched
+    run(server.spectate_game('spec1', {'game_id': 404}))
+    run(server.spectate_game('sid1', {'game_id': game.game_id}))
+    assert len(emitter.events('error')) == 2
+    assert game.spectator_count() == 0
+
+
+def test_fan_out_sends_one_encoded_packet_to_every_session():
+    async def scenario():
+        sio = socketio.AsyncServer(async_mode='asgi', client_manager=FanOutManager())
+        sent = []
+
+        async def send_packet(eio_sid, pkt):
+            sent.append((eio_sid, pkt))
+        sio.eio.send_packet = send_packet
+        for index in range(3):
+            sid = await sio.manager.connect(f'eio{index}', '/')
+            await sio.enter_room(sid, 'players' if index == 0 else 'spectators')
+        await sio.emit('send_game_state_v2', b'\x01\x02', room=['players', 'spectators'])
+        return sent
+
+    sent = run(scenario())
+    assert sorted(eio_sid for eio_sid, pkt in sent) == [
+        'eio0', 'eio0', 'eio1', 'eio1', 'eio2', 'eio2']
+    headers = {id(pkt) for eio_sid, pkt in sent if isinstance(pkt.data, str)}
+    assert len(headers) == 1
+
+
+def test_delta_spectators_can_request_a_keyframe(watched, emitter):
+    game = watched
+
+    async def scenario():
+        await server.spectate_game('spec1', {'game_id': game.game_id, 'protocol': PROTOCOL_DELTA})
+        game.game_state.paused = False
+        for _ in range(SPECTATOR_EVERY * 2):
+            game.tick_number += 1
+            await game.send_game_state_to_client()
+        await server.request_keyframe('spec1', {'game_id': game.game_id})
+
+    run(scenario())
+    event, frame, room = emitter.emitted[-1]
+    assert event == 'state_delta' and room == 'spec1'
+    assert frame['k'] is True and frame['s'] == game.spectator_delta_encoder.seq
@@ -0,0 +1,116 @@
+import math
+import server
+from server import PHASE_RALLY, SERVE_DELAY_TICKS
+from game_logic.batch_physics import BatchPhysics
+from game_logic.entities.ball import Ball
+from game_logic.entities.player import Player
+from game_logic.entities.gamestate import GameState
+from game_logic.game_defaults import *
+from tests.conftest import run
+
+MAX_SPEED = 120.0   # units per physics frame, well above what a rally reaches
+
+
+def make_state(x, z, speed, direction):
+    ball = Ball(x, z, BALL_RADIUS, speed, direction)
+    return GameState(1, Player(1, PLAYER1_START_X), Player(2, PLAYER2_START_X), ball)
+
+
+# aimed_states function
+# Balls heading to player 1's paddle, each crossing the paddle plane at a known offset from its
+# center
+def aimed_states(speed):
+    for direction in range(135, 226, 5):
+        for offset in range(-48, 49, 8):
+            state = make_state(0, 0, speed, direction)
+            ball = state.ball
+            frames = (FIELD_DEPTH / 2 - BALL_RADIUS) / -ball.delta_x
+            z = PLAYER_START_Z + offset - ball.delta_z * frames
+            if BALL_RADIUS < z < FIELD_WIDTH - BALL_RADIUS:
+                ball.position = FIELD_DEPTH / 2, 0, z
+                yield state, offset
+
+
+def test_fast_ball_never_tunnels_through_paddle():
+    for dt in (1.0, 2.0, 4.0):
+        cases = 0
+        for state, offset in aimed_states(MAX_SPEED):
+            while not state.bounce and not state.check_goal():
+                state.advance(dt)
+            assert state.bounce, (dt, state.ball.direction, offset)
+            assert state.player1.hits == 1
+            assert math.isclose(state.hitpos, abs(offset) / (PADDLE_WIDTH / 2), abs_tol=1e-9)
+            cases += 1
+        assert cases > 100
+
+
+def test_discrete_check_misses_fast_balls():
+    missed = 0
+    for state, offset in aimed_states(MAX_SPEED):
+        while not state.bounce and not state.check_goal():
+            state.ball.update_position()
+            state.handle_collisions()
+        missed += not state.bounce
+    assert missed > 0
+
+
+def test_trajectory_does_not_depend_on_tick_rate():
+    slow = make_state(FIELD_DEPTH / 2, 120, 12, 160)
+    fast = make_state(FIELD_DEPTH / 2, 120, 12, 160)
+    for frame in range(0, 600, 2):
+        for state in (slow, fast):
+            for player in (state.player1, state.player2):
+                player.paddle.position.z = min(FIELD_WIDTH - PADDLE_WIDTH / 2,
+                                               max(PADDLE_WIDTH / 2, state.ball.z))
+        slow.advance(2.0)
+        fast.advance(1.0)
+        fast.advance(1.0)
+        assert math.isclose(slow.ball.x, fast.ball.x, abs_tol=1e-6)
+        assert math.isclose(slow.ball.z, fast.ball.z, abs_tol=1e-6)
+    assert slow.player1.hits + slow.player2.hits > 3
+    assert (slow.player1.hits, slow.player2.hits) == (fast.player1.hits, fast.player2.hits)
+
+
+def test_state_is_broadcast_at_broadcast_rate(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'BROADCAST_EVERY', 3)
+    game.start_rally()
+    for _ in range(SERVE_DELAY_TICKS):
+        run(game.tick())
+    assert game.phase == PHASE_RALLY
+    emitter.emitted.clear()
+    for _ in range(12):
+        run(game.tick())
+    assert len(emitter.events('send_game_state')) == 4
+
+
+# ball_speed_per_second function
+# Plays a straight rally for a quarter of a second and returns the units per second the ball moved
+def ball_speed_per_second(game, tick_rate):
+    game.start_rally()
+    for _ in range(SERVE_DELAY_TICKS):
+        run(game.tick())
+    assert game.phase == PHASE_RALLY
+    game.game_state.ball.set_motion(BALL_SPEED, 180)
+    if game.physics_slot is not None:
+        server.physics_engine.load(game.physics_slot, game.game_state)
+    start_x = game.game_state.ball.x
+    for _ in range(tick_rate // 4):
+        run(game.tick())
+        if server.physics_engine is not None:
+            run(server.run_batch_physics())
+    return (start_x - game.game_state.ball.x) * 4
+
+
+def test_ball_speed_does_not_depend_on_tick_rate(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'TICK_RATE', 120)
+    monkeypatch.setattr(server, 'TICK_STEP', PHYSICS_RATE / 120)
+    assert not server.SWEPT_COLLISIONS
+    assert math.isclose(ball_speed_per_second(game, 120), BALL_SPEED * PHYSICS_RATE)
+
+
+def test_batch_ball_speed_does_not_depend_on_tick_rate(game, emitter, monkeypatch):
+    monkeypatch.setattr(server, 'TICK_RATE', 120)
+    monkeypatch.setattr(server, 'TICK_STEP', PHYSICS_RATE / 120)
+    monkeypatch.setattr(server, 'physics_engine', BatchPhysics())
+    assert math.isclose(ball_speed_per_second(game, 120), BALL_SPEED * PHYSICS_RATE)
+    assert game.physics_slot is not None
@@ -0,0 +1,176 @@
+import asyncio
+import tick_scheduler
+from tick_scheduler import TickScheduler
+from server import PongGame, PHASE_SERVE, PHASE_RALLY, PHASE_POST_RALLY, SERVE_DELAY_TICKS
+from tests.conftest import run
+
+
+INTERVAL = 1 / 64     # a power of two, so the deadlines add up without rounding errors
+
+
+# FakeClock class
+# Monotonic clock and sleep of a scheduler, time only moves when the scheduler sleeps or a game
+# stalls. sleep() yields to the test first, which then sees the clock after the last tick
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        await asyncio.sleep(0)
+        self.now += delay
+
+
+class CountingGame:
+    def __init__(self, clock=None, block_on_tick=None, block_for=0):
+        self.ticks = 0
+        self.clock = clock
+        self.block_on_tick = block_on_tick
+        self.block_for = block_for
+
+    async def tick(self):
+        self.ticks += 1
+        if self.ticks == self.block_on_tick:
+            self.clock.now += self.block_for * INTERVAL  # simulate a stalled event loop
+
+
+def new_scheduler(clock, max_catch_up=5):
+    return TickScheduler(interval=INTERVAL, max_catch_up=max_catch_up, clock=clock.time,
+                         sleep=clock.sleep)
+
+
+# run_scheduler function
+# Runs the games on the scheduler until the clock reached the deadline of tick 'ticks'
+async def run_scheduler(scheduler, clock, games, ticks):
+    for game_id, game in enumerate(games):
+        scheduler.register(game_id, game)
+    task = scheduler._task
+    while clock.now < ticks * INTERVAL:
+        await asyncio.sleep(0)
+    for game_id in range(len(games)):
+        scheduler.unregister(game_id)
+    await task
+
+
+def test_all_games_share_one_tick():
+    clock = FakeClock()
+    scheduler = new_scheduler(clock)
+    games = [CountingGame() for _ in range(20)]
+    run(run_scheduler(scheduler, clock, games, 30))
+    assert [game.ticks for game in games] == [30] * 20
+    assert scheduler.tick_count == 30 and scheduler.max_lateness == 0.0
+    assert scheduler._task is None
+
+
+def test_fixed_timestep_catches_up_after_stall():
+    clock = FakeClock()
+    scheduler = new_scheduler(clock, max_catch_up=10)
+    game = CountingGame(clock, block_on_tick=3, block_for=3)
+    run(run_scheduler(scheduler, clock, [game], 30))
+    # the stalled ticks are replayed back to back, so the total count stays on schedule
+    assert game.ticks == 30
+    assert scheduler.max_lateness == 2 * INTERVAL
+    assert scheduler.late_ticks == 1
+    assert scheduler.dropped_ticks == 0
+
+
+def test_ticks_beyond_catch_up_limit_are_dropped():
+    clock = FakeClock()
+    scheduler = new_scheduler(clock, max_catch_up=2)
+    game = CountingGame(clock, block_on_tick=3, block_for=10)
+    run(run_scheduler(scheduler, clock, [game], 30))
+    # tick 3 ends at 13 intervals, tick 4 is caught up in the same step, 5 to 13 are dropped
+    assert scheduler.dropped_ticks == 9
+    assert game.ticks == 30 - 9
+    assert scheduler.stats()['dropped_ticks'] == scheduler.dropped_ticks
+
+
+def test_tick_times_follow_the_deadlines_after_a_stall(monkeypatch):
+    clock = FakeClock()
+    scheduler = new_scheduler(clock, max_catch_up=10)
+    monkeypatch.setattr(tick_scheduler, 'server_time', lambda: clock.now * 1000.0)
+    times = []
+
+    class TimedGame(CountingGame):
+        async def tick(self):
+            times.append(scheduler.tick_time)
+            await super().tick()
+
+    game = TimedGame(clock, block_on_tick=3, block_for=3)
+    run(run_scheduler(scheduler, clock, [game], 20))
+    # the ticks replayed after the stall are stamped with their own deadlines
+    assert times == [tick * INTERVAL * 1000.0 for tick in range(1, 21)]
+    assert scheduler.tick_time is None
+
+
+def test_failing_game_is_unregistered():
+    class BrokenGame:
+        async def tick(self):
+            raise RuntimeError("boom")
+
+    clock = FakeClock()
+    scheduler = new_scheduler(clock)
+    healthy = CountingGame()
+
+    async def scenario():
+        scheduler.register('broken', BrokenGame())
+        scheduler.register('healthy', healthy)
+        task = scheduler._task
+        while clock.now < 5 * INTERVAL:
+            await asyncio.sleep(0)
+        assert 'broken' not in scheduler.games
+        scheduler.unregister('healthy')
+        await task
+
+    run(scenario())
+    assert healthy.ticks == 5
+
+
+def test_pong_game_phases(game, emitter):
+    async def scenario():
+        game.loop_done = asyncio.get_running_loop().create_future()
+        game.start_rally()
+        assert game.phase == PHASE_SERVE
+        for _ in range(SERVE_DELAY_TICKS):
+            await game.tick()
+        assert game.phase == PHASE_RALLY
+        assert game.game_state.paused is False
+        # only the serve frame was sent while waiting
+        assert len(emitter.events('send_game_state')) == 1
+        while game.phase == PHASE_RALLY:
+            await game.tick()
+        assert game.phase == PHASE_POST_RALLY
+        assert len(emitter.events('score')) == 1
+
+    run(scenario())
+
+
+def test_game_unregistered_during_a_step_is_not_ticked():
+    scheduler = TickScheduler()
+    victim = CountingGame()
+
+    class UnregisteringGame(CountingGame):
+        async def tick(self):
+            await super().tick()
+            scheduler.unregister(1)
+
+    scheduler.games = {0: UnregisteringGame(), 1: victim}
+    run(scheduler.step())
+    assert victim.ticks == 0
+
+
+def test_end_game_after_cancel_game(emitter):
+    game = PongGame(1, 11, 22, True)
+    run(game.add_player('sid1', 11))
+
+    async def cancel_and_end():
+        game.game_loop_task = asyncio.create_task(game.game_loop())
+        await asyncio.sleep(0)
+        await asyncio.gather(game.cancel_game(), game.end_game())
+
+    run(cancel_and_end())
+    assert game.game_state is None
+    assert emitter.events('cancel_game')
+    assert not emitter.events('game_over')
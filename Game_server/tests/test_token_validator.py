@@ -0,0 +1,141 @@
+import asyncio
+import httpx
+import server_utils
+from token_validator import TokenValidator
+from tests.conftest import run
+
+
+def make_validator(handler, **kwargs):
+    async def async_handler(request):
+        return await handler(request)
+    return TokenValidator(base_url='http://token-service',
+                          transport=httpx.MockTransport(async_handler), **kwargs)
+
+
+async def valid_response(request):
+    return httpx.Response(200, json={'access': 'ok'})
+
+
+async def invalid_response(request):
+    return httpx.Response(401, json={'error': 'Invalid token'})
+
+
+def test_positive_validations_are_cached():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return await valid_response(request)
+
+    validator = make_validator(handler)
+
+    async def scenario():
+        assert await validator.validate(1, 'token') is True
+        assert await validator.validate(1, 'token') is True
+        assert await validator.validate(2, 'token') is True
+        await validator.close()
+
+    run(scenario())
+    assert len(calls) == 2
+    stats = validator.stats()
+    assert stats['cache_hits'] == 1 and stats['cache_misses'] == 2
+    assert stats['requests'] == 2
+
+
+def test_invalid_tokens_are_not_cached():
+    validator = make_validator(invalid_response)
+
+    async def scenario():
+        assert await validator.validate(1, 'bad') is False
+        assert await validator.validate(1, 'bad') is False
+        assert await validator.validate(1, None) is False
+        await validator.close()
+
+    run(scenario())
+    assert validator.stats()['requests'] == 2
+    assert validator.cache == {}
+
+
+def test_cache_entries_expire():
+    validator = make_validator(valid_response, ttl=0.0)
+
+    async def scenario():
+        await validator.validate(1, 'token')
+        await validator.validate(1, 'token')
+        await validator.close()
+
+    run(scenario())
+    assert validator.hits == 0 and validator.latency_count == 2
+
+
+def test_concurrent_validations_share_one_request():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return await valid_response(request)
+
+    validator = make_validator(handler)
+
+    async def scenario():
+        results = await asyncio.gather(*(validator.validate(1, 'token') for _ in range(10)))
+        await validator.close()
+        return results
+
+    assert run(scenario()) == [True] * 10
+    assert len(calls) == 1
+
+
+def test_slow_token_service_does_not_block_the_loop():
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return await valid_response(request)
+
+    validator = make_validator(handler)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        task = asyncio.create_task(ticker())
+        valid = await validator.validate(1, 'token')
+        task.cancel()
+        await validator.close()
+        return valid
+
+    assert run(scenario()) is True
+    assert len(ticks) >= 10
+
+
+def test_timeouts_count_as_invalid():
+    async def handler(request):
+        raise httpx.ReadTimeout('timed out', request=request)
+
+    validator = make_validator(handler)
+
+    async def scenario():
+        valid = await validator.validate(1, 'token')
+        await validator.close()
+        return valid
+
+    assert run(scenario()) is False
+    assert validator.errors == 1
+
+
+def test_shutdown_closes_the_pooled_client(monkeypatch):
+    validator = make_validator(valid_response)
+    monkeypatch.setattr(server_utils, 'token_validator', validator)
+    monkeypatch.setattr(server_utils, 'shutdown_callbacks', [])
+
+    async def scenario():
+        await validator.validate(1, 'token')
+        client = validator.client
+        await server_utils.stop_background_tasks()
+        return client
+
+    assert run(scenario()).is_closed
+    assert validator._client is None
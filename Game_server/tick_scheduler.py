@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import time
+
+TICK_RATE = int(os.environ.get('TICK_RATE', 60))    # simulation ticks per second
+TICK_INTERVAL = 1.0 / TICK_RATE
+MAX_CATCH_UP_TICKS = 5          # max ticks stepped back to back when running behind
+LATENESS_WARNING = 0.050        # log a warning when a tick is this late (seconds)
+
+
+# server_time function
+# The clock of the timestamps sent to clients: Unix time in milliseconds
+# Wall clock time, so game workers and cluster nodes stamp their frames on the same clock
+# as the process answering the clients' clock_ping
+def server_time() -> float:
+    return time.time() * 1000.0
+
+
+# TickScheduler class
+# Drives every registered game on one shared fixed-timestep clock
+# Instead of each game sleeping in its own loop, games register with the scheduler
+# and get their tick() coroutine called once per simulation step
+# Deadlines are absolute (start + n * interval), so time spent on work and emits
+# does not add up over time and the tick rate stays at TICK_RATE
+# When the loop falls behind, up to MAX_CATCH_UP_TICKS steps are run back to back,
+# anything beyond that is dropped and the clock is re-anchored
+# Properties:
+#   - interval: length of one tick in seconds
+#   - games: the registered games, stepped in registration order
+#   - tick_count: number of ticks stepped since the scheduler was created
+#   - tick_time: server time (ms) of the deadline of the tick being stepped, None outside of a step
+#   - last_lateness: how far the last tick ran behind its deadline (seconds)
+#   - max_lateness: worst lateness seen so far (seconds)
+#   - late_ticks: number of ticks that started after their deadline + one interval
+#   - dropped_ticks: number of ticks skipped because catch-up limit was reached
+#   - clock / sleep: the monotonic clock (seconds) and the sleep coroutine function the loop runs
+#     on, the event loop's by default, tests pass fake ones
+class TickScheduler:
+    def __init__(self, interval: float = TICK_INTERVAL, max_catch_up: int = MAX_CATCH_UP_TICKS,
+                 clock=None, sleep=asyncio.sleep):
+        self.interval = interval
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+        self.games = {}
+        self.tick_count = 0
+        self.tick_time = None
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.late_ticks = 0
+        self.dropped_ticks = 0
+        self.tick_listeners = []
+        self.step_hooks = []
+        self._task = None
+        self._next_deadline = None
+
+    # register method
+    # Adds a game to the shared tick and starts the scheduler loop if needed
+    # The game must provide an async tick() method
+    def register(self, game_id, game) -> None:
+        self.games[game_id] = game
+        if self._task is None or self._task.done():
+            self._next_deadline = None
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # unregister method
+    # Removes a game from the shared tick, the loop stops by itself once no games are left
+    def unregister(self, game_id) -> None:
+        self.games.pop(game_id, None)
+
+    # add_tick_listener method
+    # Registers a callback called after every tick as listener(duration, lateness)
+    def add_tick_listener(self, listener) -> None:
+        self.tick_listeners.append(listener)
+
+    # add_step_hook method
+    # Registers a coroutine function awaited once per tick, after every game has ticked
+    # Used to advance work the games queued during their tick in one batch
+    def add_step_hook(self, hook) -> None:
+        self.step_hooks.append(hook)
+
+    # stats method
+    # Returns the scheduler timing counters as a dictionary
+    def stats(self) -> dict:
+        return {
+            'games': len(self.games),
+            'ticks': self.tick_count,
+            'last_lateness': self.last_lateness,
+            'max_lateness': self.max_lateness,
+            'avg_lateness': self.total_lateness / self.tick_count if self.tick_count else 0.0,
+            'late_ticks': self.late_ticks,
+            'dropped_ticks': self.dropped_ticks,
+        }
+
+    # step method
+    # Runs one tick for every registered game
+    # A game unregistered by an earlier tick or event handler of the same step is skipped
+    # A failing game is logged and unregistered so it can't stall the others
+    # tick_time: server time of the tick's deadline, the current time when not given
+    async def step(self, tick_time: float = None) -> None:
+        self.tick_time = tick_time if tick_time is not None else server_time()
+        try:
+            await self._step_games()
+        finally:
+            self.tick_time = None
+        self.tick_count += 1
+
+    # _step_games method
+    # Ticks every game, then runs the step hooks
+    async def _step_games(self) -> None:
+        for game_id, game in list(self.games.items()):
+            if self.games.get(game_id) is not game:
+                continue
+            try:
+                await game.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Tick failed for game {game_id}: {e}")
+                self.unregister(game_id)
+        for hook in self.step_hooks:
+            try:
+                await hook()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Step hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    # _record_lateness method
+    # Updates the lateness counters with how late the current tick started
+    def _record_lateness(self, lateness: float) -> None:
+        self.last_lateness = lateness
+        self.total_lateness += lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        if lateness > self.interval:
+            self.late_ticks += 1
+            if lateness > LATENESS_WARNING:
+                logging.warning(
+                    f"Tick {self.tick_count} is running {lateness * 1000:.1f} ms behind")
+
+    # _run method
+    # The scheduler loop
+    # Sleeps until the next deadline, then steps all games for every tick that is due
+    async def _run(self) -> None:
+        clock = self.clock or asyncio.get_running_loop().time
+        self._next_deadline = clock() + self.interval
+        while self.games:
+            delay = self._next_deadline - clock()
+            if delay > 0:
+                await self.sleep(delay)
+            steps = 0
+            now = clock()
+            while now >= self._next_deadline and steps < self.max_catch_up and self.games:
+                lateness = now - self._next_deadline
+                self._record_lateness(lateness)
+                start = time.perf_counter()
+                await self.step(server_time() - lateness * 1000.0)
+                duration = time.perf_counter() - start
+                for listener in self.tick_listeners:
+                    listener(duration, lateness)
+                self._next_deadline += self.interval
+                steps += 1
+                now = clock()
+            if steps == self.max_catch_up and now >= self._next_deadline:
+                # too far behind to catch up, drop the missed ticks and re-anchor the clock
+                missed = int((now - self._next_deadline) / self.interval) + 1
+                self.dropped_ticks += missed
+                self._next_deadline += missed * self.interval
+        self._task = None
+
+
+# Shared scheduler used by all games of this server process
+scheduler = TickScheduler()
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import httpx
+
+TOKEN_SERVICE = os.environ.get('TOKEN_SERVICE')
+VALIDATE_TOKEN_PATH = '/auth/token/validate-token/'
+
+# seconds a positive validation is reused
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 30))
+# total timeout per request
+TOKEN_VALIDATION_TIMEOUT = float(os.environ.get('TOKEN_VALIDATION_TIMEOUT', 2.0))
+TOKEN_CONNECT_TIMEOUT = 1.0
+TOKEN_SERVICE_MAX_CONNECTIONS = 20
+TOKEN_CACHE_MAX_SIZE = 10000
+
+# TokenValidator class
+# Validates player access tokens against the token service without blocking the event loop
+# Requests go through one pooled httpx.AsyncClient with strict timeouts
+# Positive validations are cached for TOKEN_CACHE_TTL seconds, keyed by (player id, token hash),
+# and concurrent validations of the same token share a single request
+# Properties:
+#   - cache: (player id, token hash) -> expiry time of positive validations
+#   - hits / misses: cache hit and miss counters
+#   - errors: failed requests (timeouts, connection errors, invalid responses)
+#   - latency_count / latency_sum / latency_max: token service request latency in seconds
+class TokenValidator:
+    def __init__(self, base_url: str = TOKEN_SERVICE, ttl: float = TOKEN_CACHE_TTL,
+                 timeout: float = TOKEN_VALIDATION_TIMEOUT, transport=None):
+        self.base_url = base_url or ''
+        self.ttl = ttl
+        self.timeout = timeout
+        self.transport = transport
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_listeners = []
+        self._pending = {}
+        self._client = None
+
+    # client property
+    # The pooled HTTP client, created on first use so it belongs to the server's event loop
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout,
+                                      connect=min(TOKEN_CONNECT_TIMEOUT, self.timeout)),
+                limits=httpx.Limits(max_connections=TOKEN_SERVICE_MAX_CONNECTIONS,
+                                    max_keepalive_connections=TOKEN_SERVICE_MAX_CONNECTIONS),
+                transport=self.transport,
+            )
+        return self._client
+
+    # validate method
+    # Returns True if the token is valid for the given player
+    async def validate(self, player_id, token) -> bool:
+        if not token:
+            return False
+        key = (player_id, hashlib.sha256(str(token).encode()).hexdigest())
+        now = time.monotonic()
+        expiry = self.cache.get(key)
+        if expiry is not None:
+            if expiry > now:
+                self.hits += 1
+                return True
+            del self.cache[key]
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.ensure_future(self._request(player_id, token))
+        self._pending[key] = pending
+        try:
+            valid = await asyncio.shield(pending)
+        finally:
+            self._pending.pop(key, None)
+        if valid:
+            self._store(key, time.monotonic() + self.ttl)
+        return valid
+
+    # _request method
+    # Asks the token service to validate the token, any failure counts as invalid
+    async def _request(self, player_id, token) -> bool:
+        data = {"id": player_id, "access": token, "is_frontend": True}
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(VALIDATE_TOKEN_PATH, data=data)
+            response_data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.errors += 1
+            logging.error(f"Token validation for player {player_id} failed: {e!r}")
+            return False
+        finally:
+            self._record_latency(time.perf_counter() - start)
+        return isinstance(response_data, dict) and "error" not in response_data
+
+    # _store method
+    # Caches a positive validation, expired entries are pruned when the cache is full
+    def _store(self, key, expiry: float) -> None:
+        if len(self.cache) >= TOKEN_CACHE_MAX_SIZE:
+            now = time.monotonic()
+            self.cache = {k: v for k, v in self.cache.items() if v > now}
+            if len(self.cache) >= TOKEN_CACHE_MAX_SIZE:
+                self.cache.clear()
+        self.cache[key] = expiry
+
+    # _record_latency method
+    # Updates the latency counters and notifies the latency listeners
+    def _record_latency(self, latency: float) -> None:
+        self.latency_count += 1
+        self.latency_sum += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        for listener in self.latency_listeners:
+            listener(latency)
+
+    # stats method
+    # Returns cache and latency metrics as a dictionary
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_hit_rate': self.hits / lookups if lookups else 0.0,
+            'cache_size': len(self.cache),
+            'errors': self.errors,
+            'requests': self.latency_count,
+            'latency_avg': self.latency_sum / self.latency_count if self.latency_count else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+    # close method
+    # Closes the pooled HTTP client
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Shared validator used by the join_game handler
+token_validator = TokenValidator()